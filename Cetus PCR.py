@@ -1 +1,3 @@
-import interface
+from interface import main
+
+main()
@@ -6,6 +6,5 @@ void setup(){
 }
 
 void loop(){
-    recieveCommand();
-    splitData();
+    serialTasks();
 }
@@ -19,18 +19,87 @@ int arguments[10];
 
 bool isToPrintTemperature = false;
 
+// Conversões do sensor em segundo plano e envio periódico das leituras
+const byte sensorResolution = 10;
+unsigned int conversionTime = 0;
+unsigned long conversionStarted = 0;
+float sampleTemperature = 0;
+float lidTemperature = 0;
+unsigned int streamInterval = 0; // ms, 0 = desativado
+unsigned long lastPush = 0;
+
+// Controle PID no dispositivo. O laço em updateControl() é reproduzido
+// por onboard.OnboardController no aplicativo: altere os dois juntos.
+const byte maxSteps = 8;
+const unsigned long controlPeriod = 100; // ms
+const byte stateIdle = 0;
+const byte stateRunning = 1;
+const byte stateFinished = 2;
+const byte stateStopped = 3;
+float kp = 0;
+float ki = 0;
+float kd = 0;
+float tolerance = 0;
+unsigned int nCycles = 0;
+byte nSteps = 0;
+byte definedSteps = 0; // Um bit para cada passo recebido
+float stepTemperatures[maxSteps];
+unsigned int stepDurations[maxSteps];
+byte controlState = stateIdle;
+unsigned int currentCycle = 0;
+byte currentStep = 0;
+float stepElapsed = 0;
+float integral = 0;
+float lastInput = 0;
+bool hasLastInput = false;
+int controlOutput = 0;
+unsigned long lastControl = 0;
+
+// Protocolo binário (ver codec.py):
+// SYNC | LEN | CMD | DADOS | CRC16 (CCITT-FALSE, little-endian)
+const long baudRates[] = {9600, 19200, 38400, 57600, 115200};
+const byte syncByte = 0xA5;
+const byte maxPayload = 16;
+const byte cmdPeltier = 0x01;
+const byte cmdStream = 0x02;
+const byte cmdGains = 0x03;
+const byte cmdProfile = 0x04;
+const byte cmdStep = 0x05;
+const byte cmdRun = 0x06;
+const byte responseAck = 0x80;
+const byte responseStatus = 0x81;
+const byte responseReading = 0x82;
+const byte responseProgress = 0x83;
+const byte responseNak = 0x15;
+const byte flagTemperatures = 0x01;
+bool isBinary = false;
+long pendingBaudRate = 0;
+
 OneWire bus(sensorsPin);
 DallasTemperature temperatureSensor(&bus);
 
 void startup()
 {
     temperatureSensor.begin();
-    temperatureSensor.setResolution(10);
+    temperatureSensor.setResolution(sensorResolution);
+    // requestTemperatures() retorna imediatamente, a leitura é feita em
+    // updateTemperatures() quando a conversão termina.
+    temperatureSensor.setWaitForConversion(false);
+    conversionTime =
+        temperatureSensor.millisToWaitForConversion(sensorResolution);
+    temperatureSensor.requestTemperatures();
+    conversionStarted = millis();
     pinMode(peltierHeat, OUTPUT);
     pinMode(peltierCool, OUTPUT);
     Serial.println("Cetus is ready.");
 }
 
+void setStreamInterval(unsigned int interval)
+{
+    streamInterval = interval;
+    lastPush = millis() - interval;
+}
+
 void recieveCommand()
 {
     static byte index = 0;
@@ -43,12 +112,15 @@ void recieveCommand()
         {
             if (newChar != endMarker)
             {
-                receivedChars[index] = newChar;
-                index++;
+                if (index < cmdSize - 1)
+                {
+                    receivedChars[index] = newChar;
+                    index++;
+                }
             }
             else
             {
-                receivedChars[cmdSize - 1] = '\0';
+                receivedChars[index] = '\0';
                 isRecieving = false;
                 index = 0;
                 newData = true;
@@ -71,14 +143,18 @@ void splitData()
             arguments[x] = 0;
         }
         newCommand = strtok(receivedChars, splitMarker);
-        String commandTitle(newCommand);
+        commandTitle = newCommand;
+        if (commandTitle == NULL)
+        {
+            commandTitle = receivedChars;
+        }
         while (newCommand != '\0')
         {
             newCommand = strtok(NULL, splitMarker);
             arguments[idxArg] = atoi(newCommand);
             idxArg += 2;
         }
-        if (commandTitle == "peltier")
+        if (strcmp(commandTitle, "peltier") == 0)
         {
             // <peltier state pwm_signal>
             if (arguments[0] == 0)
@@ -87,11 +163,6 @@ void splitData()
                 Serial.println(arguments[2]);
                 analogWrite(peltierHeat, arguments[2]);
                 analogWrite(peltierCool, 0);
-                temperatureSensor.requestTemperatures();
-                Serial.print("tempSample ");
-                Serial.println(temperatureSensor.getTempCByIndex(0));
-                Serial.print("tempLid ");
-                Serial.println(temperatureSensor.getTempCByIndex(1));
             }
             else if (arguments[0] == 1)
             { // if cooling
@@ -100,12 +171,367 @@ void splitData()
                 analogWrite(peltierCool, arguments[2]);
                 analogWrite(peltierHeat, 0);
             }
+            // Última conversão concluída (não bloqueia)
+            Serial.print("tempSample ");
+            Serial.println(sampleTemperature);
+            Serial.print("tempLid ");
+            Serial.println(lidTemperature);
+        }
+        else if (strcmp(commandTitle, "stream") == 0)
+        {
+            // <stream intervalo_ms>
+            setStreamInterval(arguments[0]);
         }
-        else if (commandTitle == "printTemps")
+        else if (strcmp(commandTitle, "printTemps") == 0)
         {
             isToPrintTemperature = arguments[0];
         }
+        else if (strcmp(commandTitle, "binary") == 0 && arguments[0] >= 0 &&
+                 arguments[0] < sizeof(baudRates) / sizeof(baudRates[0]))
+        {
+            // <binary indice_da_velocidade>
+            Serial.print("binary ");
+            Serial.println(arguments[0]);
+            pendingBaudRate = baudRates[arguments[0]];
+        }
         Serial.println("nextpls");
         newData = false;
+        if (pendingBaudRate != 0)
+        {
+            // A troca só acontece depois de enviar a resposta
+            Serial.flush();
+            Serial.begin(pendingBaudRate);
+            pendingBaudRate = 0;
+            isBinary = true;
+        }
+    }
+}
+
+uint16_t crc16Update(uint16_t crc, byte data)
+{
+    crc ^= (uint16_t)data << 8;
+    for (byte i = 0; i < 8; i++)
+    {
+        crc = crc & 0x8000 ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+    return crc;
+}
+
+void sendFrame(byte command, const byte *payload, byte length)
+{
+    uint16_t crc = crc16Update(crc16Update(0xFFFF, length), command);
+    for (byte i = 0; i < length; i++)
+    {
+        crc = crc16Update(crc, payload[i]);
+    }
+    Serial.write(syncByte);
+    Serial.write(length);
+    Serial.write(command);
+    Serial.write(payload, length);
+    Serial.write(lowByte(crc));
+    Serial.write(highByte(crc));
+}
+
+void sendStatus(byte state, byte pwm)
+{
+    int sample = round(sampleTemperature * 100);
+    int lid = round(lidTemperature * 100);
+    byte payload[] = {state, pwm, flagTemperatures,
+                      lowByte(sample), highByte(sample),
+                      lowByte(lid), highByte(lid)};
+    sendFrame(responseStatus, payload, sizeof(payload));
+}
+
+void sendReading(unsigned long timestamp)
+{
+    int sample = round(sampleTemperature * 100);
+    int lid = round(lidTemperature * 100);
+    byte payload[] = {(byte)timestamp, (byte)(timestamp >> 8),
+                      (byte)(timestamp >> 16), (byte)(timestamp >> 24),
+                      lowByte(sample), highByte(sample),
+                      lowByte(lid), highByte(lid)};
+    sendFrame(responseReading, payload, sizeof(payload));
+}
+
+void applyOutput(int output)
+{
+    if (output >= 0)
+    {
+        analogWrite(peltierHeat, output);
+        analogWrite(peltierCool, 0);
+    }
+    else
+    {
+        analogWrite(peltierCool, -output);
+        analogWrite(peltierHeat, 0);
+    }
+}
+
+void sendProgress()
+{
+    unsigned long now = millis();
+    unsigned int elapsed = stepElapsed;
+    byte payload[] = {(byte)now, (byte)(now >> 8),
+                      (byte)(now >> 16), (byte)(now >> 24),
+                      controlState,
+                      lowByte(currentCycle), highByte(currentCycle),
+                      currentStep,
+                      lowByte(elapsed), highByte(elapsed),
+                      lowByte(controlOutput), highByte(controlOutput)};
+    sendFrame(responseProgress, payload, sizeof(payload));
+}
+
+void startStep()
+{
+    stepElapsed = 0;
+    integral = 0;
+    hasLastInput = false;
+}
+
+bool startProfile()
+{
+    if (controlState == stateRunning || nCycles == 0 || nSteps == 0 ||
+        definedSteps != (1 << nSteps) - 1)
+    {
+        return false;
+    }
+    controlState = stateRunning;
+    currentCycle = 1;
+    currentStep = 0;
+    startStep();
+    lastControl = millis();
+    return true;
+}
+
+void updateControl()
+{
+    unsigned long now = millis();
+    if (controlState != stateRunning || now - lastControl < controlPeriod)
+    {
+        return;
+    }
+    float dt = (now - lastControl) / 1000.0;
+    lastControl = now;
+
+    float error = stepTemperatures[currentStep] - sampleTemperature;
+    integral = constrain(integral + ki * error * dt, -255, 255);
+    float derivative = 0;
+    if (hasLastInput && dt > 0)
+    {
+        derivative = (sampleTemperature - lastInput) / dt;
+    }
+    lastInput = sampleTemperature;
+    hasLastInput = true;
+    controlOutput = constrain(kp * error + integral - kd * derivative,
+                              -255, 255);
+    applyOutput(controlOutput);
+
+    if (fabs(error) < tolerance)
+    {
+        stepElapsed += dt;
+    }
+    if (stepElapsed > stepDurations[currentStep])
+    {
+        currentStep++;
+        if (currentStep == nSteps)
+        {
+            currentStep = 0;
+            currentCycle++;
+        }
+        if (currentCycle > nCycles)
+        {
+            currentCycle = nCycles;
+            currentStep = nSteps - 1;
+            controlState = stateFinished;
+            controlOutput = 0;
+            applyOutput(0);
+            sendProgress();
+        }
+        else
+        {
+            startStep();
+        }
+    }
+}
+
+void executeFrame(byte command, const byte *payload, byte length)
+{
+    if (command == cmdPeltier && length == 2)
+    {
+        byte state = payload[0];
+        byte pwm = payload[1];
+        if (controlState == stateRunning)
+        { // O laço do dispositivo controla a pastilha
+            state = controlOutput >= 0 ? 0 : 1;
+            pwm = abs(controlOutput);
+        }
+        if (state == 0)
+        { // if heat
+            analogWrite(peltierHeat, pwm);
+            analogWrite(peltierCool, 0);
+        }
+        else
+        { // if cooling
+            analogWrite(peltierCool, pwm);
+            analogWrite(peltierHeat, 0);
+        }
+        sendStatus(state, pwm);
+    }
+    else if (command == cmdStream && length == 2)
+    {
+        setStreamInterval(payload[0] | (payload[1] << 8));
+        sendFrame(responseAck, &command, 1);
+    }
+    else if (command == cmdGains && length == 16)
+    {
+        // 4 floats little-endian: kp, ki, kd e tolerância
+        memcpy(&kp, payload, 4);
+        memcpy(&ki, payload + 4, 4);
+        memcpy(&kd, payload + 8, 4);
+        memcpy(&tolerance, payload + 12, 4);
+        sendFrame(responseAck, &command, 1);
+    }
+    else if (command == cmdProfile && length == 3 &&
+             controlState != stateRunning &&
+             payload[2] > 0 && payload[2] <= maxSteps)
+    {
+        nCycles = payload[0] | (payload[1] << 8);
+        nSteps = payload[2];
+        definedSteps = 0;
+        controlState = stateIdle;
+        sendFrame(responseAck, &command, 1);
+    }
+    else if (command == cmdStep && length == 5 &&
+             controlState != stateRunning && payload[0] < nSteps)
+    {
+        int temperature = payload[1] | (payload[2] << 8);
+        stepTemperatures[payload[0]] = temperature / 100.0;
+        stepDurations[payload[0]] = payload[3] | (payload[4] << 8);
+        definedSteps |= 1 << payload[0];
+        sendFrame(responseAck, &command, 1);
+    }
+    else if (command == cmdRun && length == 1 &&
+             (payload[0] == 0 || startProfile()))
+    {
+        if (payload[0] == 0)
+        {
+            if (controlState == stateRunning)
+            {
+                controlState = stateStopped;
+            }
+            controlOutput = 0;
+            applyOutput(0);
+        }
+        sendFrame(responseAck, &command, 1);
+    }
+    else
+    {
+        sendFrame(responseNak, NULL, 0);
+    }
+}
+
+void receiveFrame()
+{
+    // frame = LEN, CMD, DADOS, CRC (sem o SYNC)
+    static byte frame[maxPayload + 4];
+    static byte index = 0;
+    static bool isReceiving = false;
+    while (Serial.available() > 0)
+    {
+        byte newByte = Serial.read();
+        if (!isReceiving)
+        {
+            if (newByte == syncByte)
+            {
+                isReceiving = true;
+                index = 0;
+            }
+            continue;
+        }
+        frame[index] = newByte;
+        index++;
+        if (index == 1 && frame[0] > maxPayload)
+        {
+            isReceiving = false;
+            sendFrame(responseNak, NULL, 0);
+        }
+        else if (index > 1 && index == frame[0] + 4)
+        {
+            isReceiving = false;
+            uint16_t crc = 0xFFFF;
+            for (byte i = 0; i < frame[0] + 2; i++)
+            {
+                crc = crc16Update(crc, frame[i]);
+            }
+            uint16_t received = frame[index - 2] |
+                                ((uint16_t)frame[index - 1] << 8);
+            if (crc == received)
+            {
+                executeFrame(frame[1], frame + 2, frame[0]);
+            }
+            else
+            {
+                sendFrame(responseNak, NULL, 0);
+            }
+        }
+    }
+}
+
+void updateTemperatures()
+{
+    if (millis() - conversionStarted < conversionTime)
+    {
+        return;
+    }
+    sampleTemperature = temperatureSensor.getTempCByIndex(0);
+    lidTemperature = temperatureSensor.getTempCByIndex(1);
+    temperatureSensor.requestTemperatures();
+    conversionStarted = millis();
+}
+
+void pushReading()
+{
+    unsigned long now = millis();
+    if (streamInterval == 0 || now - lastPush < streamInterval)
+    {
+        return;
+    }
+    lastPush += streamInterval;
+    if (now - lastPush >= streamInterval)
+    {
+        lastPush = now; // Atrasado, não envia leituras acumuladas
+    }
+    if (isBinary)
+    {
+        sendReading(now);
+        if (controlState != stateIdle)
+        {
+            sendProgress();
+        }
+    }
+    else
+    {
+        Serial.print("temp ");
+        Serial.print(now);
+        Serial.print(" ");
+        Serial.print(sampleTemperature);
+        Serial.print(" ");
+        Serial.println(lidTemperature);
+    }
+}
+
+void serialTasks()
+{
+    updateTemperatures();
+    updateControl();
+    pushReading();
+    if (isBinary)
+    {
+        receiveFrame();
+    }
+    else
+    {
+        recieveCommand();
+        splitData();
     }
 }
@@ -0,0 +1,146 @@
+"""Sintonia automática do PID por realimentação a relé.
+
+Método de Åström–Hägglund: em torno do setpoint a saída do Peltier é
+alternada entre "bias + amplitude" e "bias - amplitude" sempre que a
+temperatura cruza a faixa de histerese, o que produz uma oscilação
+sustentada. Da amplitude "a" e do período "Tu" dessa oscilação obtêm-se
+o ganho crítico Ku = 4·d / (π·a) e, com as regras de Ziegler–Nichols
+(RULES), os ganhos do PID.
+
+Os ganhos calculados são gravados em GAINS_PATH para cada dispositivo
+(identificado pelo número de série USB, ou pela porta quando não há
+número de série) e carregados automaticamente por ArduinoPCR ao
+conectar. Dispositivos sem sintonia continuam usando KP, KI e KD de
+settings.json.
+"""
+
+import json
+from datetime import datetime
+from math import pi
+
+import constants as std
+
+# Regra -> (Kp/Ku, Ti/Tu, Td/Tu)
+RULES = {'classic': (0.6, 0.5, 0.125),
+         'some_overshoot': (0.33, 0.5, 0.33),
+         'no_overshoot': (0.2, 0.5, 0.33),
+         'pi': (0.45, 0.83, 0.0)}
+
+
+class RelayAutotuner:
+    """Saída do relé e medição da oscilação.
+
+    :param set_point: Temperatura (°C) em torno da qual a oscilação é
+    produzida.
+    :param amplitude: Amplitude "d" do relé (PWM).
+    :param bias: Saída média do relé, compensa a perda de calor.
+    :param hysteresis: Meia largura (°C) da faixa sem troca do relé.
+    :param cycles: Número de períodos medidos após o primeiro, que é
+    descartado.
+    """
+
+    def __init__(self, set_point, amplitude=255, bias=0, hysteresis=0.5,
+                 cycles=4, output_limit=255):
+        self.set_point = set_point
+        self.amplitude = amplitude
+        self.bias = bias
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.output_limit = output_limit
+
+        self.is_high = True
+        self.switch_times = []  # Instantes das trocas para a saída alta
+        # (máximo, mínimo) de cada período completo. O sistema continua
+        # subindo (ou descendo) depois de cada troca, então os extremos
+        # são medidos no período inteiro, entre duas trocas para a saída
+        # alta, e não em cada meio período.
+        self.peaks = []
+        self._maximum = self._minimum = None
+
+    @property
+    def output(self) -> int:
+        value = self.bias + (self.amplitude if self.is_high
+                             else -self.amplitude)
+        return int(max(-self.output_limit, min(self.output_limit, value)))
+
+    @property
+    def is_done(self) -> bool:
+        return len(self.switch_times) > self.cycles + 1
+
+    def update(self, now: float, temperature: float) -> int:
+        """Troca o relé se necessário.
+
+        :return: A saída do relé.
+        """
+        if self._maximum is None:
+            self._maximum = self._minimum = temperature
+        else:
+            self._maximum = max(self._maximum, temperature)
+            self._minimum = min(self._minimum, temperature)
+
+        if self.is_high and temperature > self.set_point + self.hysteresis:
+            self.is_high = False
+        elif not self.is_high and \
+                temperature < self.set_point - self.hysteresis:
+            self.is_high = True
+            if self.switch_times:
+                self.peaks.append((self._maximum, self._minimum))
+            self._maximum = self._minimum = temperature
+            self.switch_times.append(now)
+        return self.output
+
+    def result(self) -> tuple:
+        """Ganho e período críticos (Ku, Tu) medidos.
+
+        :raise ValueError: Se a oscilação ainda não foi medida.
+        """
+        if len(self.switch_times) < 3:
+            raise ValueError('Oscilação insuficiente para a sintonia.')
+        # O primeiro período parte da temperatura inicial e é descartado
+        times = self.switch_times[1:]
+        period = (times[-1] - times[0]) / (len(times) - 1)
+        peaks = self.peaks[1:]
+        oscillation = sum(maximum - minimum
+                          for maximum, minimum in peaks) / len(peaks) / 2
+        if oscillation <= 0:
+            raise ValueError('Oscilação insuficiente para a sintonia.')
+        return 4 * self.amplitude / (pi * oscillation), period
+
+    def gains(self, rule='classic') -> tuple:
+        """Ganhos (kp, ki, kd) pela regra de RULES."""
+        ultimate_gain, period = self.result()
+        kp_ratio, ti_ratio, td_ratio = RULES[rule]
+        kp = kp_ratio * ultimate_gain
+        return kp, kp / (ti_ratio * period), kp * td_ratio * period
+
+
+def load_all_gains(path=None) -> dict:
+    """Todos os ganhos gravados, {identificação: registro}."""
+    try:
+        with open(path or std.GAINS_PATH) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def load_gains(device_id, path=None) -> tuple:
+    """Ganhos (kp, ki, kd) do dispositivo, ou None se não houver."""
+    record = load_all_gains(path).get(device_id)
+    if record is None:
+        return None
+    return record['KP'], record['KI'], record['KD']
+
+
+def save_gains(device_id, gains, path=None, **details):
+    """Grava os ganhos do dispositivo, junto com "details" (ex.: Ku, Tu
+    e a regra usada).
+    """
+    path = path or std.GAINS_PATH
+    all_gains = load_all_gains(path)
+    kp, ki, kd = gains
+    all_gains[device_id] = {'KP': kp, 'KI': ki, 'KD': kd,
+                            'tuned': datetime.now().isoformat(
+                                timespec='seconds'),
+                            **details}
+    with open(path, 'w') as file:
+        json.dump(all_gains, file, indent=2)
@@ -0,0 +1,216 @@
+"""Estruturas para o gráfico de temperatura em tempo real.
+
+O gráfico exibe a execução inteira em uma largura fixa de pixels sem que
+o custo de cada atualização cresça com a duração do experimento:
+
+    -Cada série guarda as amostras em um RingBuffer de tamanho fixo.
+    Quando o buffer enche, ele é reduzido pela metade com o algoritmo
+    LTTB (Largest-Triangle-Three-Buckets), preservando a forma da curva.
+    -A cada atualização apenas os pontos novos são desenhados, já
+    reduzidos a no máximo um ponto por coluna de pixels.
+    -O desenho completo só é refeito quando a escala de tempo dobra ou
+    quando um buffer é compactado.
+"""
+
+from array import array
+
+
+def lttb(x, y, threshold: int) -> list:
+    """Seleciona os índices dos pontos que melhor representam a curva.
+
+    Implementação do Largest-Triangle-Three-Buckets (Sveinn Steinarsson,
+    2013). O primeiro e o último ponto são sempre mantidos.
+
+    :param x: Sequência com as coordenadas x (crescentes).
+    :param y: Sequência com as coordenadas y.
+    :param threshold: Número de pontos desejado.
+    :return: Lista com os índices selecionados.
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+
+    indices = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Média do próximo bucket
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        count = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / count
+        avg_y = sum(y[next_start:next_end]) / count
+
+        # Ponto do bucket atual que forma o maior triângulo
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = x[a], y[a]
+        max_area = -1
+        selected = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (y[j] - ay) -
+                       (ax - x[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+        indices.append(selected)
+        a = selected
+    indices.append(length - 1)
+    return indices
+
+
+class RingBuffer:
+    """Buffer circular de tamanho fixo com pares (x, y).
+
+    "total" conta todas as amostras já adicionadas e permite saber quais
+    pontos ainda não foram desenhados (ver since()).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.x = array('d', bytes(8 * capacity))
+        self.y = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, x: float, y: float):
+        index = (self.start + self.size) % self.capacity
+        self.x[index] = x
+        self.y[index] = y
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.total += 1
+
+    def items(self):
+        """Retorna as listas x e y em ordem cronológica."""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.x[self.start:end], self.y[self.start:end]
+        end -= self.capacity
+        return (self.x[self.start:] + self.x[:end],
+                self.y[self.start:] + self.y[:end])
+
+    def since(self, total: int):
+        """Pontos adicionados depois que "total" amostras existiam."""
+        count = min(self.total - total, self.size)
+        first = self.start + self.size - count
+        indices = [(first + i) % self.capacity for i in range(count)]
+        return ([self.x[i] for i in indices], [self.y[i] for i in indices])
+
+    def last(self):
+        """Par (x, y) mais recente."""
+        index = (self.start + self.size - 1) % self.capacity
+        return self.x[index], self.y[index]
+
+    def is_full(self):
+        return self.size == self.capacity
+
+    def compact(self, threshold: int):
+        """Reduz o conteúdo para "threshold" pontos usando LTTB."""
+        x, y = self.items()
+        indices = lttb(x, y, threshold)
+        for position, index in enumerate(indices):
+            self.x[position] = x[index]
+            self.y[position] = y[index]
+        self.start = 0
+        self.size = len(indices)
+
+
+class LiveChart:
+    """Desenha séries temporais em um canvas de forma incremental.
+
+    Pode ser usada com qualquer objeto com a interface de tk.Canvas
+    (create_line, delete).
+
+    :param canvas: Canvas onde as linhas serão desenhadas.
+    :param width: Largura da área de desenho em pixels.
+    :param height: Altura da área de desenho em pixels.
+    :param y_range: Valores mínimo e máximo do eixo y.
+    :param series: Dicionário {nome: cor} das séries exibidas.
+    :param time_scale: Duração (s) inicialmente exibida no eixo x. A
+    escala dobra sempre que o experimento ultrapassa o limite.
+    """
+
+    def __init__(self, canvas, width: int, height: int, y_range, series,
+                 time_scale=60.0):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.y_min, self.y_max = y_range
+        self.colors = dict(series)
+        self.time_scale = time_scale
+        self.buffers = {name: RingBuffer(4 * width) for name in series}
+        self._drawn = {name: 0 for name in series}
+        self._last_point = {name: None for name in series}
+        self._needs_redraw = False
+        self.redraws = 0
+
+    def add(self, t: float, **values):
+        """Adiciona uma amostra de cada série no instante "t"."""
+        while t > self.time_scale:
+            self.time_scale *= 2
+            self._needs_redraw = True
+        for name, value in values.items():
+            buffer = self.buffers[name]
+            if buffer.is_full():
+                buffer.compact(2 * self.width)
+                self._needs_redraw = True
+            buffer.append(t, value)
+
+    def to_pixels(self, t, value):
+        px = t / self.time_scale * (self.width - 1)
+        span = self.y_max - self.y_min
+        py = (self.y_max - value) / span * (self.height - 1)
+        return px, min(max(py, 0), self.height - 1)
+
+    def refresh(self):
+        """Desenha os pontos novos (ou tudo, se a escala mudou)."""
+        if self._needs_redraw:
+            self.redraw()
+            return
+        for name, buffer in self.buffers.items():
+            last = self._last_point[name]
+            if buffer.total == self._drawn[name]:
+                continue
+            # Espera acumular pelo menos uma coluna de pixels
+            newest = self.to_pixels(*buffer.last())
+            if last is not None and int(newest[0]) == int(last[0]):
+                continue
+            x, y = buffer.since(self._drawn[name])
+            points = [self.to_pixels(t, value) for t, value in zip(x, y)]
+            if last is not None:
+                points.insert(0, last)
+            if len(points) < 2:
+                continue
+            columns = int(points[-1][0]) - int(points[0][0]) + 1
+            self._draw(name, points, columns + 1)
+
+    def redraw(self):
+        self.canvas.delete('series')
+        self.redraws += 1
+        self._needs_redraw = False
+        for name, buffer in self.buffers.items():
+            self._last_point[name] = None
+            x, y = buffer.items()
+            points = [self.to_pixels(t, value) for t, value in zip(x, y)]
+            if len(points) >= 2:
+                self._draw(name, points, self.width)
+            else:
+                self._drawn[name] = buffer.total
+
+    def _draw(self, name, points, threshold):
+        indices = lttb([p[0] for p in points], [p[1] for p in points],
+                       threshold)
+        coords = []
+        for index in indices:
+            coords.extend(points[index])
+        self.canvas.create_line(*coords, fill=self.colors[name],
+                                tags=('series', name))
+        self._last_point[name] = points[-1]
+        self._drawn[name] = self.buffers[name].total
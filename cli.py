@@ -0,0 +1,257 @@
+"""Execução dos experimentos sem interface gráfica.
+
+Usa apenas o núcleo (functions.py, devices.py, repository.py), sem
+importar o Tkinter: o andamento publicado pelo ArduinoPCR é impresso na
+saída padrão, o que permite usar o Cetus PCR em servidores sem tela.
+
+Uso pela linha de comando:
+    python cli.py list
+    python cli.py ports
+    python cli.py run EXPERIMENTO --port PORTA [--cooling] [--interval S]
+        [--json]
+
+EXPERIMENTO é o nome (sem diferenciar maiúsculas) ou o id de um
+experimento do banco (EXP_DB_PATH). Ctrl+C cancela a execução. O código
+de saída é 0 se o experimento foi concluído, 1 se foi cancelado e 2 se
+não pôde ser iniciado.
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import json
+import sys
+from threading import Event, Lock
+from time import monotonic
+
+import constants as std
+import functions as fc
+from devices import DeviceManager
+from execution import CYCLE, FINAL, INITIAL, ExecutionPlan, PlanError
+from history import COMPLETED
+from repository import ExperimentRepository
+
+STAGE_NAMES = {INITIAL: 'inicial', CYCLE: 'ciclo', FINAL: 'final'}
+
+# Atributos impressos na linha de situação
+STATUS_FIELDS = frozenset({'current_sample_temperature',
+                           'current_lid_temperature', 'current_phase',
+                           'remaining_time'})
+
+
+class ProgressPrinter:
+    """Imprime os eventos de um dispositivo (listener do DeviceManager).
+
+    Os avisos, o início e o fim da execução e cada novo segmento são
+    impressos assim que publicados; as temperaturas, no máximo uma vez a
+    cada "interval" segundos.
+
+    :param output_json: Imprime um objeto JSON por linha no lugar do
+    texto.
+    """
+
+    def __init__(self, device: fc.ArduinoPCR, interval=5.0,
+                 output_json=False, out=sys.stdout):
+        self.device = device
+        self.interval = interval
+        self.output_json = output_json
+        self.out = out
+        self.plan = None
+        self.segment = None
+        self._last_status = None
+        self._lock = Lock()
+
+    def __call__(self, device, name, value):
+        if device is not self.device:
+            return
+        if name == fc.RUN_STARTED:
+            self.plan, self.segment = value, 0
+            self.write('run_started',
+                       {'experiment': value.name, 'segments': len(value),
+                        'n_cycles': value.n_cycles},
+                       f'Início de "{value.name}": {len(value)} segmentos, '
+                       f'{value.n_cycles} ciclos.')
+            self.write_segment(0)
+        elif name == 'current_segment' and self.plan is not None and \
+                value != self.segment:
+            self.segment = value
+            self.write_segment(value)
+        elif name == fc.RUN_FINISHED:
+            self.write('run_finished', {'status': value},
+                       'Experimento concluído.' if value == COMPLETED
+                       else 'Experimento cancelado.')
+            self.plan = None
+        elif name == fc.NOTICE:
+            self.write('notice', value._asdict(),
+                       f'{value.title}: {value.message}')
+        elif name in STATUS_FIELDS and self.plan is not None:
+            now = monotonic()
+            if self._last_status is None or \
+                    now - self._last_status >= self.interval:
+                self._last_status = now
+                self.write_status()
+
+    def write_segment(self, index):
+        set_point, hold, cycle, step = self.plan[index]
+        stage = self.plan.stage(index)
+        where = f'ciclo {cycle}/{self.plan.n_cycles}' \
+            if self.plan.is_cycled(cycle) else STAGE_NAMES[stage]
+        self.write('segment',
+                   {'index': index, 'name': self.plan.step_names[step],
+                    'set_point': set_point, 'hold': hold, 'cycle': cycle,
+                    'stage': stage},
+                   f'Segmento {index + 1}/{len(self.plan)} ({where}): '
+                   f'{self.plan.step_names[step]}, {set_point}°C por '
+                   f'{hold}s.')
+
+    def write_status(self):
+        device = self.device
+        set_point = self.plan.set_points[self.segment]
+        self.write('status',
+                   {'elapsed': int(device.elapsed_time),
+                    'sample': device.current_sample_temperature,
+                    'lid': device.current_lid_temperature,
+                    'set_point': set_point,
+                    'phase': device.current_phase,
+                    'remaining': device.remaining_time},
+                   f'[{fc.seconds_to_string(int(device.elapsed_time))}] '
+                   f'amostra {device.current_sample_temperature}°C, '
+                   f'tampa {device.current_lid_temperature}°C, '
+                   f'alvo {set_point}°C, '
+                   f'{device.current_phase}, restam '
+                   f'{fc.seconds_to_string(int(device.remaining_time))}')
+
+    def write(self, event, values, text):
+        line = json.dumps({'event': event, **values}) if self.output_json \
+            else text
+        with self._lock:
+            print(line, file=self.out, flush=True)
+
+
+def find_experiment(repository: ExperimentRepository, reference: str):
+    """Experimento pelo id ou pelo nome.
+
+    :raise LookupError: Nenhum experimento ou mais de um com o nome.
+    """
+    if reference.isdigit():
+        try:
+            return repository.get(int(reference))
+        except KeyError:
+            pass
+    matches = repository.find(reference)
+    if not matches:
+        raise LookupError(f'Experimento "{reference}" não encontrado.')
+    if len(matches) > 1:
+        ids = ', '.join(str(experiment.id) for experiment in matches)
+        raise LookupError(f'Há mais de um experimento "{reference}", use o '
+                          f'id: {ids}.')
+    return matches[0]
+
+
+def list_experiments(db_path) -> int:
+    repository = ExperimentRepository(db_path)
+    try:
+        for experiment in repository.list(order='name'):
+            print(f'{experiment.id:>4}  {experiment.name} '
+                  f'({experiment.n_cycles} ciclos, '
+                  f'{len(experiment.steps)} passos)')
+    finally:
+        repository.close()
+    return 0
+
+
+def list_ports() -> int:
+    manager = DeviceManager(baudrate=9600, timeout=1)
+    try:
+        for port in manager.discover():
+            print(port)
+    finally:
+        manager.close()
+    return 0
+
+
+def run(reference, port, db_path, cooling=False, interval=5.0,
+        output_json=False) -> int:
+    """Executa o experimento no dispositivo da porta dada.
+
+    :return: Código de saída (ver a documentação do módulo).
+    """
+    repository = ExperimentRepository(db_path)
+    try:
+        experiment = find_experiment(repository, reference)
+        ExecutionPlan.compile(experiment)
+        # Os passos são lidos antes de a execução começar
+        experiment = fc.ExperimentPCR(experiment.name, experiment.n_cycles,
+                                      experiment.final_hold,
+                                      *experiment.steps)
+    except (LookupError, PlanError) as error:
+        print(error, file=sys.stderr)
+        return 2
+    finally:
+        repository.close()
+
+    printer = ProgressPrinter(None, interval, output_json, out=sys.stdout)
+    results = []
+    done = Event()
+
+    def on_finish(_, finished):
+        results.append(finished)
+        done.set()
+
+    # As mensagens de depuração do núcleo vão para a saída de erros, a
+    # saída padrão fica só com o andamento.
+    with redirect_stdout(sys.stderr):
+        manager = DeviceManager(baudrate=9600, timeout=1)
+        if port not in manager.discover([port]):
+            print(f'Nenhum Cetus PCR encontrado na porta "{port}".')
+            return 2
+        device = printer.device = manager.get(port)
+        manager.listeners.append(printer)
+        thread = manager.run(port, experiment, cooling=cooling,
+                             on_finish=on_finish)
+        try:
+            _wait(thread, done)
+        except KeyboardInterrupt:
+            device.is_running = False
+            _wait(thread, done)
+        finally:
+            manager.close()
+    return 0 if results and results[0] else 1
+
+
+def _wait(thread, done: Event):
+    # Thread.join() interrompido pelo Ctrl+C deixa a thread em um estado
+    # inconsistente, a espera é feita pelo Event.
+    while not done.wait(0.5) and thread.is_alive():
+        pass
+
+
+def main(arguments=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='cli.py', description='Cetus PCR sem interface gráfica.')
+    parser.add_argument('--db', default=std.EXP_DB_PATH,
+                        help='banco de experimentos')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='lista os experimentos')
+    commands.add_parser('ports', help='lista os dispositivos conectados')
+    run_parser = commands.add_parser('run', help='executa um experimento')
+    run_parser.add_argument('experiment', help='nome ou id do experimento')
+    run_parser.add_argument('--port', required=True,
+                            help='porta do dispositivo')
+    run_parser.add_argument('--cooling', action='store_true',
+                            help='resfria o dispositivo antes de começar')
+    run_parser.add_argument('--interval', type=float, default=5.0,
+                            help='intervalo (s) entre as linhas de '
+                                 'temperatura')
+    run_parser.add_argument('--json', action='store_true',
+                            help='um objeto JSON por linha')
+    args = parser.parse_args(arguments)
+    if args.command == 'list':
+        return list_experiments(args.db)
+    if args.command == 'ports':
+        return list_ports()
+    return run(args.experiment, args.port, args.db, args.cooling,
+               args.interval, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Relógios usados pelo laço de controle.
+
+ArduinoPCR nunca chama time()/sleep() diretamente, e sim os métodos de
+um relógio. O SystemClock usa o tempo real, enquanto o VirtualClock
+avança instantaneamente a cada sleep(), permitindo executar um
+experimento completo em poucos segundos contra o simulador e com
+resultados determinísticos.
+
+Os laços assíncronos (session.py) esperam com "await
+clock.sleep_until(instante)", que não bloqueia o event loop.
+"""
+
+import asyncio
+from datetime import datetime
+import time as _time
+
+
+class SystemClock:
+    """Relógio padrão, baseado no tempo real do sistema."""
+
+    @staticmethod
+    def time() -> float:
+        return _time.time()
+
+    @staticmethod
+    def sleep(seconds: float):
+        _time.sleep(seconds)
+
+    async def sleep_until(self, deadline: float):
+        """Aguarda (sem bloquear o event loop) até o instante dado."""
+        await asyncio.sleep(max(0.0, deadline - self.time()))
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time())
+
+
+class VirtualClock(SystemClock):
+    """Relógio simulado que só avança quando sleep() é chamado.
+
+    Funções registradas em add_sleep_hook() são chamadas após cada
+    avanço, o que permite ao simulador sincronizar a comunicação serial
+    antes da próxima iteração do laço de controle.
+
+    :param start: Instante inicial em segundos desde a época (epoch).
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._sleep_hooks = []
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        self._now += max(0.0, seconds)
+        for hook in list(self._sleep_hooks):
+            hook()
+
+    async def sleep_until(self, deadline: float):
+        self.sleep(deadline - self._now)
+        # Deixa o event loop processar o que chegou da porta
+        await asyncio.sleep(0)
+
+    def add_sleep_hook(self, hook):
+        self._sleep_hooks.append(hook)
+
+    def remove_sleep_hook(self, hook):
+        if hook in self._sleep_hooks:
+            self._sleep_hooks.remove(hook)
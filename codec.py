@@ -0,0 +1,336 @@
+"""Protocolo binário entre o aplicativo e o firmware do Cetus PCR.
+
+Cada mensagem é enviada em um quadro:
+
+    SYNC (0xA5) | LEN | CMD | DADOS (LEN bytes) | CRC16 (2 bytes)
+
+O CRC é o CRC-16/CCITT-FALSE (polinômio 0x1021, valor inicial 0xFFFF)
+calculado sobre LEN, CMD e DADOS e enviado em little-endian. Todos os
+valores inteiros também são little-endian.
+
+Comandos do aplicativo:
+    -CMD_PELTIER: estado (0 aquece, 1 resfria) e PWM, um byte cada;
+    -CMD_STREAM: intervalo (ms, uint16) entre as leituras enviadas
+    espontaneamente pelo firmware. Zero desativa o envio;
+    -CMD_GAINS, CMD_PROFILE, CMD_STEP e CMD_RUN: envio e execução de um
+    perfil com o controle PID no próprio dispositivo (ver onboard.py).
+
+Respostas do firmware (uma para cada comando recebido):
+    -RESPONSE_STATUS: estado, PWM, flags e as temperaturas da amostra e
+    da tampa em centésimos de °C (int16). O bit FLAG_TEMPERATURES indica
+    se as temperaturas foram lidas;
+    -RESPONSE_ACK: confirmação de um comando sem dados de resposta;
+    -RESPONSE_NAK: o quadro recebido era inválido (CRC ou tamanho).
+
+Mensagens espontâneas:
+    -RESPONSE_READING: instante da leitura (ms desde o início do
+    firmware, uint32) e as temperaturas da amostra e da tampa;
+    -RESPONSE_PROGRESS: andamento do perfil executado no dispositivo,
+    enviado junto com as leituras e ao final da execução.
+
+O dispositivo sempre inicia no protocolo de texto. O modo binário é
+ativado com o comando de texto "<binary N>", onde N é o índice da nova
+velocidade em BAUD_RATES. O firmware responde "binary N" e "nextpls" na
+velocidade antiga e então passa a usar os quadros na nova velocidade.
+Um firmware sem suporte responde apenas "nextpls" e o aplicativo
+continua no protocolo de texto (ver negotiate()).
+
+Para comparar o tamanho e a vazão dos dois protocolos através do
+simulador basta executar 'python codec.py'.
+"""
+
+import struct
+from binascii import crc_hqx
+from time import perf_counter
+
+from protocol import Cooling, Heating, LidTemperature, LineReader, \
+    NEXT_COMMAND, NextCommand, Progress, REJECTED, Reading, \
+    SampleTemperature, Unknown
+
+SYNC = 0xA5
+MAX_PAYLOAD = 16
+
+CMD_PELTIER = 0x01
+CMD_STREAM = 0x02
+CMD_GAINS = 0x03
+CMD_PROFILE = 0x04
+CMD_STEP = 0x05
+CMD_RUN = 0x06
+RESPONSE_ACK = 0x80
+RESPONSE_STATUS = 0x81
+RESPONSE_READING = 0x82
+RESPONSE_PROGRESS = 0x83
+RESPONSE_NAK = 0x15
+
+FLAG_TEMPERATURES = 0x01
+
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200)
+
+_PELTIER = struct.Struct('<BB')
+_STATUS = struct.Struct('<BBBhh')
+_STREAM = struct.Struct('<H')
+_READING = struct.Struct('<Ihh')
+_GAINS = struct.Struct('<ffff')  # kp, ki, kd, tolerância
+_PROFILE = struct.Struct('<HB')  # ciclos, passos
+_STEP = struct.Struct('<BhH')  # índice, temperatura (°C/100), duração (s)
+_RUN = struct.Struct('<B')
+_PROGRESS = struct.Struct('<IBHBHh')
+_CRC = struct.Struct('<H')
+
+
+def crc16(data: bytes) -> int:
+    """CRC-16/CCITT-FALSE."""
+    return crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(command: int, payload=b'') -> bytes:
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f'Quadro com {len(payload)} bytes de dados '
+                         f'(máximo {MAX_PAYLOAD}).')
+    body = bytes((len(payload), command)) + payload
+    return bytes((SYNC,)) + body + _CRC.pack(crc16(body))
+
+
+def encode_peltier(output) -> bytes:
+    """Quadro equivalente a functions.peltier_command(output)."""
+    output = int(output)
+    state = 0 if output >= 0 else 1
+    return encode_frame(CMD_PELTIER,
+                        _PELTIER.pack(state, min(abs(output), 255)))
+
+
+def encode_stream(interval_ms: int) -> bytes:
+    return encode_frame(CMD_STREAM, _STREAM.pack(interval_ms))
+
+
+def encode_gains(kp, ki, kd, tolerance) -> bytes:
+    return encode_frame(CMD_GAINS, _GAINS.pack(kp, ki, kd, tolerance))
+
+
+def encode_profile(n_cycles: int, n_steps: int) -> bytes:
+    return encode_frame(CMD_PROFILE, _PROFILE.pack(n_cycles, n_steps))
+
+
+def encode_step(index: int, temperature, duration: int) -> bytes:
+    return encode_frame(CMD_STEP, _STEP.pack(index, round(temperature * 100),
+                                             duration))
+
+
+def encode_run(start: bool) -> bytes:
+    return encode_frame(CMD_RUN, _RUN.pack(start))
+
+
+def encode_status(state: int, pwm: int, sample=None, lid=None) -> bytes:
+    """Resposta do firmware a CMD_PELTIER (usada pelo simulador)."""
+    if sample is None:
+        flags, sample, lid = 0, 0, 0
+    else:
+        flags = FLAG_TEMPERATURES
+    return encode_frame(RESPONSE_STATUS,
+                        _STATUS.pack(state, pwm, flags,
+                                     round(sample * 100), round(lid * 100)))
+
+
+def encode_reading(timestamp: int, sample: float, lid: float) -> bytes:
+    """Leitura periódica do firmware (usada pelo simulador)."""
+    return encode_frame(RESPONSE_READING,
+                        _READING.pack(timestamp & 0xFFFFFFFF,
+                                      round(sample * 100), round(lid * 100)))
+
+
+def encode_progress(timestamp: int, state: int, cycle: int, step: int,
+                    step_elapsed: int, output: int) -> bytes:
+    """Andamento do perfil no dispositivo (usada pelo simulador)."""
+    return encode_frame(RESPONSE_PROGRESS,
+                        _PROGRESS.pack(timestamp & 0xFFFFFFFF, state, cycle,
+                                       step, min(step_elapsed, 0xFFFF),
+                                       output))
+
+
+def decode_command(command: int, payload: bytes):
+    """Argumentos de um comando do aplicativo (usada pelo simulador).
+
+    :return: Tupla com os argumentos, ou None se o quadro for inválido.
+    """
+    layout = {CMD_PELTIER: _PELTIER, CMD_STREAM: _STREAM, CMD_GAINS: _GAINS,
+              CMD_PROFILE: _PROFILE, CMD_STEP: _STEP,
+              CMD_RUN: _RUN}.get(command)
+    if layout is None or len(payload) != layout.size:
+        return None
+    return layout.unpack(payload)
+
+
+def decode_messages(command: int, payload: bytes) -> list:
+    """Converte um quadro de resposta nas mensagens de protocol.py.
+
+    Cada resposta termina com um NextCommand, assim como o "nextpls" do
+    protocolo de texto. Um NAK (Rejected) também libera o próximo
+    comando: o laço de controle envia uma nova saída no lugar da que foi
+    perdida.
+    """
+    if command == RESPONSE_STATUS and len(payload) == _STATUS.size:
+        state, pwm, flags, sample, lid = _STATUS.unpack(payload)
+        messages = [Cooling(pwm) if state else Heating(pwm)]
+        if flags & FLAG_TEMPERATURES:
+            messages.append(SampleTemperature(sample / 100))
+            messages.append(LidTemperature(lid / 100))
+        messages.append(NEXT_COMMAND)
+        return messages
+    if command == RESPONSE_READING and len(payload) == _READING.size:
+        timestamp, sample, lid = _READING.unpack(payload)
+        return [Reading(timestamp, sample / 100, lid / 100)]
+    if command == RESPONSE_PROGRESS and len(payload) == _PROGRESS.size:
+        return [Progress(*_PROGRESS.unpack(payload))]
+    if command == RESPONSE_ACK:
+        return [NEXT_COMMAND]
+    if command == RESPONSE_NAK:
+        return [REJECTED, NEXT_COMMAND]
+    return [Unknown(bytes((command,)) + payload)]
+
+
+class FrameDecoder:
+    """Separa os quadros de um fluxo de bytes.
+
+    Bytes fora de um quadro e quadros com CRC inválido são descartados;
+    a busca recomeça no byte seguinte ao SYNC rejeitado.
+    """
+
+    def __init__(self):
+        self.crc_errors = 0
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """Retorna a lista de quadros (comando, dados) completos."""
+        self._buffer += data
+        buffer = self._buffer
+        frames = []
+        start = 0
+        while True:
+            start = buffer.find(SYNC, start)
+            if start < 0:
+                buffer.clear()
+                break
+            if len(buffer) - start < 5:
+                del buffer[:start]
+                break
+            length = buffer[start + 1]
+            if length > MAX_PAYLOAD:
+                start += 1
+                continue
+            end = start + 4 + length
+            if len(buffer) < end + 1:
+                del buffer[:start]
+                break
+            body = bytes(buffer[start + 1:end - 1])
+            if crc16(body) != _CRC.unpack_from(buffer, end - 1)[0]:
+                self.crc_errors += 1
+                start += 1
+                continue
+            frames.append((body[1], body[2:]))
+            start = end + 1
+        return frames
+
+
+class FrameReader(LineReader):
+    """Mesma interface do LineReader para o protocolo binário."""
+
+    def __init__(self, serial_device, max_read=4096):
+        super().__init__(serial_device, max_read)
+        self.decoder = FrameDecoder()
+
+    def decode(self, data: bytes) -> list:
+        messages = []
+        for command, payload in self.decoder.feed(data):
+            messages.extend(decode_messages(command, payload))
+        return messages
+
+
+def negotiate(serial_device, baudrate: int, attempts=20) -> bool:
+    """Ativa o protocolo binário na velocidade dada.
+
+    Deve ser chamada antes de iniciar o monitor serial, já que lê as
+    respostas diretamente da porta.
+
+    :param baudrate: Nova velocidade, um dos valores de BAUD_RATES.
+    :param attempts: Número de leituras (cada uma limitada pelo timeout
+    da porta) aguardando o "nextpls".
+    :return: True se o firmware confirmou a troca.
+    """
+    index = BAUD_RATES.index(baudrate)
+    serial_device.write(b'<binary %d>\r\n' % index)
+    reader = LineReader(serial_device)
+    confirmed = False
+    for _ in range(attempts):
+        lines = reader.read_lines()
+        if b'binary %d' % index in lines:
+            confirmed = True
+        if b'nextpls' in lines:
+            break
+    else:
+        return False
+    if confirmed:
+        serial_device.baudrate = baudrate
+    return confirmed
+
+
+def _exchange_rate(simulator, serial_device, encode, reader, n_commands):
+    started = perf_counter()
+    for i in range(n_commands):
+        serial_device.write(encode(i % 256))
+        while NextCommand not in {type(m) for m in reader.read_messages()}:
+            pass
+    return n_commands / (perf_counter() - started)
+
+
+def _encode_text_peltier(output) -> bytes:
+    """Comando de saída do protocolo de texto."""
+    return b'%a\r\n' % f'<peltier 0 {output}>'
+
+
+def compare_protocols(n_commands=5000):
+    """Compara os protocolos de texto e binário através do simulador.
+
+    :return: Dicionário {protocolo: (bytes por troca, trocas/s no
+    simulador, trocas/s limitadas por 9600 baud, por 115200 baud)}.
+    """
+    # Importação local: o simulador usa este módulo.
+    from simulator import CetusSimulator
+
+    results = {}
+    for name in ('texto', 'binário'):
+        simulator = CetusSimulator(conversion_time=0)
+        serial_device = simulator.serial_for_url(timeout=1)
+        LineReader(serial_device).read_lines()  # "Cetus is ready."
+        if name == 'binário':
+            if not negotiate(serial_device, 115200):
+                raise RuntimeError('O simulador não aceitou o protocolo '
+                                   'binário.')
+            reader = FrameReader(serial_device)
+            encode = encode_peltier
+        else:
+            reader = LineReader(serial_device)
+            encode = _encode_text_peltier
+        request = encode(255)
+        response = simulator.feed(request)
+        exchange = len(request) + len(response)
+        rate = _exchange_rate(simulator, serial_device, encode, reader,
+                              n_commands)
+        expected = n_commands + 1 + (name == 'binário')
+        if simulator.commands_received != expected:
+            raise RuntimeError(f'O simulador recebeu '
+                               f'{simulator.commands_received} comandos '
+                               f'({expected} esperados).')
+        # 10 bits por byte (start, 8 dados, stop)
+        results[name] = (exchange, rate, 9600 / 10 / exchange,
+                         115200 / 10 / exchange)
+        serial_device.close()
+    return results
+
+
+if __name__ == '__main__':
+    print(f'{"protocolo":>10} {"bytes":>6} {"simulador":>12} '
+          f'{"9600 baud":>10} {"115200 baud":>12}')
+    for protocol_name, (size, sim_rate, slow, fast) in \
+            compare_protocols().items():
+        print(f'{protocol_name:>10} {size:6d} {sim_rate:10,.0f}/s '
+              f'{slow:8,.1f}/s {fast:10,.1f}/s')
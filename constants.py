@@ -1,11 +1,56 @@
 import json
+import os
 
 # -------------------------------------- Caminhos para arquivos de configuração
-EXP_PATH = 'experiments.pcr'
-SETTINGS_PATH = 'settings.json'
+EXP_DB_PATH = 'experiments.db'
+EXP_PATH = 'experiments.pcr'  # Formato antigo, importado em EXP_DB_PATH
+SETTINGS_PATH = os.environ.get('CETUS_SETTINGS', 'settings.json')
+LOGS_PATH = 'experiment logs'
+RUNTIME_INDEX_PATH = f'{LOGS_PATH}/runtime_index.json'  # Cache
+HISTORY_DB_PATH = f'{LOGS_PATH}/history.db'  # Resumo das execuções
+GAINS_PATH = 'device_gains.json'  # Ganhos da sintonia automática
+KNOWN_PORTS_PATH = 'known_ports.json'  # Última porta de cada dispositivo
 
-with open(SETTINGS_PATH, 'r') as infile:
-    settings_values = json.load(infile)
+# Valores usados quando settings.json não existe ou não define a chave
+DEFAULT_SETTINGS = {
+    'COOLING_TEMP_C': 30,
+    'KP': 100,
+    'KI': 0,
+    'KD': 0,
+    'TOLERANCE': 3,
+    'HOLD_HYSTERESIS': 0.5,
+    'LOG_FORMAT': 'binary',
+    'GUI_MAX_REFRESH_HZ': 10,
+    'SERIAL_PROTOCOL': 'binary',
+    'BINARY_BAUDRATE': 115200,
+    'STREAM_INTERVAL_MS': 200,
+    'CONTROL_MODE': 'host',
+    'CONNECT_TIMEOUT_S': 4,
+    'INSTRUMENTATION': True,
+    'FAST_RAMP': {'ENABLED': False},
+    'AUTOTUNE': {'SET_POINT_C': 60,
+                 'AMPLITUDE': 255,
+                 'BIAS': 0,
+                 'HYSTERESIS_C': 0.5,
+                 'CYCLES': 4,
+                 'RULE': 'some_overshoot',
+                 'MAX_TIME_S': 900},
+    'GAIN_SCHEDULE': {'ENABLED': False},
+}
+
+
+def load_settings(path: str) -> dict:
+    """Configurações do arquivo "path" sobre os valores padrão."""
+    values = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path, 'r') as infile:
+            values.update(json.load(infile))
+    except FileNotFoundError:
+        pass
+    return values
+
+
+settings_values = load_settings(SETTINGS_PATH)
 
 # ------------------------------------------------------- Constantes do sistema
 
@@ -14,6 +59,19 @@ KP = settings_values['KP']
 KI = settings_values['KI']
 KD = settings_values['KD']
 TOLERANCE = settings_values['TOLERANCE']
+HOLD_HYSTERESIS = settings_values['HOLD_HYSTERESIS']
+FAST_RAMP = settings_values['FAST_RAMP']  # ver control.FastRamp
+AUTOTUNE = settings_values['AUTOTUNE']  # ver autotune.py
+GAIN_SCHEDULE = settings_values['GAIN_SCHEDULE']  # ver control.py
+GUI_MAX_REFRESH_HZ = settings_values['GUI_MAX_REFRESH_HZ']
+LOG_FORMAT = settings_values['LOG_FORMAT']  # "binary" ou "csv"
+SERIAL_PROTOCOL = settings_values['SERIAL_PROTOCOL']  # "binary" ou "text"
+BINARY_BAUDRATE = settings_values['BINARY_BAUDRATE']
+STREAM_INTERVAL_MS = settings_values['STREAM_INTERVAL_MS']  # 0 desativa
+CONTROL_MODE = settings_values['CONTROL_MODE']  # "host" ou "device"
+# Espera máxima pelo "Cetus is ready." em cada porta
+CONNECT_TIMEOUT_S = settings_values['CONNECT_TIMEOUT_S']
+INSTRUMENTATION = settings_values['INSTRUMENTATION']
 
 # ---------------------------------------------------------- Constantes Tkinter
 BG = '#434343'
@@ -24,6 +82,14 @@ TEXTS_COLOR = 'white'
 SIDE_BAR_COLOR = '#383838'
 TOP_BAR_COLOR = '#529E76'
 
+# Gráfico de temperatura da janela de monitoramento
+CHART_WIDTH = 700
+CHART_HEIGHT = 150
+CHART_RANGE_C = (0, 110)
+CHART_COLORS = {'sample': '#e74c3c',
+                'lid': '#3498db',
+                'setpoint': '#2ecc71'}
+
 # --------------------------------------------------------------------- Fontes
 FONT_TITLE = 'Courier New'
 FONT_BUTTONS = 'Arial'
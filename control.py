@@ -0,0 +1,417 @@
+"""Temporização do laço de controle executado no computador.
+
+O FixedRateTicker acorda o laço em instantes absolutos (início + k ×
+período), então o tempo gasto em cada iteração (PID, escrita na porta,
+registro) não se acumula no período, como acontecia com
+"trabalho + sleep(0.1)". Se o laço se atrasar mais de um período os
+instantes perdidos são descartados em vez de executados em sequência.
+
+Cada passo do experimento é acompanhado por um StepTimer, com duas
+fases:
+    -Rampa: da mudança do setpoint até a temperatura entrar na faixa de
+    tolerância;
+    -Patamar: o tempo do passo começa a contar na entrada na faixa. Se a
+    temperatura sair da faixa (tolerância + histerese) a contagem é
+    pausada até que ela volte para dentro da tolerância.
+A histerese evita que uma leitura oscilando na borda da faixa liga e
+desliga a contagem a cada iteração.
+
+Com o modo de rampa rápida (FastRamp, "FAST_RAMP" em settings.json) a
+rampa é feita com PWM máximo até "LEAD_C" graus do alvo. Em seguida o
+PID recebe um setpoint além do alvo (no máximo "OVERSHOOT_C" graus e
+"OVERSHOOT_S" segundos), que compensa o atraso térmico do bloco, e
+volta ao alvo assim que a temperatura o alcança.
+
+GainSchedule ("GAIN_SCHEDULE" em settings.json) escolhe os ganhos do PID
+pelo setpoint e pelo sentido em que a temperatura precisa ir
+(aquecimento ou resfriamento), interpolando entre as linhas da tabela.
+A troca de ganhos durante um passo é feita sem salto na saída
+(switch_gains()).
+"""
+
+from bisect import bisect_left
+from typing import NamedTuple
+
+from simple_pid import PID
+
+RAMP, HOLD = 'ramp', 'hold'
+DRIVE, OVERSHOOT, SETTLE = 'drive', 'overshoot', 'settle'
+HEATING, COOLING = 1, -1
+
+CONTROL_PERIOD = 0.1  # s
+
+
+class FixedRateTicker:
+    """Espera até o próximo instante de uma grade de período fixo.
+
+    :param clock: Relógio com time() e sleep(), e sleep_until() para
+    wait_async() (ver clock.py).
+    :param period: Intervalo (s) entre dois instantes.
+    """
+
+    def __init__(self, clock, period=CONTROL_PERIOD):
+        self.clock = clock
+        self.period = period
+        self.deadline = None
+        self.missed = 0
+        self.lateness = 0.0
+
+    def _advance(self, now: float) -> float:
+        """Avança para o próximo instante da grade e o retorna."""
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.deadline += self.period
+            if now > self.deadline + self.period:
+                # Atrasado mais de um período: pula para o próximo
+                # instante da grade.
+                skipped = int((now - self.deadline) // self.period)
+                self.missed += skipped
+                self.deadline += skipped * self.period
+        return self.deadline
+
+    def wait(self) -> float:
+        """Aguarda o próximo instante. A primeira chamada não espera.
+
+        :return: O instante em que o laço foi acordado.
+        """
+        now = self.clock.time()
+        if now < self._advance(now):
+            self.clock.sleep(self.deadline - now)
+            now = self.clock.time()
+        self.lateness = max(0.0, now - self.deadline)
+        return now
+
+    async def wait_async(self) -> float:
+        """wait() para corrotinas, usa clock.sleep_until()."""
+        now = self.clock.time()
+        if now < self._advance(now):
+            await self.clock.sleep_until(self.deadline)
+            now = self.clock.time()
+        self.lateness = max(0.0, now - self.deadline)
+        return now
+
+
+class StepTimer:
+    """Fases de rampa e patamar de um passo.
+
+    :param set_point: Temperatura alvo (°C).
+    :param duration: Tempo (s) de patamar dentro da faixa.
+    :param tolerance: Meia largura da faixa (°C) em que o tempo é contado.
+    :param hysteresis: Margem (°C) além da tolerância para pausar a
+    contagem.
+    :param started: Instante de início do passo.
+    :param start_temperature: Temperatura no início do passo, usada na
+    estimativa da rampa.
+    """
+
+    def __init__(self, set_point, duration, tolerance, hysteresis=0.0,
+                 started=0.0, start_temperature=None):
+        self.set_point = set_point
+        self.duration = duration
+        self.tolerance = tolerance
+        self.hysteresis = hysteresis
+        self.start_temperature = start_temperature
+
+        self.phase = RAMP
+        self.in_band = False
+        self.ramp_elapsed = 0.0
+        self.hold_elapsed = 0.0
+        self.out_of_band = 0.0  # tempo fora da faixa durante o patamar
+        self.temperature = start_temperature
+        self._last_update = started
+
+    @property
+    def is_done(self) -> bool:
+        return self.phase == HOLD and self.hold_elapsed >= self.duration
+
+    @property
+    def phase_elapsed(self) -> float:
+        if self.phase == RAMP:
+            return self.ramp_elapsed
+        return self.hold_elapsed
+
+    @property
+    def ramp_rate(self) -> float:
+        """Velocidade média (°C/s) em direção ao setpoint, ou None."""
+        if self.start_temperature is None or self.temperature is None or \
+                self.ramp_elapsed <= 0:
+            return None
+        direction = 1 if self.set_point >= self.start_temperature else -1
+        rate = (self.temperature - self.start_temperature) * direction / \
+            self.ramp_elapsed
+        return rate if rate > 0 else None
+
+    @property
+    def phase_eta(self) -> float:
+        """Tempo restante (s) da fase atual. None se ainda não é possível
+        estimar a rampa.
+        """
+        if self.phase == HOLD:
+            return max(0.0, self.duration - self.hold_elapsed)
+        rate = self.ramp_rate
+        if rate is None:
+            return None
+        distance = max(0.0, abs(self.set_point - self.temperature) -
+                       self.tolerance)
+        return distance / rate
+
+    @property
+    def eta(self) -> float:
+        """Tempo restante (s) do passo, ou None (ver phase_eta)."""
+        phase_eta = self.phase_eta
+        if phase_eta is None or self.phase == HOLD:
+            return phase_eta
+        return phase_eta + self.duration
+
+    def update(self, now: float, temperature: float) -> str:
+        """Conta o intervalo desde a última chamada na fase em que ele foi
+        passado e atualiza a fase com a nova temperatura.
+
+        :return: A fase atual.
+        """
+        dt = max(0.0, now - self._last_update)
+        self._last_update = now
+        if self.phase == RAMP:
+            self.ramp_elapsed += dt
+        elif self.in_band:
+            self.hold_elapsed += dt
+        else:
+            self.out_of_band += dt
+
+        self.temperature = temperature
+        error = abs(self.set_point - temperature)
+        if self.in_band:
+            if error >= self.tolerance + self.hysteresis:
+                self.in_band = False
+        elif error < self.tolerance:
+            self.in_band = True
+            self.phase = HOLD
+        return self.phase
+
+
+def _device_values(values: dict, device) -> dict:
+    """Valores de uma seção de settings.json com as substituições de
+    "DEVICES" para o dispositivo dado.
+
+    :param device: Identificação do dispositivo (ArduinoPCR.device_id),
+    que não muda quando o sistema troca o nome da porta.
+    """
+    values = dict(values)
+    values.update(values.pop('DEVICES', {}).get(device, {}))
+    return values
+
+
+class FastRampSettings(NamedTuple):
+    """Parâmetros da rampa rápida ("FAST_RAMP" em settings.json)."""
+    enabled: bool = False
+    lead: float = 1.0  # °C antes do alvo em que o PWM máximo é desligado
+    overshoot: float = 2.0  # °C além do alvo no setpoint do PID
+    overshoot_time: float = 3.0  # s, duração máxima do setpoint além
+    min_delta: float = 5.0  # °C, rampas menores usam apenas o PID
+    limits: tuple = (4.0, 99.0)  # °C, setpoint nunca sai desse intervalo
+
+    @classmethod
+    def from_settings(cls, values: dict, device=None):
+        """Lê os parâmetros padrão, substituídos pelos de "DEVICES"
+        quando houver uma entrada para o dispositivo (device_id).
+        """
+        values = _device_values(values, device)
+        defaults = cls()
+        return cls(enabled=bool(values.get('ENABLED', defaults.enabled)),
+                   lead=float(values.get('LEAD_C', defaults.lead)),
+                   overshoot=float(values.get('OVERSHOOT_C',
+                                              defaults.overshoot)),
+                   overshoot_time=float(values.get('OVERSHOOT_S',
+                                                   defaults.overshoot_time)),
+                   min_delta=float(values.get('MIN_DELTA_C',
+                                              defaults.min_delta)),
+                   limits=tuple(values.get('LIMITS_C', defaults.limits)))
+
+
+class FastRamp:
+    """Rampa com PWM máximo seguida de um setpoint além do alvo.
+
+    Estágios:
+        -DRIVE: saída fixa em ±output_limit, com o PID em modo manual
+        (sem acumular a integral);
+        -OVERSHOOT: PID com o setpoint deslocado de "overshoot" graus;
+        -SETTLE: PID com o setpoint do passo.
+
+    :param settings: FastRampSettings.
+    :param set_point: Temperatura alvo do passo (°C).
+    :param temperature: Temperatura no início da rampa.
+    """
+
+    def __init__(self, settings: FastRampSettings, set_point, temperature,
+                 output_limit=255):
+        self.settings = settings
+        self.set_point = set_point
+        self.direction = 1 if set_point >= temperature else -1
+        low, high = settings.limits
+        self.boosted_set_point = min(high, max(low, set_point +
+                                               self.direction *
+                                               settings.overshoot))
+        self.output_limit = output_limit
+        self.stage = DRIVE
+        self._overshoot_started = None
+
+    @classmethod
+    def create(cls, settings: FastRampSettings, set_point, temperature):
+        """FastRamp para o passo, ou None se o modo estiver desativado ou
+        a rampa for pequena demais.
+        """
+        if not settings.enabled or \
+                abs(set_point - temperature) < settings.min_delta:
+            return None
+        return cls(settings, set_point, temperature)
+
+    @property
+    def output(self):
+        """Saída imposta ao Peltier, ou None quando o PID deve ser usado."""
+        if self.stage == DRIVE:
+            return self.direction * self.output_limit
+        return None
+
+    def update(self, now: float, temperature: float) -> float:
+        """Avança os estágios com a nova temperatura.
+
+        :return: Setpoint a ser usado pelo PID.
+        """
+        remaining = (self.set_point - temperature) * self.direction
+        if self.stage == DRIVE and remaining <= self.settings.lead:
+            self.stage = OVERSHOOT
+            self._overshoot_started = now
+        if self.stage == OVERSHOOT and \
+                (remaining <= 0 or now - self._overshoot_started >=
+                 self.settings.overshoot_time):
+            self.stage = SETTLE
+        if self.stage == SETTLE:
+            return self.set_point
+        return self.boosted_set_point
+
+
+class GainSchedule:
+    """Tabela de ganhos por setpoint e sentido.
+
+    :param heating: Linhas (temperatura, kp, ki, kd) usadas quando a
+    temperatura está abaixo do setpoint.
+    :param cooling: Linhas usadas quando está acima. Se uma das tabelas
+    estiver vazia, a outra é usada nos dois sentidos.
+    :param deadband: Erro mínimo (°C) para trocar de sentido, evita
+    alternar as tabelas a cada leitura durante o patamar.
+    """
+
+    def __init__(self, heating, cooling, deadband=0.5):
+        heating = sorted(tuple(row) for row in heating)
+        cooling = sorted(tuple(row) for row in cooling)
+        if not heating and not cooling:
+            raise ValueError('A tabela de ganhos está vazia.')
+        self.tables = {HEATING: heating or cooling,
+                       COOLING: cooling or heating}
+        self.deadband = deadband
+
+    @classmethod
+    def from_settings(cls, values: dict, device=None):
+        """GainSchedule de "GAIN_SCHEDULE", ou None se desativado."""
+        values = _device_values(values, device)
+        if not values.get('ENABLED'):
+            return None
+        return cls(values.get('HEATING', []), values.get('COOLING', []),
+                   values.get('DEADBAND_C', 0.5))
+
+    def direction(self, set_point, temperature, previous=HEATING) -> int:
+        error = set_point - temperature
+        if error > self.deadband:
+            return HEATING
+        if error < -self.deadband:
+            return COOLING
+        return previous
+
+    def gains(self, set_point, direction) -> tuple:
+        """Ganhos (kp, ki, kd) interpolados linearmente pelo setpoint.
+        Fora da tabela são usadas as linhas das extremidades.
+        """
+        table = self.tables[direction]
+        index = bisect_left([row[0] for row in table], set_point)
+        if index == 0:
+            return table[0][1:]
+        if index == len(table):
+            return table[-1][1:]
+        (low, *low_gains), (high, *high_gains) = table[index - 1:index + 1]
+        weight = (set_point - low) / (high - low)
+        return tuple(a + (b - a) * weight
+                     for a, b in zip(low_gains, high_gains))
+
+
+def _clamp(value, limits):
+    lower, upper = limits
+    if upper is not None and value > upper:
+        return upper
+    if lower is not None and value < lower:
+        return lower
+    return value
+
+
+class ClockedPID(PID):
+    """simple_pid.PID com o intervalo entre as chamadas medido pelo
+    relógio dado.
+
+    O simple_pid mede o intervalo com time.monotonic(), então com um
+    VirtualClock o termo integral e o derivativo dependiam da velocidade
+    da máquina. As contas são as do simple_pid (e as do
+    onboard.OnboardController), só a origem do tempo muda.
+
+    :param clock: Relógio com time() (ver clock.py).
+    """
+
+    def __init__(self, clock, *args, **kwargs):
+        self.clock = clock  # Usado por reset(), chamado no __init__
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        super().reset()
+        self._last_time = self.clock.time()
+
+    def __call__(self, input_):
+        if not self.auto_mode:
+            return self._last_output
+
+        now = self.clock.time()
+        dt = now - self._last_time or 1e-16
+        if self.sample_time is not None and dt < self.sample_time and \
+                self._last_output is not None:
+            return self._last_output
+
+        error = self.setpoint - input_
+        d_input = input_ - (self._last_input
+                            if self._last_input is not None else input_)
+        if self.proportional_on_measurement:
+            self._proportional -= self.Kp * d_input
+        else:
+            self._proportional = self.Kp * error
+        self._integral = _clamp(self._integral + self.Ki * error * dt,
+                                self.output_limits)
+        self._derivative = -self.Kd * d_input / dt
+        output = _clamp(self._proportional + self._integral +
+                        self._derivative, self.output_limits)
+
+        self._last_output = output
+        self._last_input = input_
+        self._last_time = now
+        return output
+
+
+def switch_gains(pid, gains, output, temperature):
+    """Troca os ganhos de um simple_pid.PID sem salto na saída.
+
+    A integral é reiniciada com o valor que, somado ao novo termo
+    proporcional, reproduz a última saída ("output"). Sem termo integral
+    (ki = 0) esse valor nunca seria descarregado, então a integral é
+    zerada.
+    """
+    kp, ki, _ = gains
+    integral = output - kp * (pid.setpoint - temperature) if ki > 0 else 0
+    pid.auto_mode = False
+    pid.tunings = gains
+    pid.set_auto_mode(True, last_output=integral)
@@ -0,0 +1,279 @@
+"""Gerenciamento de vários Cetus PCR conectados ao mesmo computador.
+
+O DeviceManager testa todas as portas seriais do sistema e mantém uma
+conexão (ArduinoPCR) para cada dispositivo que responder. Os
+experimentos podem então ser atribuídos a um dispositivo específico.
+
+Cada porta é testada em uma thread, todas ao mesmo tempo, então a busca
+leva no máximo o prazo de uma porta (CONNECT_TIMEOUT_S) e não a soma de
+todas. A última porta em que cada dispositivo respondeu é guardada em
+KNOWN_PORTS_PATH e testada mesmo que o sistema não a liste.
+"""
+
+import json
+from threading import Lock, Thread
+
+from serial.tools import list_ports
+
+import constants as std
+from functions import ArduinoPCR, ExperimentPCR
+
+# Evento publicado nos "listeners" quando um dispositivo é encontrado
+DEVICE_ADDED = 'device_added'
+
+
+def load_known_ports(path=None) -> dict:
+    """Última porta de cada dispositivo, {identificação: porta}."""
+    try:
+        with open(path or std.KNOWN_PORTS_PATH) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+class DeviceManager:
+    """Mantém uma conexão para cada Cetus PCR encontrado.
+
+    As alterações de estado de todos os dispositivos são repassadas às
+    funções em "listeners" no formato listener(dispositivo, nome, valor).
+
+    :param baudrate: Velocidade usada em todas as portas.
+    :param timeout: Timeout de leitura de cada porta.
+    :param device_factory: Classe usada para criar as conexões (mesma
+    assinatura de ArduinoPCR).
+    :param known_ports_path: Arquivo com a última porta de cada
+    dispositivo (por padrão KNOWN_PORTS_PATH).
+    """
+
+    def __init__(self, baudrate=9600, timeout=1, device_factory=ArduinoPCR,
+                 known_ports_path=None, **device_kwargs):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.device_factory = device_factory
+        self.known_ports_path = known_ports_path or std.KNOWN_PORTS_PATH
+        self.device_kwargs = device_kwargs
+        self.devices = {}
+        self.listeners = []
+        self.threads = {}
+        self.busy = set()
+        self._probing = set()
+        self._lock = Lock()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.devices.values()))
+
+    def __len__(self):
+        return len(self.devices)
+
+    def candidate_ports(self) -> list:
+        """Últimas portas dos dispositivos conhecidos seguidas das portas
+        seriais do sistema.
+        """
+        known = load_known_ports(self.known_ports_path).values()
+        system = [port.device for port in list_ports.comports()]
+        return list(dict.fromkeys([*known, *system]))
+
+    def discover(self, ports=None) -> list:
+        """Procura dispositivos nas portas ainda não conectadas, todas ao
+        mesmo tempo. Cada dispositivo é registrado (e o evento
+        DEVICE_ADDED publicado) assim que responde.
+
+        :param ports: Portas a serem testadas. Por padrão, as de
+        candidate_ports().
+        :return: Lista com as portas dos dispositivos conectados.
+        """
+        if ports is None:
+            ports = self.candidate_ports()
+        with self._lock:
+            # Portas já conectadas ou em teste por outra busca são puladas
+            ports = [port for port in ports if port not in self._probing
+                     and not (port in self.devices and
+                              self.devices[port].is_connected)]
+            self._probing.update(ports)
+        threads = [Thread(target=self._probe, args=(port,), daemon=True)
+                   for port in ports]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.connected()
+
+    def discover_async(self, ports=None, on_finish=None) -> Thread:
+        """Executa discover() em segundo plano.
+
+        :param on_finish: Função chamada ao final, no formato
+        on_finish(portas conectadas).
+        :return: A thread da busca.
+        """
+        def target():
+            connected = self.discover(ports)
+            if on_finish is not None:
+                on_finish(connected)
+
+        thread = Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _probe(self, port):
+        try:
+            device = self.device_factory(self.baudrate, self.timeout,
+                                         port=port, **self.device_kwargs)
+            if device.is_connected:
+                self.add(device)
+        finally:
+            with self._lock:
+                self._probing.discard(port)
+
+    def add(self, device: ArduinoPCR):
+        """Registra um dispositivo já conectado."""
+        with self._lock:
+            self.devices[device.port_connected] = device
+            self._remember(device)
+        device.listeners.append(
+            lambda name, value: self._publish(device, name, value))
+        self._publish(device, DEVICE_ADDED, device.port_connected)
+
+    def _remember(self, device: ArduinoPCR):
+        """Grava a porta do dispositivo em known_ports_path. Deve ser
+        chamada com o lock adquirido.
+        """
+        known = load_known_ports(self.known_ports_path)
+        if known.get(device.device_id) == device.port_connected:
+            return
+        known[device.device_id] = device.port_connected
+        try:
+            with open(self.known_ports_path, 'w') as file:
+                json.dump(known, file, indent=2)
+        except OSError:
+            pass  # Sem o arquivo a busca apenas não prioriza a porta
+
+    def _publish(self, device, name, value):
+        for listener in self.listeners:
+            listener(device, name, value)
+
+    def connected(self) -> list:
+        with self._lock:
+            return [port for port, device in self.devices.items()
+                    if device.is_connected]
+
+    def get(self, port) -> ArduinoPCR:
+        return self.devices[port]
+
+    def first(self) -> ArduinoPCR:
+        """Primeiro dispositivo conectado, ou None."""
+        for device in self:
+            if device.is_connected:
+                return device
+        return None
+
+    def is_busy(self, port) -> bool:
+        return port in self.busy
+
+    def _reserve(self, port):
+        """Marca a porta como ocupada. A verificação e a marcação são
+        feitas juntas, já que a interface e a fila de execução podem
+        iniciar execuções ao mesmo tempo.
+
+        :raise RuntimeError: Se a porta já estiver ocupada.
+        """
+        with self._lock:
+            if port in self.busy:
+                raise RuntimeError(f'O dispositivo em "{port}" está '
+                                   f'ocupado.')
+            self.busy.add(port)
+
+    def _release(self, port):
+        with self._lock:
+            self.busy.discard(port)
+
+    def run(self, port, experiment: ExperimentPCR, notify=True,
+            cooling=False, on_finish=None) -> Thread:
+        """Executa o experimento no dispositivo da porta dada.
+
+        :param notify: Repassado para ArduinoPCR.run_experiment.
+        :param cooling: Executa a rotina de resfriamento do dispositivo
+        antes do experimento.
+        :param on_finish: Função chamada ao final, no formato
+        on_finish(porta, concluído).
+        :return: A thread que executa o experimento.
+        :raise RuntimeError: Se o dispositivo estiver ocupado.
+        """
+        device = self.devices[port]
+        self._reserve(port)
+        device.experiment = experiment
+        device.is_running = True
+        thread = Thread(target=self._run,
+                        args=(port, device, experiment, notify, cooling,
+                              on_finish))
+        self.threads[port] = thread
+        thread.start()
+        return thread
+
+    def _run(self, port, device: ArduinoPCR, experiment, notify, cooling,
+             on_finish):
+        # Uma exceção na execução não pode deixar a porta ocupada: o
+        # on_finish é chamado com concluído = False e a exceção segue
+        # para a thread.
+        finished = False
+        try:
+            if cooling:
+                device.experiment = device.cooling_experiment
+                device.is_cooling = True
+                device.is_running = True
+                finished = device.run_experiment(notify=False)
+                if not finished or experiment is None:
+                    return
+                finished = False
+            device.experiment = experiment
+            device.is_running = True
+            finished = device.run_experiment(notify)
+        finally:
+            device.is_running = False
+            self._release(port)
+            if on_finish is not None:
+                on_finish(port, finished)
+
+    def cool(self, port, on_finish=None) -> Thread:
+        """Executa apenas a rotina de resfriamento do dispositivo (ver
+        run()).
+        """
+        return self.run(port, None, notify=False, cooling=True,
+                        on_finish=on_finish)
+
+    def autotune(self, port, on_finish=None, **kwargs) -> Thread:
+        """Executa a sintonia automática do PID (ArduinoPCR.autotune) no
+        dispositivo da porta dada.
+
+        :param on_finish: Função chamada ao final, no formato
+        on_finish(porta, ganhos), com ganhos = None se a sintonia falhar.
+        :param kwargs: Repassados para ArduinoPCR.autotune.
+        :return: A thread que executa a sintonia.
+        :raise RuntimeError: Se o dispositivo estiver ocupado.
+        """
+        device = self.devices[port]
+        self._reserve(port)
+        device.is_running = True
+        thread = Thread(target=self._autotune,
+                        args=(port, device, on_finish), kwargs=kwargs)
+        self.threads[port] = thread
+        thread.start()
+        return thread
+
+    def _autotune(self, port, device: ArduinoPCR, on_finish, **kwargs):
+        gains = None  # Sintonia que falhou, como em ArduinoPCR.autotune
+        try:
+            gains = device.autotune(**kwargs)
+        finally:
+            device.is_running = False
+            self._release(port)
+            if on_finish is not None:
+                on_finish(port, gains)
+
+    def close(self):
+        """Encerra todas as conexões."""
+        for device in self:
+            if device.is_connected:
+                device.is_running = False
+                device.is_connected = False
+                device.serial_device.close()
@@ -0,0 +1,359 @@
+"""Previsão do tempo de execução a partir do histórico.
+
+ExperimentPCR.estimated_time somava apenas a duração dos passos, sem as
+rampas entre as temperaturas e sem as extensões dos patamares (tempo
+fora da faixa), então as previsões ficavam bem abaixo do real.
+
+O RuntimeEstimator extrai de cada registro em LOGS_PATH as rampas
+(temperatura inicial, alvo e tempo até entrar na faixa de tolerância) e
+as extensões dos patamares e guarda o resultado em um índice pequeno
+(RUNTIME_INDEX_PATH). Apenas registros novos ou alterados são lidos a
+cada refresh(). Para cada dispositivo e sentido (aquecimento ou
+resfriamento) é ajustado o modelo
+
+    tempo da rampa = atraso + |ΔT| / taxa
+
+por mínimos quadrados. Sem histórico suficiente para o dispositivo são
+usadas as rampas de todos os dispositivos e, sem nenhum histórico, as
+taxas de DEFAULT_RATES.
+
+Durante uma execução as rampas e extensões medidas são adicionadas ao
+modelo (observe_ramp(), observe_extension()), então a previsão do tempo
+restante melhora a cada passo concluído.
+"""
+
+import csv
+import json
+import os
+from threading import Lock
+
+import constants as std
+from control import COOLING, HEATING, HOLD
+from execution import ExecutionPlan, PlanError
+from runlog import CSV_HEADERS, RunLog
+
+INDEX_VERSION = 1
+AMBIENT_C = 25.0  # Temperatura inicial suposta quando não é conhecida
+# °C/s sem histórico, próximas das medidas em "experiment logs/01.csv"
+DEFAULT_RATES = {HEATING: 0.4, COOLING: 0.2}
+MIN_SAMPLES = 3  # Rampas de um dispositivo para usar apenas o histórico dele
+LOG_EXTENSIONS = ('.cetus', '.csv')
+
+
+def read_rows(path: str):
+    """Linhas (tempo, amostra, setpoint, passo) e os metadados de um
+    registro. O passo é None nos registros que não o possuem.
+    """
+    if path.endswith('.cetus'):
+        with RunLog(path) as log:
+            names = [name for name, _ in log.columns]
+            columns = [log.column(name).tolist()
+                       for name in ('time', 'sample', 'setpoint')]
+            steps = log.column('step').tolist() if 'step' in names \
+                else [None] * len(columns[0])
+            return list(zip(*columns, steps)), dict(log.metadata)
+    headers = {header: name for name, header in CSV_HEADERS.items()}
+    headers['Tempo (s)'] = 'time'
+    rows = []
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        names = [headers.get(name, name) for name in next(reader, [])]
+        if not {'time', 'sample', 'setpoint'} <= set(names):
+            return [], {}
+        positions = [names.index(name)
+                     for name in ('time', 'sample', 'setpoint')]
+        step_position = names.index('step') if 'step' in names else None
+        for line in reader:
+            try:
+                row = [float(line[position]) for position in positions]
+                row.append(None if step_position is None
+                           else int(float(line[step_position])))
+            except (IndexError, ValueError):
+                continue
+            rows.append(row)
+    return rows, {}
+
+
+def extract_run(rows, tolerance, durations=None) -> dict:
+    """Rampas e extensões de patamar de uma execução.
+
+    :param rows: Linhas (tempo, amostra, setpoint, passo).
+    :param tolerance: Faixa (°C) que marca o fim da rampa.
+    :param durations: Duração nominal (s) de cada passo, pelo índice.
+    Sem ela as extensões não são calculadas.
+    :return: {'ramps': [[inicial, alvo, segundos], ...],
+    'extensions': [segundos, ...]}.
+    """
+    ramps = []
+    extensions = []
+    set_point = None
+    started = start_temperature = band_time = duration = None
+    for time, temperature, row_set_point, step in rows:
+        if row_set_point != set_point:
+            if band_time is not None and duration is not None:
+                extensions.append(max(0.0, time - band_time - duration))
+            set_point = row_set_point
+            started, start_temperature, band_time = time, temperature, None
+            duration = None
+            if durations is not None and step is not None and \
+                    0 <= step < len(durations):
+                duration = durations[step]
+        if band_time is None and abs(temperature - set_point) < tolerance:
+            band_time = time
+            if abs(set_point - start_temperature) >= tolerance:
+                ramps.append([start_temperature, set_point, time - started])
+    return {'ramps': ramps, 'extensions': extensions}
+
+
+class RampModel:
+    """Tempo de rampa em um sentido: atraso + |ΔT| / taxa.
+
+    :param samples: Rampas [inicial, alvo, segundos] medidas.
+    :param default_rate: Taxa (°C/s) usada sem amostras suficientes.
+    """
+
+    def __init__(self, samples, default_rate):
+        self.delay = 0.0
+        self.seconds_per_degree = 1 / default_rate
+        points = [(abs(end - start), seconds)
+                  for start, end, seconds in samples]
+        if not points:
+            return
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        variance = sum((x - mean_x) ** 2 for x, _ in points)
+        if n >= 2 and variance > 0:
+            slope = sum((x - mean_x) * (y - mean_y)
+                        for x, y in points) / variance
+            if slope > 0:
+                self.seconds_per_degree = slope
+                self.delay = max(0.0, mean_y - slope * mean_x)
+                return
+        # Poucas amostras (ou todas com o mesmo ΔT): apenas a taxa média
+        self.seconds_per_degree = mean_y / mean_x if mean_x else \
+            self.seconds_per_degree
+
+    @property
+    def rate(self) -> float:
+        return 1 / self.seconds_per_degree
+
+    def predict(self, start, end, tolerance=0.0) -> float:
+        delta = abs(end - start)
+        if delta < tolerance:
+            return 0.0
+        return self.delay + delta * self.seconds_per_degree
+
+
+class RuntimeEstimator:
+    """Previsão do tempo total e restante de um experimento.
+
+    :param logs_path: Diretório dos registros.
+    :param index_path: Arquivo JSON do índice.
+    :param tolerance: Faixa (°C) em que a rampa termina.
+    """
+
+    def __init__(self, logs_path=None, index_path=None, tolerance=None):
+        self.logs_path = logs_path or std.LOGS_PATH
+        self.index_path = index_path or std.RUNTIME_INDEX_PATH
+        self.tolerance = std.TOLERANCE if tolerance is None else tolerance
+        self.runs = {}
+        self._live = {}  # Medições da execução atual, por dispositivo
+        self._models = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION and \
+                index.get('tolerance') == self.tolerance:
+            self.runs = index['runs']
+
+    def _save(self):
+        index = {'version': INDEX_VERSION, 'tolerance': self.tolerance,
+                 'runs': self.runs}
+        try:
+            with open(self.index_path, 'w') as file:
+                json.dump(index, file)
+        except OSError:
+            pass  # O índice é apenas um cache
+
+    def refresh(self) -> int:
+        """Indexa os registros novos ou alterados e remove os apagados.
+
+        :return: Número de registros lidos.
+        """
+        try:
+            names = [name for name in os.listdir(self.logs_path)
+                     if name.endswith(LOG_EXTENSIONS)]
+        except FileNotFoundError:
+            names = []
+        with self._lock:
+            changed = 0
+            for name in set(self.runs) - set(names):
+                del self.runs[name]
+                changed += 1
+            for name in names:
+                path = os.path.join(self.logs_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Apagado depois da listagem
+                entry = self.runs.get(name)
+                if entry is not None and entry['mtime'] == stat.st_mtime \
+                        and entry['size'] == stat.st_size:
+                    continue
+                try:
+                    rows, metadata = read_rows(path)
+                    durations = [step[2] for step in metadata['steps']] \
+                        if 'steps' in metadata else None
+                    entry = extract_run(rows, self.tolerance, durations)
+                except Exception:
+                    # Registro ilegível (truncado, cabeçalho inválido...):
+                    # indexado vazio para não ser lido a cada refresh()
+                    metadata = {}
+                    entry = extract_run([], self.tolerance)
+                entry.update(mtime=stat.st_mtime, size=stat.st_size,
+                             device=metadata.get('device') or
+                             metadata.get('port'))
+                self.runs[name] = entry
+                changed += 1
+            if changed:
+                self._models.clear()
+                self._save()
+        return changed
+
+    def observe_ramp(self, device, start, end, seconds):
+        """Adiciona uma rampa medida na execução atual."""
+        with self._lock:
+            self._live.setdefault(device, {'ramps': [], 'extensions': []})[
+                'ramps'].append([start, end, seconds])
+            self._models.pop(device, None)
+
+    def observe_extension(self, device, seconds):
+        """Adiciona o tempo fora da faixa de um patamar concluído."""
+        with self._lock:
+            self._live.setdefault(device, {'ramps': [], 'extensions': []})[
+                'extensions'].append(seconds)
+            self._models.pop(device, None)
+
+    def clear_observations(self, device):
+        """Descarta as medições da execução (já incluídas no registro)."""
+        with self._lock:
+            self._live.pop(device, None)
+            self._models.pop(device, None)
+
+    def models(self, device=None) -> tuple:
+        """Modelos de rampa {sentido: RampModel} e a extensão média (s)
+        de um patamar para o dispositivo (None: todos os dispositivos).
+        """
+        with self._lock:
+            models = self._models.get(device)
+            if models is None:
+                models = self._models[device] = self._fit(device)
+            return models
+
+    def _fit(self, device):
+        entries = list(self.runs.values()) + list(self._live.values())
+        if device is None:  # Dispositivo desconhecido: todo o histórico
+            own = entries
+        else:
+            own = [entry for entry in self.runs.values()
+                   if entry['device'] == device]
+            if device in self._live:
+                own.append(self._live[device])
+        ramps = {HEATING: [], COOLING: []}
+        all_ramps = {HEATING: [], COOLING: []}
+        for group, source in ((ramps, own), (all_ramps, entries)):
+            for entry in source:
+                for ramp in entry['ramps']:
+                    direction = HEATING if ramp[1] > ramp[0] else COOLING
+                    group[direction].append(ramp)
+        ramp_models = {}
+        for direction in (HEATING, COOLING):
+            samples = ramps[direction]
+            if len(samples) < MIN_SAMPLES:
+                samples = all_ramps[direction]
+            ramp_models[direction] = RampModel(samples,
+                                               DEFAULT_RATES[direction])
+        extensions = [value for entry in (own or entries)
+                      for value in entry['extensions']]
+        extension = sum(extensions) / len(extensions) if extensions else 0.
+        return ramp_models, extension
+
+    def _ramp(self, models, start, end) -> float:
+        direction = HEATING if end > start else COOLING
+        return models[direction].predict(start, end, self.tolerance)
+
+    def segments(self, plan: ExecutionPlan, device=None,
+                 start_temperature=None, start=0) -> list:
+        """Segmentos (setpoint, rampa, patamar) em segundos do plano de
+        execução, a partir do segmento "start", incluindo a rampa até a
+        temperatura final.
+        """
+        ramp_models, extension = self.models(device)
+        temperature = AMBIENT_C if start_temperature is None \
+            else start_temperature
+        segments = []
+        for index in range(start, len(plan)):
+            set_point, hold, _, step = plan[index]
+            if step != plan.final_hold_step:
+                hold += extension
+            segments.append((set_point,
+                             self._ramp(ramp_models, temperature,
+                                        set_point), hold))
+            temperature = set_point
+        return segments
+
+    def estimate(self, experiment, device=None,
+                 start_temperature=None) -> float:
+        """Tempo total previsto (s) do experimento (ExperimentPCR ou
+        ExecutionPlan). Um experimento inválido tem duração zero.
+        """
+        if not isinstance(experiment, ExecutionPlan):
+            try:
+                experiment = ExecutionPlan.compile(experiment)
+            except PlanError:
+                return 0.0
+        return sum(ramp + hold for _, ramp, hold in
+                   self.segments(experiment, device, start_temperature))
+
+    def remaining(self, plan: ExecutionPlan, device, index, phase,
+                  phase_elapsed, temperature) -> float:
+        """Tempo restante previsto (s) durante a execução.
+
+        :param index: Segmento atual do plano.
+        :param phase: Fase do segmento atual (control.RAMP ou HOLD).
+        :param phase_elapsed: Tempo (s) decorrido na fase.
+        :param temperature: Temperatura atual da amostra.
+        """
+        ramp_models, extension = self.models(device)
+        set_point, hold, _, step = plan[index]
+        if step == plan.final_hold_step:
+            extension = 0.0
+        if phase == HOLD:
+            current = max(0.0, hold - phase_elapsed)
+        else:
+            current = self._ramp(ramp_models, temperature, set_point) + \
+                hold + extension
+        return current + sum(ramp + hold for _, ramp, hold in
+                             self.segments(plan, device, set_point,
+                                           index + 1))
+
+
+_default = None
+_default_lock = Lock()
+
+
+def default_estimator() -> RuntimeEstimator:
+    """RuntimeEstimator compartilhado, indexado na primeira chamada."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = RuntimeEstimator()
+            _default.refresh()
+        return _default
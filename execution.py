@@ -0,0 +1,178 @@
+"""Plano de execução de um experimento.
+
+O ExperimentPCR guarda os passos como o usuário os definiu, cada um em
+um estágio:
+    -INITIAL: executado uma vez antes dos ciclos (ex.: desnaturação
+    inicial);
+    -CYCLE: bloco repetido "n_cycles" vezes;
+    -FINAL: executado uma vez depois dos ciclos (ex.: extensão final);
+seguidos da temperatura final (final_hold), quando diferente de zero.
+
+Antes de cada execução o experimento é compilado uma única vez
+(ExecutionPlan.compile) em uma sequência plana de segmentos (setpoint,
+patamar, ciclo, passo), validada e guardada em arrays. O laço de
+controle, a previsão do tempo e a janela de acompanhamento leem apenas
+o plano, sem converter os valores digitados a cada iteração.
+
+O ciclo de um segmento é 0 no estágio inicial, de 1 a n_cycles no bloco
+de ciclos e n_cycles + 1 no estágio final. O passo é o índice em
+ExperimentPCR.steps; a temperatura final usa o índice seguinte ao último
+passo (final_hold_step) e termina assim que a temperatura entra na
+faixa de tolerância.
+"""
+
+from array import array
+from typing import NamedTuple
+
+INITIAL, CYCLE, FINAL = 'initial', 'cycle', 'final'
+STAGES = (INITIAL, CYCLE, FINAL)
+
+FINAL_HOLD_NAME = 'Temperatura final'
+TEMPERATURE_LIMITS_C = (4, 99)
+
+
+class PlanError(ValueError):
+    """O experimento não pode ser executado. A mensagem lista os
+    problemas encontrados, um por linha.
+    """
+
+
+class Segment(NamedTuple):
+    set_point: int  # °C
+    hold: int  # s, contados dentro da faixa de tolerância
+    cycle: int
+    step: int
+
+
+class ExecutionPlan:
+    """Sequência de segmentos de um experimento.
+
+    :param name: Nome do experimento.
+    :param n_cycles: Número de ciclos do bloco CYCLE.
+    :param step_names: Nome de cada passo, pelo índice (incluindo a
+    temperatura final).
+    :param stages: Estágio de cada passo, pelo índice.
+    """
+
+    __slots__ = ('name', 'n_cycles', 'step_names', 'stages',
+                 'final_hold_step', 'set_points', 'holds', 'cycles',
+                 'steps')
+
+    def __init__(self, name: str, n_cycles: int, step_names: tuple,
+                 stages: tuple, final_hold_step: int = None):
+        self.name = name
+        self.n_cycles = n_cycles
+        self.step_names = step_names
+        self.stages = stages
+        self.final_hold_step = final_hold_step
+        self.set_points = array('h')
+        self.holds = array('l')
+        self.cycles = array('H')
+        self.steps = array('H')
+
+    @classmethod
+    def compile(cls, experiment) -> 'ExecutionPlan':
+        """Valida o experimento e gera os segmentos.
+
+        :raise PlanError: Se algum valor impede a execução.
+        """
+        steps = experiment.steps
+        low, high = TEMPERATURE_LIMITS_C
+        errors = []
+        for step in steps:
+            if not low <= step.temperature <= high:
+                errors.append(f'Passo "{step.name}": a temperatura deve '
+                              f'estar entre {low} e {high}°C.')
+            if step.duration < 0:
+                errors.append(f'Passo "{step.name}": a duração não pode '
+                              f'ser negativa.')
+            if step.stage not in STAGES:
+                errors.append(f'Passo "{step.name}": estágio '
+                              f'"{step.stage}" desconhecido.')
+        cycled = [index for index, step in enumerate(steps)
+                  if step.stage == CYCLE]
+        if cycled and experiment.n_cycles < 1:
+            errors.append('O número de ciclos deve ser maior que zero.')
+        final_hold = experiment.final_hold
+        if final_hold and not low <= final_hold <= high:
+            errors.append(f'A temperatura final deve estar entre {low} e '
+                          f'{high}°C (ou 0 para não usar).')
+        if not steps:
+            errors.append('O experimento não possui passos.')
+        if errors:
+            raise PlanError('\n'.join(errors))
+
+        n_cycles = experiment.n_cycles if cycled else 0
+        names = tuple(step.name for step in steps)
+        stages = tuple(step.stage for step in steps)
+        final_hold_step = None
+        if final_hold:
+            final_hold_step = len(steps)
+            names += (FINAL_HOLD_NAME,)
+            stages += (FINAL,)
+        plan = cls(experiment.name, n_cycles, names, stages, final_hold_step)
+        for index, step in enumerate(steps):
+            if step.stage == INITIAL:
+                plan._append(step.temperature, step.duration, 0, index)
+        for cycle in range(1, n_cycles + 1):
+            for index in cycled:
+                plan._append(steps[index].temperature,
+                             steps[index].duration, cycle, index)
+        for index, step in enumerate(steps):
+            if step.stage == FINAL:
+                plan._append(step.temperature, step.duration,
+                             n_cycles + 1, index)
+        if final_hold_step is not None:
+            plan._append(final_hold, 0, n_cycles + 1, final_hold_step)
+        return plan
+
+    def _append(self, set_point, hold, cycle, step):
+        self.set_points.append(set_point)
+        self.holds.append(hold)
+        self.cycles.append(cycle)
+        self.steps.append(step)
+
+    def __len__(self):
+        return len(self.set_points)
+
+    def __getitem__(self, index) -> Segment:
+        return Segment(self.set_points[index], self.holds[index],
+                       self.cycles[index], self.steps[index])
+
+    def __iter__(self):
+        return map(Segment, self.set_points, self.holds, self.cycles,
+                   self.steps)
+
+    @property
+    def total_hold(self) -> int:
+        """Soma (s) dos patamares, sem as rampas."""
+        return sum(self.holds)
+
+    def stage(self, index) -> str:
+        """Estágio do segmento."""
+        return self.stages[self.steps[index]]
+
+    def is_cycled(self, cycle) -> bool:
+        """Verifica se o ciclo dado pertence ao bloco de ciclos."""
+        return 1 <= cycle <= self.n_cycles
+
+    def device_profile(self, max_steps) -> tuple:
+        """Perfil (n_cycles, [(setpoint, patamar), ...]) para o controle
+        no dispositivo, que só executa um bloco de passos repetido.
+
+        Um plano apenas com o bloco de ciclos é enviado como tal; com os
+        outros estágios ele é enviado como um único ciclo com todos os
+        segmentos, se couber em "max_steps".
+
+        :return: O perfil, ou None se o plano não cabe no dispositivo.
+        No segmento do perfil (ciclo c, passo p) o índice no plano é
+        (c - 1) * len(passos) + p.
+        """
+        if len(self) and all(self.is_cycled(cycle) for cycle in self.cycles):
+            per_cycle = len(self) // self.n_cycles
+            if per_cycle <= max_steps:
+                return self.n_cycles, list(zip(self.set_points[:per_cycle],
+                                               self.holds[:per_cycle]))
+        if len(self) <= max_steps:
+            return 1, list(zip(self.set_points, self.holds))
+        return None
@@ -1,36 +1,84 @@
-from datetime import datetime
 import pickle
 from threading import Thread
-from time import sleep, time
-from tkinter import simpledialog, messagebox
+from time import monotonic, perf_counter
+from typing import NamedTuple
 
 import serial  # Listado como pyserial em requirements.txt
 from serial.tools import list_ports
-from simple_pid import PID
+from serial.tools.list_ports_common import ListPortInfo
 
 import constants as std
+from autotune import RelayAutotuner, load_gains, save_gains
+from clock import SystemClock
+from estimator import default_estimator
+from execution import CYCLE, ExecutionPlan, PlanError
+from history import CANCELLED, COMPLETED, default_history
+from metrics import RunMetrics, find_baseline, metrics_path
+
+from codec import FrameReader, encode_peltier, encode_run, encode_stream, \
+    negotiate
+from control import CONTROL_PERIOD, HEATING, HOLD, RAMP, ClockedPID, \
+    FastRamp, FastRampSettings, FixedRateTicker, GainSchedule, StepTimer, \
+    switch_gains
+from onboard import FINISHED, MAX_STEPS, RUNNING, profile_frames
+from protocol import Cooling, CoolingFinished, Heating, LidTemperature, \
+    LineReader, NextCommand, Progress, READY, Reading, Rejected, \
+    SampleTemperature, parse_line
+from telemetry import TelemetryLogger
 
 experiments = []
 
-experiment_data_x = []
-experiment_data_y = []
-experiment_data_setpoint = []
+# Eventos publicados pelo ArduinoPCR além dos atributos em published_fields
+NOTICE = 'notice'  # Notice para ser exibido ao usuário
+RUN_STARTED = 'run_started'  # ExecutionPlan da execução
+RUN_FINISHED = 'run_finished'  # history.COMPLETED ou CANCELLED
+
+INFO, ERROR = 'info', 'error'
+
+
+def as_int(value, field: str) -> int:
+    """Converte o valor digitado em um campo para inteiro. Um campo vazio
+    vale zero.
+
+    :raise ValueError: Se o valor não é um número.
+    """
+    if value is None or value == '':
+        return 0
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f'{field}: "{value}" não é um número.') from None
+
 
 class ExperimentPCR:
     """Um objeto que contêm todas as informações de temperatura e tempo dos
     processos.
-    Esses objetos são salvos na lista "experiments" e posteriormente
-    carregados em um arquivo externo usando o módulo pickle.
+    Esses objetos são gravados no banco de experimentos (ver
+    repository.py), que os carrega como repository.StoredExperiment.
 
     Os objetos salvos fornecidos a "steps" devem ser obrigatoriamente da
-    classe StepPCR.
+    classe StepPCR. Antes da execução o experimento é compilado em um
+    ExecutionPlan (ver execution.py).
+
+    :param n_cycles: Repetições dos passos do estágio CYCLE.
+    :param final_hold: Temperatura final (°C), 0 para não usar.
     """
 
+    __slots__ = ('name', 'n_cycles', 'final_hold', 'steps')
+
     def __init__(self, name: str, n_cycles=0, final_hold=0, *steps):
-        self.name = name.capitalize()
-        self.n_cycles = n_cycles
-        self.final_hold = final_hold
-        self.steps = list(steps)
+        self.name: str = name.capitalize()
+        self.n_cycles: int = as_int(n_cycles, 'Nº de ciclos')
+        self.final_hold: int = as_int(final_hold, 'Temperatura final')
+        self.steps: list = list(steps)
+
+    def __setstate__(self, state):
+        # Experimentos gravados antes de __slots__ têm o estado em um
+        # dicionário, com os valores como foram digitados.
+        if isinstance(state, tuple):
+            state = state[1]
+        ExperimentPCR.__init__(self, state['name'], state['n_cycles'],
+                               state['final_hold'], *state['steps'])
 
     def __str__(self):
         str_steps = ''
@@ -48,138 +96,685 @@ class ExperimentPCR:
 
     @property
     def estimated_time(self):
-        value = 0
-        for step in self.steps:
-            value += int(step.duration)
-        value *= int(self.n_cycles)
-        return value
+        """Tempo total previsto (s), com as rampas e extensões dos
+        patamares medidas nas execuções anteriores (ver estimator.py).
+        """
+        return default_estimator().estimate(self)
 
 
 class StepPCR:
-    def __init__(self, name, temp, duration):
-        self.name = name
-        self.temperature = temp
-        self.duration = duration
+    """Um passo do experimento.
+
+    :param temp: Temperatura (°C).
+    :param duration: Tempo (s) contado dentro da faixa de tolerância.
+    :param stage: Estágio do passo (execution.INITIAL, CYCLE ou FINAL).
+    """
+
+    __slots__ = ('name', 'temperature', 'duration', 'stage')
+
+    def __init__(self, name, temp, duration, stage=CYCLE):
+        self.name: str = name
+        self.temperature: int = as_int(temp, f'Temperatura de "{name}"')
+        self.duration: int = as_int(duration, f'Duração de "{name}"')
+        self.stage: str = stage
+
+    def __setstate__(self, state):
+        # Ver ExperimentPCR.__setstate__
+        if isinstance(state, tuple):
+            state = state[1]
+        StepPCR.__init__(self, state['name'], state['temperature'],
+                         state['duration'], state.get('stage', CYCLE))
 
     def __repr__(self):
-        return f'StepPCR({self.name}, {self.temperature}, {self.duration})'
+        return f'StepPCR({self.name}, {self.temperature}, {self.duration}, ' \
+               f'{self.stage})'
 
     def __str__(self):
         return f'Passo de PCR "{self.name}": ' \
                f'{self.temperature}°C, {self.duration}s'
 
 
-class ArduinoPCR:
-    """Classe com protocolos para comunicação serial."""
+class Notice(NamedTuple):
+    """Aviso para o usuário (conclusão, cancelamento, erros)."""
+    level: str  # INFO ou ERROR
+    title: str
+    message: str
+
+
+class Observable:
+    """Classe base para objetos que notificam alterações de estado.
+
+    Toda alteração em um dos atributos de "published_fields" é enviada
+    para as funções em "listeners" no formato listener(nome, valor). As
+    funções são chamadas na thread que fez a alteração.
+    """
+
+    published_fields = frozenset()
 
-    def __init__(self, baudrate, timeout=1, experiment: ExperimentPCR = None):
+    def __init__(self):
+        self.listeners = []
+
+    def __setattr__(self, name, value):
+        changed = name in self.published_fields and \
+                  self.__dict__.get(name, value) != value
+        super().__setattr__(name, value)
+        if changed:
+            self.emit(name, value)
+
+    def emit(self, name, value):
+        """Envia um evento para as funções em "listeners"."""
+        for listener in self.listeners:
+            listener(name, value)
+
+
+def create_pid(gains=None, clock=None) -> ClockedPID:
+    """PID com os ganhos dados, ou com os definidos em settings.json.
+
+    :param gains: Tupla (kp, ki, kd), ex.: autotune.load_gains().
+    :param clock: Relógio usado no cálculo do intervalo entre as
+    chamadas (padrão: SystemClock).
+    """
+    kp, ki, kd = gains or (std.KP, std.KI, std.KD)
+    return ClockedPID(clock or SystemClock(),
+                      Kp=kp,
+                      Ki=ki,
+                      Kd=kd,
+                      output_limits=(-255, 255), sample_time=0)
+
+
+def peltier_command(output) -> str:
+    """Converte a saída do PID no comando <peltier estado pwm>."""
+    if output >= 0:
+        return f'<peltier 0 {int(output)}>'
+    return f'<peltier 1 {abs(int(output))}>'
+
+
+def create_run_logger(experiment: ExperimentPCR, port, clock, device=None,
+                      plan: ExecutionPlan = None, on_error=None):
+    """Cria o TelemetryLogger de uma nova execução do experimento.
+
+    :param device: Identificação do dispositivo (ArduinoPCR.device_id).
+    :param plan: Plano da execução. Por padrão, o experimento é
+    compilado.
+    :param on_error: Ver TelemetryLogger.
+    """
+    plan = plan or ExecutionPlan.compile(experiment)
+    started_at = clock.now()
+    file_path = f'{std.LOGS_PATH}/{experiment.name} - ' \
+                f'{started_at:%d%m%y%H%M%S}'
+    metadata = {'experiment': experiment.name,
+                'port': port,
+                'device': device,
+                'started': started_at.isoformat(),
+                'n_cycles': experiment.n_cycles,
+                'final_hold': experiment.final_hold,
+                'steps': [[step.name, step.temperature, step.duration,
+                           step.stage]
+                          for step in experiment.steps],
+                'segments': [list(segment) for segment in plan]}
+    return TelemetryLogger.create(file_path, std.LOG_FORMAT, metadata,
+                                  clock=clock, on_error=on_error)
+
+
+class ArduinoPCR(Observable):
+    """Classe com protocolos para comunicação serial.
+
+    Nenhuma janela é aberta por esta classe: o andamento da execução é
+    publicado nos "listeners" (atributos de published_fields e os eventos
+    RUN_STARTED, RUN_FINISHED e NOTICE), e cada interface decide como
+    exibi-lo (ver interface.py e cli.py).
+
+    :param port: Porta a ser usada na conexão. Se não for fornecida, todas
+    as portas do sistema são testadas.
+    :param serial_factory: Função usada para abrir a porta, com a mesma
+    assinatura de serial.serial_for_url (permite usar o simulador).
+    :param clock: Relógio usado pelo laço de controle, pela contagem do
+    tempo de cada passo e pelos registros do experimento.
+    :param auto_connect: Se falso, a conexão só é feita ao chamar
+    initialize_connection().
+    """
+
+    published_fields = frozenset({'is_connected', 'is_running', 'is_cooling',
+                                  'current_sample_temperature',
+                                  'current_lid_temperature', 'current_step',
+                                  'current_step_temp', 'current_cycle',
+                                  'current_segment', 'elapsed_time',
+                                  'remaining_time',
+                                  'current_phase', 'phase_elapsed',
+                                  'phase_eta'})
+
+    def __init__(self, baudrate, timeout=1, experiment: ExperimentPCR = None,
+                 port=None, serial_factory=serial.serial_for_url,
+                 clock=None, auto_connect=True):
+        super().__init__()
+        self.clock = clock or SystemClock()
         self.timeout = timeout
         self.baudrate = baudrate
+        self.port = port
+        self.serial_factory = serial_factory
         self.experiment: ExperimentPCR = experiment
-        self.cooling_experiment = ExperimentPCR('Resfriamento', 1, 25,
+        self.plan: ExecutionPlan = None  # Compilado em run_experiment()
+        self.cooling_experiment = ExperimentPCR('Resfriamento', 1, 0,
                                                 StepPCR('1',
                                                         std.COOLING_TEMP_C,
                                                         5))
-        self.pid = PID(Kp=std.KP,
-                       Ki=std.KI,
-                       Kd=std.KD,
-                       output_limits=(-255, 255), sample_time=0)
+        self.pid = create_pid(clock=self.clock)
         # print(self.pid.tunings)
+        self.gain_schedule: GainSchedule = None
+        self.gain_direction = HEATING
 
         # Conferir com o nome no Gerenciador de dispositivos do windows
         # caso esteja usando um arduino diferente.
         self.device_type = ''
 
         self.port_connected = None
+        # Número de série USB (ou a porta), identifica os ganhos gravados
+        self.device_id = None
         self.serial_device: serial.Serial = None
         self.is_connected = False
-        self.waiting_update = False
+        self.is_binary = False
+        self.is_streaming = False
         self.monitor_thread = None
 
         self.is_running = False
         self.is_waiting = True
         self.current_sample_temperature = 0
         self.current_lid_temperature = 0
+        self.reading_timestamp = 0  # ms, relógio do firmware
+        self.progress: Progress = None
+        self.is_rejected = False
+
+        # Medições do laço de controle (ver metrics.py)
+        self.metrics = RunMetrics(std.INSTRUMENTATION)
+        self.command_sent_at = None
+        self.last_iteration = None
         self.current_step = ''
         self.current_step_temp = 0
         self.current_cycle = 0
+        self.current_segment = 0  # Índice em self.plan
+        self.current_phase = RAMP
+        self.phase_elapsed = 0
+        self.phase_eta = None
+        self.output = 0
 
         self.elapsed_time = 0
+        self.remaining_time = 0  # s, previsto pelo estimator
+        self.estimator = None
 
         self.is_cooling = False
 
-        self.reading = ''
+        # Tipo da mensagem recebida -> método que a processa
+        self.message_handlers = {
+            SampleTemperature: self.on_sample_temperature,
+            LidTemperature: self.on_lid_temperature,
+            Reading: self.on_reading,
+            Progress: self.on_progress,
+            Rejected: self.on_rejected,
+            NextCommand: self.on_next_command,
+            CoolingFinished: self.on_cooling_finished,
+            Heating: self.on_peltier_output,
+            Cooling: self.on_peltier_output,
+        }
+
+        if auto_connect:
+            self.initialize_connection()
+
+    def run_experiment(self, notify=True) -> bool:
+        """Executa self.experiment no dispositivo.
+
+        :param notify: Se verdadeiro, publica um aviso (NOTICE) ao final ou
+        no cancelamento do experimento.
+        :return: False caso o experimento tenha sido cancelado ou seja
+        inválido (ver execution.PlanError).
+        """
+        try:
+            self.plan = ExecutionPlan.compile(self.experiment)
+        except PlanError as error:
+            self.is_running = False
+            if notify:
+                self.notify_user(str(error), level=ERROR)
+            return False
+        self.clock.sleep(1)
+        started_time = self.clock.time()
+        self.metrics.reset()
+        self.last_iteration = None
+        self.estimator = default_estimator()
+        self.remaining_time = int(self.estimator.estimate(
+            self.plan, self.device_id, self.current_sample_temperature))
+        self.elapsed_time = 0
+
+        # Planos que não cabem no perfil do firmware usam o laço do
+        # computador
+        on_device = self.uses_onboard_control and \
+            self.plan.device_profile(MAX_STEPS) is not None
+        fast_ramp = FastRampSettings.from_settings(std.FAST_RAMP,
+                                                   self.device_id)
+        # A rampa rápida só é feita pelo laço do computador
+        is_fast_ramp = fast_ramp.enabled and not on_device
+        self.metrics.info['fast_ramp'] = is_fast_ramp
+        self.metrics.info['gain_schedule'] = \
+            self.gain_schedule is not None and not on_device
+        self.metrics.info['control_mode'] = 'device' if on_device else 'host'
+        self.emit(RUN_STARTED, self.plan)
+
+        logger = create_run_logger(self.experiment, self.port_connected,
+                                   self.clock, self.device_id, self.plan,
+                                   on_error=self.on_log_error)
+        try:
+            with logger:
+                if on_device:
+                    finished = self.execute_on_device(started_time, logger,
+                                                      notify)
+                else:
+                    finished = self.execute_cycles(started_time, logger,
+                                                   notify, fast_ramp)
+        except Exception as error:
+            if error is not logger.error:
+                # A pastilha não pode ficar ligada com o laço interrompido
+                self.stop_device(on_device)
+                self.is_running = False
+                self.emit(RUN_FINISHED, CANCELLED)
+                raise
+            # Falha no registro, já avisada por on_log_error(): a execução
+            # continuou sem ele.
+        # O registro da execução passa a fazer parte do histórico
+        status = COMPLETED if finished else CANCELLED
+        self.estimator.clear_observations(self.device_id)
+        self.estimator.refresh()
+        default_history().record(logger.path, status)
+        reduction = None
+        if self.metrics.enabled:
+            baseline = None
+            if is_fast_ramp:
+                # Última execução do mesmo experimento sem a rampa rápida
+                baseline = find_baseline(std.LOGS_PATH, self.experiment.name,
+                                         fast_ramp=False,
+                                         control_mode='host')
+            self.metrics.info['status'] = status
+            summary = self.metrics.save(metrics_path(logger.path),
+                                        self.experiment, baseline)
+            reduction = summary.get('cycle_time_reduction')
+        self.emit(RUN_FINISHED, status)
+        if not finished:
+            return False
 
-        self.initialize_connection()
+        self.is_cooling = False
+        print(f'Finish time: {self.clock.time() - started_time}')
+        if notify:
+            message = f'"{self.experiment.name}" concluído.'
+            if reduction is not None:
+                message += f'\nRampa rápida: ciclo ' \
+                           f'{reduction["reduction_s"]:.1f}s ' \
+                           f'({reduction["reduction_pct"]:.0f}%) mais ' \
+                           f'curto que na última execução sem ela.'
+            self.notify_user(message)
+        return True
 
-    def run_experiment(self):
-        sleep(1)
-        started_time = time()
-        self.elapsed_time = 0
-        for step in self.experiment.steps:
-            self.elapsed_time += int(step.duration)
-        self.elapsed_time *= self.experiment.n_cycles
-
-        for i in range(int(self.experiment.n_cycles)):
-            self.current_cycle = i + 1
-            for step in self.experiment.steps:
-                self.pid.reset()
-                started_step_time = time()
-                self.current_step = step.name
-                self.current_step_temp = step.temperature
-                set_point = int(step.temperature)
-                duration = int(step.duration)
-                self.pid.setpoint = set_point
-
-                current_time = time()
-                while current_time - started_step_time <= duration:
-                    if self.is_waiting:
-                        if not self.is_running:
-                            # print('Experiment Cancelled')
-                            messagebox.showinfo('Cetus PCR',
-                                                'O experimento foi '
-                                                'cancelado.')
-                            self.serial_device.write(b'<peltier 0 0>')
-                            self.is_waiting = False
-                            return
+    def execute_cycles(self, started_time, logger: TelemetryLogger,
+                       notify=True, fast_ramp: FastRampSettings = None) \
+            -> bool:
+        """Laço de controle do experimento, segmento a segmento de
+        self.plan.
 
-                        output = self.pid(self.current_sample_temperature)
-                        print(f'output= {output}')
-                        # print(self.current_sample_temperature)
-                        if output >= 0:
-                            new_str = f'<peltier 0 {int(output)}>'
-                        elif output < 0:
-                            new_str = f'<peltier 1 {abs(int(output))}>'
-                        self.serial_device.write(b'%a\r\n' % new_str)
+        :param fast_ramp: Parâmetros da rampa rápida (ver control.py).
+        :return: False caso o experimento tenha sido cancelado.
+        """
+        fast_ramp = fast_ramp or FastRampSettings()
+        plan = self.plan
+        ticker = FixedRateTicker(self.clock, CONTROL_PERIOD)
+        previous_cycle = cycle_started = None
+        for index, (set_point, hold, cycle, step_index) in enumerate(plan):
+            if cycle != previous_cycle:
+                if cycle_started is not None:
+                    self.metrics.add_cycle(self.clock.time() - cycle_started)
+                cycle_started = self.clock.time() \
+                    if plan.is_cycled(cycle) else None
+                previous_cycle = cycle
+            self.current_cycle = cycle
+            self.current_segment = index
+            self.pid.reset()
+            self.current_step = plan.step_names[step_index]
+            self.current_step_temp = set_point
+            self.pid.setpoint = set_point
+            self.update_gains(self.current_sample_temperature,
+                              bumpless=False)
+            timer = StepTimer(set_point, hold,
+                              std.TOLERANCE, std.HOLD_HYSTERESIS,
+                              self.clock.time(),
+                              self.current_sample_temperature)
+            ramp = FastRamp.create(fast_ramp, set_point,
+                                   self.current_sample_temperature)
+
+            while not timer.is_done:
+                current_time = ticker.wait()
+                self.mark_iteration(ticker)
+                # Com o envio periódico de leituras não é necessário
+                # aguardar o "nextpls" de cada comando.
+                if self.is_waiting or self.is_streaming:
+                    if not self.is_running:
+                        # print('Experiment Cancelled')
+                        if notify:
+                            self.notify_user('O experimento foi '
+                                             'cancelado.')
+                        self.write_command(self.encode_command(0))
                         self.is_waiting = False
-                        self.elapsed_time = int(time() - started_time)
+                        return False
+
+                    if ramp is not None:
+                        self.pid.setpoint = ramp.update(
+                            current_time,
+                            self.current_sample_temperature)
+                    if ramp is not None and ramp.output is not None:
+                        # Saída imposta pela rampa: o PID fica em modo
+                        # manual para não acumular a integral.
+                        self.pid.auto_mode = False
+                        output = ramp.output
+                    else:
+                        if not self.pid.auto_mode:
+                            self.resume_pid(self.current_sample_temperature)
+                        self.update_gains(self.current_sample_temperature)
+                        output = self.pid(self.current_sample_temperature)
+                    self.output = int(output)
+                    print(f'output= {output}')
+                    # print(self.current_sample_temperature)
+                    # Limpa a flag antes de escrever para não perder um
+                    # "nextpls" que chegue antes do fim do write().
+                    self.is_waiting = False
+                    self.write_command(self.encode_command(output))
+                    self.elapsed_time = int(self.clock.time() -
+                                            started_time)
 
-                    if not set_point - std.TOLERANCE < \
-                            self.current_sample_temperature < \
-                            set_point + std.TOLERANCE:
-                        # Delay para atingir a temperatura desejada
-                        difference = time() - current_time
-                        duration += difference
-                        # print(duration)
+                else:
+                    self.metrics.count('waiting_iterations')
+
+                previous_phase = timer.phase
+                timer.update(current_time,
+                             self.current_sample_temperature)
+                if previous_phase == RAMP and timer.phase == HOLD and \
+                        abs(set_point - timer.start_temperature) >= \
+                        std.TOLERANCE:
+                    self.estimator.observe_ramp(self.device_id,
+                                                timer.start_temperature,
+                                                set_point,
+                                                timer.ramp_elapsed)
+                self.update_remaining(index, timer.phase,
+                                      timer.phase_elapsed)
+                self.set_phase(timer.phase, timer.phase_elapsed,
+                               timer.phase_eta)
+
+                logger.log(current_time - started_time,
+                           self.current_sample_temperature,
+                           set_point,
+                           self.current_lid_temperature,
+                           self.output,
+                           self.current_cycle,
+                           step_index)
+
+            if step_index != plan.final_hold_step:
+                self.estimator.observe_extension(self.device_id,
+                                                 timer.out_of_band)
+            self.metrics.add_phase(step_index, False, timer.ramp_elapsed)
+            self.metrics.add_phase(step_index, True,
+                                   timer.hold_elapsed +
+                                   timer.out_of_band)
+        if cycle_started is not None:
+            self.metrics.add_cycle(self.clock.time() - cycle_started)
+        return True
 
-                    experiment_data_x.append(current_time - started_time)
-                    experiment_data_y.append(self.current_sample_temperature)
-                    experiment_data_setpoint.append(self.pid.setpoint)
+    def update_gains(self, temperature, bumpless=True):
+        """Aplica os ganhos da tabela (self.gain_schedule) para o setpoint
+        atual e o sentido em que a temperatura precisa ir.
 
-                    current_time = time()
-                    sleep(0.1)
+        :param bumpless: Se verdadeiro, a troca preserva a última saída
+        (ver control.switch_gains). No início de um passo o PID acabou
+        de ser reiniciado e os ganhos são apenas substituídos.
+        """
+        schedule = self.gain_schedule
+        if schedule is None:
+            return
+        self.gain_direction = schedule.direction(self.pid.setpoint,
+                                                 temperature,
+                                                 self.gain_direction)
+        gains = schedule.gains(self.pid.setpoint, self.gain_direction)
+        if gains == tuple(self.pid.tunings):
+            return
+        self.metrics.count('gain_switches')
+        if bumpless:
+            switch_gains(self.pid, gains, self.output, temperature)
+        else:
+            self.pid.tunings = gains
+
+    def resume_pid(self, temperature):
+        """Devolve o controle ao PID depois do PWM imposto pela rampa
+        rápida (ver control.FastRamp).
+
+        A integral parte de zero: semeá-la com a última saída, o PWM
+        máximo da rampa, reproduziria o acúmulo que o modo manual evita e
+        aumentaria o sobressinal.
+        """
+        self.update_gains(temperature, bumpless=False)
+        self.pid.set_auto_mode(True, last_output=0)
 
-        self.is_cooling = False
-        print(f'Finish time: {time() - started_time}')
-        file_path = f'{self.experiment.name} - {datetime.now():%d%m%y%H%M%S}'
-        with open(f'experiment logs/{file_path}.csv', 'w') as outfile:
-            outfile.write('X,Y,Set Point\n')
-            for x, y, sp in zip(experiment_data_x, experiment_data_y,
-                                experiment_data_setpoint):
-                outfile.write(f'{x},{y},{sp}\n')
+    def autotune(self, set_point=None, rule=None, notify=True) -> tuple:
+        """Sintonia do PID por realimentação a relé (ver autotune.py).
+
+        Os ganhos calculados são gravados para este dispositivo e passam
+        a ser usados imediatamente.
+
+        :param set_point: Temperatura (°C) da oscilação. Por padrão,
+        "SET_POINT_C" de AUTOTUNE em settings.json.
+        :param rule: Regra de autotune.RULES. Por padrão, "RULE".
+        :param notify: Se verdadeiro, mostra o resultado ao usuário.
+        :return: Os ganhos (kp, ki, kd), ou None se a sintonia foi
+        cancelada ou falhou.
+        """
+        settings = std.AUTOTUNE
+        set_point = settings['SET_POINT_C'] if set_point is None \
+            else set_point
+        rule = rule or settings['RULE']
+        tuner = RelayAutotuner(set_point, settings['AMPLITUDE'],
+                               settings['BIAS'], settings['HYSTERESIS_C'],
+                               settings['CYCLES'])
+        self.current_step = 'Sintonia'
+        self.current_step_temp = set_point
+        started = self.clock.time()
+        ticker = FixedRateTicker(self.clock, CONTROL_PERIOD)
+        error = None
+        while not tuner.is_done:
+            now = ticker.wait()
+            if not self.is_running:
+                error = 'A sintonia foi cancelada.'
+                break
+            if now - started > settings['MAX_TIME_S']:
+                error = 'Não foi possível obter uma oscilação estável ' \
+                        'no tempo máximo da sintonia.'
+                break
+            if self.is_waiting or self.is_streaming:
+                self.is_waiting = False
+                self.output = tuner.update(now,
+                                           self.current_sample_temperature)
+                self.write_command(self.encode_command(self.output))
+        self.output = 0
+        self.write_command(self.encode_command(0))
+
+        gains = None
+        if error is None:
+            try:
+                ultimate_gain, period = tuner.result()
+                gains = tuner.gains(rule)
+            except ValueError as exception:
+                error = str(exception)
+        if gains is not None:
+            save_gains(self.device_id, gains, rule=rule, Ku=ultimate_gain,
+                       Tu=period, set_point=set_point)
+            self.pid = create_pid(gains, self.clock)
+        if notify:
+            if gains is None:
+                self.notify_user(error, level=ERROR)
+            else:
+                self.notify_user('Sintonia concluída.\n'
+                                 'Kp = {:.3g}\nKi = {:.3g}\n'
+                                 'Kd = {:.3g}'.format(*gains))
+        return gains
+
+    def notify_user(self, message, title='Cetus PCR', level=INFO):
+        """Publica um aviso para o usuário (evento NOTICE).
+
+        Sem nenhuma função inscrita o aviso é apenas impresso.
+        """
+        if not self.listeners:
+            print(f'{title}: {message}')
+        self.emit(NOTICE, Notice(level, title, message))
+
+    def update_remaining(self, index, phase, phase_elapsed):
+        """Atualiza o tempo restante previsto da execução.
+
+        :param index: Segmento atual de self.plan.
+        """
+        self.remaining_time = int(self.estimator.remaining(
+            self.plan, self.device_id, index, phase, phase_elapsed,
+            self.current_sample_temperature))
+
+    def set_phase(self, phase, elapsed, eta):
+        """Publica a fase do passo atual (rampa ou patamar), o tempo
+        decorrido e o tempo restante estimado da fase, em segundos
+        inteiros.
+        """
+        self.current_phase = phase
+        self.phase_elapsed = int(elapsed)
+        self.phase_eta = None if eta is None else int(eta + 0.5)
+
+    def on_log_error(self, error):
+        """Aviso de falha na gravação do registro (thread de escrita)."""
+        self.notify_user(f'Falha ao gravar o registro do experimento: '
+                         f'{error}. O experimento continua sem registro.',
+                         level=ERROR)
+
+    def stop_device(self, on_device=False):
+        """Desliga a pastilha (e o laço do firmware, se "on_device"),
+        ignorando falhas da porta.
+        """
+        if not self.is_connected:
+            return
+        try:
+            if on_device:
+                self.write_command(encode_run(False))
+            self.write_command(self.encode_command(0))
+        except (serial.SerialException, OSError):
+            pass
+
+    def write_command(self, command: bytes):
+        """Envia um comando, registrando o instante para as medições."""
+        self.command_sent_at = self.clock.time()
+        self.metrics.count('commands_sent')
+        self.serial_device.write(command)
+
+    def mark_iteration(self, ticker: FixedRateTicker):
+        """Registra o período de cada iteração do laço de controle e o
+        atraso em relação ao instante programado.
+        """
+        now = self.clock.time()
+        if self.last_iteration is not None:
+            self.metrics.record('loop_period', now - self.last_iteration)
+        self.last_iteration = now
+        self.metrics.record('sleep_drift', ticker.lateness)
+        self.metrics.count('iterations')
 
-        messagebox.showinfo('Cetus PCR', f'"{self.experiment.name}" '
-                                         f'concluído.')
+    @property
+    def uses_onboard_control(self) -> bool:
+        """O PID roda no dispositivo (requer o protocolo binário)."""
+        return std.CONTROL_MODE == 'device' and self.is_binary
+
+    def send_command(self, command: bytes, timeout=2.0) -> bool:
+        """Envia um comando e aguarda a confirmação do dispositivo.
+
+        :return: False se o comando foi recusado ou não houve resposta.
+        """
+        self.is_rejected = False
+        self.is_waiting = False
+        self.write_command(command)
+        deadline = self.clock.time() + timeout
+        while not self.is_waiting:
+            if self.clock.time() > deadline or not self.is_connected:
+                return False
+            self.clock.sleep(0.01)
+        return not self.is_rejected
+
+    def execute_on_device(self, started_time, logger: TelemetryLogger,
+                          notify=True) -> bool:
+        """Envia o perfil ao dispositivo e acompanha a execução.
+
+        O laço PID roda no firmware (ver onboard.py); aqui apenas as
+        leituras e o andamento recebidos são exibidos e registrados.
+
+        :return: False caso o experimento tenha sido cancelado.
+        """
+        plan = self.plan
+        n_cycles, profile = plan.device_profile(MAX_STEPS)
+        frames = profile_frames(n_cycles, profile, self.pid.tunings,
+                                std.TOLERANCE)
+        self.progress = None
+        for frame in frames + [encode_run(True)]:
+            if not self.send_command(frame):
+                if notify:
+                    self.notify_user('O dispositivo recusou o perfil do '
+                                     'experimento.', level=ERROR)
+                self.is_running = False
+                return False
+
+        _, _, self.current_cycle, step_index = plan[0]
+        self.current_segment = 0
+        self.current_step = plan.step_names[step_index]
+        self.current_step_temp = plan.set_points[0]
+        last_progress = self.clock.time()
+        ticker = FixedRateTicker(self.clock, CONTROL_PERIOD)
+        while True:
+            ticker.wait()
+            if not self.is_running or \
+                    self.clock.time() - last_progress > 5:
+                # Cancelado pelo usuário ou sem notícias do dispositivo
+                if self.is_connected:
+                    self.send_command(encode_run(False))
+                if notify:
+                    self.notify_user('O experimento foi cancelado.')
+                return False
+
+            progress = self.progress
+            if progress is not None:
+                self.progress = None
+                last_progress = self.clock.time()
+                # Posição no perfil -> segmento do plano
+                index = min(len(plan) - 1, (progress.cycle - 1) *
+                            len(profile) + progress.step)
+                set_point, hold, cycle, step_index = plan[index]
+                self.current_segment = index
+                self.current_cycle = cycle
+                self.current_step = plan.step_names[step_index]
+                self.current_step_temp = set_point
+                self.output = progress.output
+                # O firmware só conta o tempo do passo dentro da faixa
+                if progress.step_elapsed:
+                    self.set_phase(HOLD, progress.step_elapsed,
+                                   hold - progress.step_elapsed)
+                else:
+                    self.set_phase(RAMP, 0, None)
+                self.update_remaining(index, self.current_phase,
+                                      progress.step_elapsed)
+                if progress.state == FINISHED:
+                    return True
+                if progress.state != RUNNING:
+                    self.is_running = False
+                    continue
+
+            self.mark_iteration(ticker)
+            self.elapsed_time = int(self.clock.time() - started_time)
+            logger.log(self.clock.time() - started_time,
+                       self.current_sample_temperature,
+                       float(self.current_step_temp),
+                       self.current_lid_temperature,
+                       self.output,
+                       self.current_cycle,
+                       step_index)
 
     def serial_monitor(self):
         """Função para monitoramento da porta serial do Arduino.
@@ -191,102 +786,184 @@ class ArduinoPCR:
 
         Esse processo deve ser rodado em outra thread para evitar a parada
         do mainloop da janela principal.
-        """
 
+        As linhas são convertidas em mensagens (ver protocol.py) e
+        entregues ao método correspondente em self.message_handlers.
+        """
+        if self.is_binary:
+            reader = FrameReader(self.serial_device)
+        else:
+            reader = LineReader(self.serial_device)
         while self.is_connected:
             try:
-                self.reading = self.serial_device.readline().decode()
-                self.reading = self.reading.strip('\r\n')
-                if 'tempSample' in self.reading:
-                    self.current_sample_temperature = \
-                        float(self.reading.split()[1])
-                    # print(self.current_sample_temperature)
-                if 'tempLid' in self.reading:
-                    self.current_lid_temperature = \
-                        float(self.reading.split()[1])
-
-                if 'Cooling finished' in self.reading:
-                    messagebox.showinfo('Cetus PCR', 'Rotina de resfriamento '
-                                                     'concluída.')
-                elif self.reading == 'nextpls':
-                    self.is_waiting = True
-
-                if 'Heat' in self.reading or 'Cooling' in self.reading:
-                    print(f'(SM) {repr(self.reading)}')
-
-                # if not self.is_running:
-                    # self.serial_device.write(b'<peltier 0 0>')
-
-                # if self.reading != '':
-                #     print(f'(SM) {repr(self.reading)}')
+                data = reader.read()
+                started = perf_counter()
+                messages = reader.decode(data)
+                if messages:
+                    self.metrics.record('parse_time', (perf_counter() -
+                                                       started) /
+                                        len(messages))
+                    self.metrics.count('messages_received', len(messages))
+                for message in messages:
+                    handler = self.message_handlers.get(type(message))
+                    if handler is not None:
+                        handler(message)
 
             except serial.SerialException:
-                messagebox.showerror('Dispositivo desconectado',
-                                     'Ocorreu um erro ao se comunicar com '
-                                     'o CetusPCR. Verifique a conexão e '
-                                     'reinicie o aplicativo.')
+                self.notify_user('Ocorreu um erro ao se comunicar com o '
+                                 'CetusPCR. Verifique a conexão e reinicie '
+                                 'o aplicativo.',
+                                 title='Dispositivo desconectado',
+                                 level=ERROR)
                 self.is_connected = False
-                self.waiting_update = True
                 self.is_running = False
-                std.hover_text = 'Cetus PCR desconectado.'
         return  # Return para encerrar a thread
 
-    def initialize_connection(self):
+    def encode_command(self, output) -> bytes:
+        """Comando para a saída do PID no protocolo em uso."""
+        if self.is_binary:
+            return encode_peltier(output)
+        return b'%a\r\n' % peltier_command(output)
+
+    def encode_stream(self, interval_ms) -> bytes:
+        """Comando que define o intervalo das leituras periódicas."""
+        if self.is_binary:
+            return encode_stream(interval_ms)
+        return b'<stream %d>\r\n' % interval_ms
+
+    def on_sample_temperature(self, message: SampleTemperature):
+        self.current_sample_temperature = message.value
+
+    def on_lid_temperature(self, message: LidTemperature):
+        self.current_lid_temperature = message.value
+
+    def on_progress(self, message: Progress):
+        self.progress = message
+
+    def on_rejected(self, message: Rejected):
+        self.is_rejected = True
+
+    def on_reading(self, message: Reading):
+        self.current_sample_temperature = message.sample
+        self.current_lid_temperature = message.lid
+        self.reading_timestamp = message.timestamp
+        self.is_streaming = True
+
+    def on_next_command(self, message: NextCommand):
+        sent_at = self.command_sent_at
+        if sent_at is not None:
+            self.command_sent_at = None
+            self.metrics.record('round_trip', self.clock.time() - sent_at)
+        self.is_waiting = True
+
+    def on_cooling_finished(self, message: CoolingFinished):
+        self.notify_user('Rotina de resfriamento concluída.')
+
+    def on_peltier_output(self, message):
+        print(f'(SM) {message}')
+
+    def open_port(self, port: ListPortInfo) -> bool:
+        """Abre a porta e aguarda o "Cetus is ready." enviado pelo
+        firmware após o reset, por até CONNECT_TIMEOUT_S segundos.
+
+        :return: True se o dispositivo respondeu. Caso contrário a porta
+        é fechada.
+        """
         try:
-            ports = list_ports.comports()
-            if not list_ports.comports():  # Se não há nada conectado
-                raise serial.SerialException
-            for port in ports:
-                if self.device_type in port.description:
-                    self.serial_device = serial.Serial(port.device,
-                                                       self.baudrate,
-                                                       timeout=self.timeout)
-
-                    sleep(2)  # Delay para esperar o sinal do arduino
-                    self.reading = self.serial_device.readline()
-                    if self.reading == b'Cetus is ready.\r\n':
-                        self.is_connected = True
-                        self.port_connected = port.device
-                        print('Connection Successfully. '
-                              'Initializing Serial Monitor (SM)')
-                        break
-                else:
-                    raise serial.SerialException
+            serial_device = self.serial_factory(port.device, self.baudrate,
+                                                timeout=self.timeout)
+        except serial.SerialException:
+            return False
+        # Prazo em tempo real, assim como o timeout de leitura da porta
+        deadline = monotonic() + std.CONNECT_TIMEOUT_S
+        try:
+            while monotonic() < deadline:
+                if parse_line(serial_device.readline()) is READY:
+                    break
+            else:
+                serial_device.close()
+                return False
         except serial.SerialException:
-            self.serial_device = None
-            self.is_connected = False
+            serial_device.close()
+            return False
+        self.serial_device = serial_device
+        self.port_connected = port.device
+        self.device_id = device_identity(port)
+        self.is_connected = True
+        return True
+
+    def initialize_connection(self):
+        """Conecta ao Cetus PCR em self.port ou, se ela não for fornecida,
+        na primeira porta do sistema que responder (ver
+        devices.DeviceManager para testar várias portas ao mesmo tempo).
+        """
+        if self.port is not None:
+            ports = [port_info(self.port)]
+        else:
+            ports = [port for port in list_ports.comports()
+                     if self.device_type in port.description]
+        for port in ports:
+            if self.open_port(port):
+                print('Connection Successfully. '
+                      'Initializing Serial Monitor (SM)')
+                break
+        else:
             print('Connection Failed')
 
+        if self.is_connected:
+            # Ganhos da última sintonia automática deste dispositivo
+            self.pid = create_pid(load_gains(self.device_id), self.clock)
+            self.gain_schedule = GainSchedule.from_settings(
+                std.GAIN_SCHEDULE, self.device_id)
+
+        if self.is_connected and std.SERIAL_PROTOCOL == 'binary':
+            self.is_binary = negotiate(self.serial_device,
+                                       std.BINARY_BAUDRATE)
+
+        if self.is_connected and std.STREAM_INTERVAL_MS:
+            # Firmwares antigos ignoram o comando e continuam no modo
+            # "nextpls" (is_streaming só muda ao receber uma leitura).
+            self.serial_device.write(
+                self.encode_stream(std.STREAM_INTERVAL_MS))
+
         if self.is_connected:
             self.monitor_thread = Thread(target=self.serial_monitor)
             self.monitor_thread.start()
 
 
-class StringDialog(simpledialog._QueryString):
-    """Modificação do ícone da StringDialog original em
-    tkinter.simpledialog"""
+def port_info(device: str) -> ListPortInfo:
+    """Informações da porta (ex.: número de série USB), ou apenas o nome
+    se ela não for listada pelo sistema (ex.: pseudo-terminais).
+    """
+    for info in list_ports.comports():
+        if info.device == device:
+            return info
+    return ListPortInfo(device)
 
-    # Créditos ao TeamSpen210 do Reddit
-    def body(self, master):
-        super().body(master)
-        self.iconbitmap(std.WINDOW_ICON)
 
+def device_identity(port) -> str:
+    """Identificação do dispositivo, usada nos ganhos, nas estimativas e
+    no histórico: o número de série USB, que não muda quando o sistema
+    troca o nome da porta, ou o nome da porta.
 
-def ask_string(title, prompt, **kwargs):
-    # Créditos ao TeamSpen210 do Reddit
-    d = StringDialog(title, prompt, **kwargs)
-    return d.result
+    :param port: ListPortInfo ou nome da porta.
+    """
+    if not isinstance(port, ListPortInfo):
+        port = port_info(port)
+    return port.serial_number or port.device
 
 
 def open_pickle_file(path: str) -> list:
-    """Função para descompactar a lista do arquivo experiments.pcr
-    (gerado pelo pickle).
+    """Função para descompactar a lista do antigo arquivo experiments.pcr
+    (gerado pelo pickle), usada na importação para o banco de
+    experimentos.
     Caso o arquivo não seja encontrado, retorna uma lista vazia.
 
     :param path: O caminho do arquivo de experimentos.
 
     :return: Uma lista com os experimentos no arquivo, ou uma
     lista vazia caso o arquivo não exista.
+    :raise PermissionError: Sem permissão de leitura do arquivo.
     """
     try:
         with open(path, 'rb') as infile:
@@ -294,28 +971,6 @@ def open_pickle_file(path: str) -> list:
             return new_list
     except FileNotFoundError:
         return []
-    except PermissionError:
-        messagebox.showerror('Acesso Negado',
-                             'Erro com permissões, '
-                             'execute o programa como administrador '
-                             'e tente novamente.')
-
-
-def save_pickle_file(path: str, obj: object):
-    """Salva um objeto no formato binário, utilizando serialização do
-    módulo pickle.
-
-    :param path: O caminho para salvar o objeto.
-    :param obj: O objeto a ser salvo.
-    """
-    try:
-        with open(path, 'wb') as outfile:
-            pickle.dump(obj, outfile, protocol=pickle.HIGHEST_PROTOCOL)
-    except PermissionError:
-        messagebox.showerror('Acesso Negado',
-                             'Erro com permissões, '
-                             'execute o programa como administrador '
-                             'e tente novamente.')
 
 
 def validate_entry(new_text) -> bool:
@@ -0,0 +1,360 @@
+"""Histórico das execuções dos experimentos.
+
+Cada execução grava um registro em LOGS_PATH, mas encontrar, por
+exemplo, "todas as execuções do experimento X no último mês e a precisão
+dos patamares" exigia ler todos os registros. O RunHistory guarda um
+resumo de cada registro (experimento, dispositivo, início, fim, duração,
+temperaturas mínima e máxima, erro nos patamares e situação) em um banco
+SQLite (HISTORY_DB_PATH) e as consultas usam apenas esse banco.
+
+O índice é mantido de forma incremental: refresh() lê apenas os
+registros novos ou alterados, e ArduinoPCR.run_experiment() chama
+record() ao final de cada execução, informando se ela foi concluída ou
+cancelada. Para registros que não passaram por record() (versões
+anteriores, falhas do programa) a situação é deduzida dos passos
+previstos nos metadados.
+"""
+
+from datetime import datetime, timedelta
+import os
+import sqlite3
+from threading import Lock
+from typing import NamedTuple
+
+import constants as std
+from estimator import LOG_EXTENSIONS, read_rows
+
+SCHEMA_VERSION = 1
+
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+INCOMPLETE = 'incomplete'  # Deduzido: terminou antes do último passo
+UNKNOWN = 'unknown'  # Registro sem os passos previstos
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    file TEXT PRIMARY KEY,
+    experiment TEXT,
+    device TEXT,
+    port TEXT,
+    started TEXT,
+    ended TEXT,
+    duration_s REAL,
+    n_cycles INTEGER,
+    samples INTEGER,
+    min_temp_c REAL,
+    max_temp_c REAL,
+    hold_error_mean_c REAL,
+    hold_error_max_c REAL,
+    status TEXT,
+    status_recorded INTEGER NOT NULL DEFAULT 0,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_experiment
+    ON runs (experiment COLLATE NOCASE, started);
+CREATE INDEX IF NOT EXISTS runs_device ON runs (device, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+'''
+
+
+class RunSummary(NamedTuple):
+    """Resumo de uma execução. Datas no formato ISO 8601."""
+    file: str  # Nome do registro em LOGS_PATH
+    experiment: str
+    device: str
+    port: str
+    started: str
+    ended: str
+    duration_s: float
+    n_cycles: int
+    samples: int
+    min_temp_c: float
+    max_temp_c: float
+    hold_error_mean_c: float  # Erro absoluto médio dentro dos patamares
+    hold_error_max_c: float
+    status: str
+
+
+FIELDS = ', '.join(RunSummary._fields)
+
+
+def _expected_segments(metadata: dict) -> tuple:
+    """Setpoints previstos, sem repetições consecutivas (que não aparecem
+    como mudança de setpoint no registro), e o patamar (s) do último.
+    """
+    if 'segments' in metadata:  # Plano de execução (ver execution.py)
+        planned = [(set_point, hold)
+                   for set_point, hold, _, _ in metadata['segments']]
+    else:
+        planned = [(step[1], step[2]) for _ in
+                   range(int(metadata.get('n_cycles', 0)))
+                   for step in metadata['steps']]
+    set_points = []
+    for set_point, _ in planned:
+        if not set_points or set_points[-1] != set_point:
+            set_points.append(set_point)
+    return set_points, planned[-1][1] if planned else 0
+
+
+def _started_from_name(name: str):
+    """Início da execução pelo nome "{experimento} - {ddmmaaHHMMSS}"."""
+    stamp = os.path.splitext(name)[0].rpartition(' - ')[2]
+    try:
+        return datetime.strptime(stamp, '%d%m%y%H%M%S')
+    except ValueError:
+        return None
+
+
+def summarize_run(name: str, rows, metadata: dict, tolerance) -> dict:
+    """Resumo de um registro.
+
+    :param name: Nome do arquivo do registro.
+    :param rows: Linhas (tempo, amostra, setpoint, passo), ver
+    estimator.read_rows().
+    :param metadata: Metadados do registro (vazio nos registros CSV).
+    :param tolerance: Faixa (°C) em que o patamar é considerado.
+    :return: Dicionário com os campos de RunSummary.
+    """
+    summary = dict.fromkeys(RunSummary._fields)
+    summary['file'] = name
+    summary['experiment'] = metadata.get('experiment') or \
+        os.path.splitext(name)[0].rpartition(' - ')[0] or None
+    summary['device'] = metadata.get('device') or metadata.get('port')
+    summary['port'] = metadata.get('port')
+    summary['n_cycles'] = metadata.get('n_cycles')
+    summary['samples'] = len(rows)
+
+    segments = 0
+    hold_errors = []
+    set_point = band_time = None
+    for time, temperature, row_set_point, _ in rows:
+        if row_set_point != set_point:
+            set_point, band_time = row_set_point, None
+            segments += 1
+        error = abs(temperature - set_point)
+        if band_time is None and error < tolerance:
+            band_time = time
+        if band_time is not None:
+            hold_errors.append(error)
+    if rows:
+        summary['duration_s'] = rows[-1][0] - rows[0][0]
+        temperatures = [row[1] for row in rows]
+        summary['min_temp_c'] = min(temperatures)
+        summary['max_temp_c'] = max(temperatures)
+    if hold_errors:
+        summary['hold_error_mean_c'] = sum(hold_errors) / len(hold_errors)
+        summary['hold_error_max_c'] = max(hold_errors)
+
+    started = metadata.get('started')
+    started = datetime.fromisoformat(started) if started else \
+        _started_from_name(name)
+    if started is not None:
+        summary['started'] = started.isoformat(timespec='seconds')
+        summary['ended'] = (started + timedelta(
+            seconds=summary['duration_s'] or 0)).isoformat(timespec='seconds')
+
+    if metadata.get('steps'):
+        expected, last_duration = _expected_segments(metadata)
+        held = rows[-1][0] - band_time if rows and band_time is not None \
+            else 0
+        # O último passo termina ao completar o patamar (com a margem de
+        # um período de amostragem).
+        finished = segments >= len(expected) and held >= last_duration - 1
+        summary['status'] = COMPLETED if finished else INCOMPLETE
+    else:
+        summary['status'] = UNKNOWN
+    return summary
+
+
+class RunHistory:
+    """Índice das execuções em SQLite.
+
+    :param path: Arquivo do banco.
+    :param logs_path: Diretório dos registros.
+    :param tolerance: Faixa (°C) usada no erro dos patamares.
+    """
+
+    def __init__(self, path=None, logs_path=None, tolerance=None):
+        self.path = path or std.HISTORY_DB_PATH
+        self.logs_path = logs_path or std.LOGS_PATH
+        self.tolerance = std.TOLERANCE if tolerance is None else tolerance
+        self._lock = Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=10,
+                                           check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        with self._lock, self._connection:
+            stored = dict(self._connection.execute('SELECT key, value '
+                                                   'FROM meta'))
+            if stored.get('tolerance') != self.tolerance or \
+                    stored.get('schema_version') != SCHEMA_VERSION:
+                # Resumos calculados com outra tolerância: lidos de novo
+                # no próximo refresh(), mantendo as situações gravadas.
+                self._connection.execute('UPDATE runs SET mtime = NULL')
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    [('tolerance', self.tolerance),
+                     ('schema_version', SCHEMA_VERSION)])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _summarize(self, name: str, stat=None) -> dict:
+        path = os.path.join(self.logs_path, name)
+        try:
+            rows, metadata = read_rows(path)
+            summary = summarize_run(name, rows, metadata, self.tolerance)
+        except Exception:
+            # Registro ilegível (truncado, cabeçalho inválido...): indexado
+            # vazio para não ser lido a cada refresh()
+            summary = summarize_run(name, [], {}, self.tolerance)
+        stat = stat or os.stat(path)
+        summary.update(mtime=stat.st_mtime, size=stat.st_size)
+        return summary
+
+    def _store(self, summary: dict, status_recorded: bool):
+        """Grava o resumo. A situação informada por record() é mantida
+        quando o registro é lido de novo.
+        """
+        columns = list(summary) + ['status_recorded']
+        values = list(summary.values()) + [int(status_recorded)]
+        keep_status = '' if status_recorded else \
+            'status = CASE WHEN status_recorded THEN status ' \
+            'ELSE excluded.status END, '
+        updates = ', '.join(f'{column} = excluded.{column}'
+                            for column in columns
+                            if column not in ('file', 'status',
+                                              'status_recorded'))
+        if status_recorded:
+            updates += ', status = excluded.status, status_recorded = 1'
+        self._connection.execute(
+            f'INSERT INTO runs ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))}) '
+            f'ON CONFLICT (file) DO UPDATE SET {keep_status}{updates}',
+            values)
+
+    def refresh(self) -> int:
+        """Indexa os registros novos ou alterados e remove os apagados.
+
+        :return: Número de registros lidos ou removidos.
+        """
+        try:
+            names = {name for name in os.listdir(self.logs_path)
+                     if name.endswith(LOG_EXTENSIONS)}
+        except FileNotFoundError:
+            names = set()
+        with self._lock:
+            known = {file: (mtime, size) for file, mtime, size in
+                     self._connection.execute('SELECT file, mtime, size '
+                                              'FROM runs')}
+        removed = set(known) - names
+        changed = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.logs_path, name))
+            except OSError:
+                continue  # Apagado depois da listagem
+            if known.get(name) != (stat.st_mtime, stat.st_size):
+                changed.append(self._summarize(name, stat))
+        with self._lock, self._connection:
+            self._connection.executemany('DELETE FROM runs WHERE file = ?',
+                                         [(name,) for name in removed])
+            for summary in changed:
+                self._store(summary, status_recorded=False)
+        return len(removed) + len(changed)
+
+    def record(self, log_path: str, status: str) -> RunSummary:
+        """Indexa o registro de uma execução que acabou de terminar.
+
+        :param log_path: Caminho do registro.
+        :param status: COMPLETED ou CANCELLED.
+        """
+        name = os.path.basename(log_path)
+        summary = self._summarize(name)
+        summary['status'] = status
+        with self._lock, self._connection:
+            self._store(summary, status_recorded=True)
+        return RunSummary(*(summary[field] for field in RunSummary._fields))
+
+    def query(self, experiment=None, device=None, since=None, until=None,
+              status=None, limit=None) -> list:
+        """Execuções que atendem a todos os filtros dados, das mais recentes
+        para as mais antigas.
+
+        :param experiment: Nome do experimento (sem diferenciar
+        maiúsculas).
+        :param device: Identificação do dispositivo.
+        :param since: Início mínimo (datetime ou texto ISO 8601).
+        :param until: Início máximo, exclusivo.
+        :param status: Situação (COMPLETED, CANCELLED, ...).
+        :param limit: Número máximo de execuções.
+        :return: Lista de RunSummary.
+        """
+        conditions, values = [], []
+        if experiment is not None:
+            conditions.append('experiment = ? COLLATE NOCASE')
+            values.append(experiment)
+        if device is not None:
+            conditions.append('device = ?')
+            values.append(device)
+        if since is not None:
+            conditions.append('started >= ?')
+            values.append(_iso(since))
+        if until is not None:
+            conditions.append('started < ?')
+            values.append(_iso(until))
+        if status is not None:
+            conditions.append('status = ?')
+            values.append(status)
+        sql = f'SELECT {FIELDS} FROM runs'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY started DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            values.append(limit)
+        with self._lock:
+            rows = self._connection.execute(sql, values).fetchall()
+        return [RunSummary(*row) for row in rows]
+
+    def experiments(self) -> list:
+        """Nomes dos experimentos com alguma execução registrada."""
+        with self._lock:
+            return [name for name, in self._connection.execute(
+                'SELECT DISTINCT experiment FROM runs WHERE experiment '
+                'IS NOT NULL ORDER BY experiment COLLATE NOCASE')]
+
+
+def _iso(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+_default = None
+_default_lock = Lock()
+
+
+def default_history() -> RunHistory:
+    """RunHistory compartilhado, indexado na primeira chamada. Se a
+    indexação falhar, a próxima chamada tenta de novo.
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            history = RunHistory()
+            try:
+                history.refresh()
+            except Exception:
+                history.close()
+                raise
+            _default = history
+        return _default
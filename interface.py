@@ -17,12 +17,126 @@ Todos os métodos com prefixo "handle" remetem as funções de botões.
 """
 
 import tkinter as tk
+from itertools import count
+from queue import Empty, SimpleQueue
 from threading import Thread
-from tkinter import ttk, messagebox
-from time import sleep
+from tkinter import ttk, messagebox, simpledialog
+from time import monotonic, sleep
 
 import functions as fc
 import constants as std
+from charting import LiveChart
+from control import HOLD, RAMP
+from devices import DEVICE_ADDED, DeviceManager
+from execution import CYCLE, FINAL, INITIAL, ExecutionPlan, PlanError
+from history import CANCELLED, COMPLETED, INCOMPLETE, default_history
+from repository import ExperimentRepository, StaleExperimentError
+from scheduler import RunQueue
+
+
+class DeviceEvents:
+    """Encaminha as alterações dos dispositivos para a thread do Tkinter.
+
+    As alterações chegam das threads dos dispositivos, são guardadas em
+    uma fila e a janela é acordada com o evento virtual
+    "<<DeviceUpdate>>". Na thread do Tkinter os valores são agrupados
+    (apenas o último valor de cada atributo é mantido) e entregues às
+    funções inscritas, no formato handler(dispositivo, nome, valor), no
+    máximo "max_rate" vezes por segundo. O atraso entre a publicação e a
+    entrega é registrado nas medições do dispositivo ("gui_lag").
+
+    Os eventos em "ungrouped_events" (avisos) não são agrupados: todos
+    são entregues, na ordem em que foram publicados.
+    """
+
+    ungrouped_events = frozenset({fc.NOTICE})
+
+    def __init__(self, root: tk.Tk, manager: DeviceManager,
+                 max_rate=std.GUI_MAX_REFRESH_HZ):
+        self.root = root
+        self.min_interval = 1 / max_rate
+        self.handlers = []
+        self.queue = SimpleQueue()
+        self._pending = {}
+        self._is_signalled = False
+        self._is_scheduled = False
+        self._last_dispatch = 0
+        self._sequence = count()
+        self.root.bind('<<DeviceUpdate>>', self.on_wake)
+        manager.listeners.append(self.publish)
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def unsubscribe(self, handler):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    def publish(self, device, name, value):
+        """Chamada pelo dispositivo em qualquer thread."""
+        key = (device, name)
+        if name in self.ungrouped_events:
+            key += (next(self._sequence),)
+        self.queue.put((key, value, monotonic()))
+        if not self._is_signalled:
+            self._is_signalled = True
+            try:
+                self.root.event_generate('<<DeviceUpdate>>', when='tail')
+            except (RuntimeError, tk.TclError):
+                # Mainloop ainda não iniciado, o próximo evento entrega
+                # os valores pendentes.
+                self._is_signalled = False
+
+    def on_wake(self, event=None):
+        self._is_signalled = False
+        self._drain()
+        if self._is_scheduled:
+            return
+        remaining = self._last_dispatch + self.min_interval - monotonic()
+        if remaining <= 0:
+            self.dispatch()
+        else:
+            self._is_scheduled = True
+            self.root.after(int(remaining * 1000) + 1, self.dispatch)
+
+    def dispatch(self):
+        self._is_scheduled = False
+        self._drain()
+        self._last_dispatch = monotonic()
+        pending, self._pending = self._pending, {}
+        for (device, name, *_), (value, published) in pending.items():
+            for handler in list(self.handlers):
+                handler(device, name, value)
+            if device is not None:
+                device.metrics.record('gui_lag', monotonic() - published)
+
+    def _drain(self):
+        while True:
+            try:
+                key, value, published = self.queue.get_nowait()
+            except Empty:
+                return
+            # Mantém o instante da publicação mais antiga ainda não entregue
+            previous = self._pending.get(key)
+            if previous is not None:
+                published = previous[1]
+            self._pending[key] = (value, published)
+
+
+class StringDialog(simpledialog._QueryString):
+    """Modificação do ícone da StringDialog original em
+    tkinter.simpledialog"""
+
+    # Créditos ao TeamSpen210 do Reddit
+    def body(self, master):
+        super().body(master)
+        self.iconbitmap(std.WINDOW_ICON)
+
+
+def ask_string(title, prompt, **kwargs):
+    # Créditos ao TeamSpen210 do Reddit
+    d = StringDialog(title, prompt, **kwargs)
+    return d.result
 
 
 class AnimatedButton(tk.Button):
@@ -109,6 +223,96 @@ class ScrollFrame(tk.Frame):
                           fill="y")
 
 
+class TemperatureChart(tk.Canvas):
+    """Gráfico em tempo real das temperaturas da amostra, da tampa e do
+    alvo.
+
+    O desenho é delegado para charting.LiveChart, que só acrescenta os
+    segmentos novos a cada atualização.
+    """
+
+    def __init__(self, master, **kw):
+        super().__init__(master,
+                         width=std.CHART_WIDTH,
+                         height=std.CHART_HEIGHT,
+                         bg=std.SIDE_BAR_COLOR,
+                         highlightthickness=0,
+                         **kw)
+        self.chart = LiveChart(self, std.CHART_WIDTH, std.CHART_HEIGHT,
+                               std.CHART_RANGE_C, std.CHART_COLORS)
+        for temp in range(20, std.CHART_RANGE_C[1], 20):
+            _, y = self.chart.to_pixels(0, temp)
+            self.create_line(0, y, std.CHART_WIDTH, y, fill=std.BG,
+                             tags='grid')
+            self.create_text(4, y, text=f'{temp}°C', anchor='sw',
+                             fill=std.TEXTS_COLOR,
+                             font=(std.FONT_ENTRY, 8), tags='grid')
+
+    def add(self, t, sample, lid, setpoint):
+        self.chart.add(t, sample=sample, lid=lid, setpoint=setpoint)
+
+    def refresh(self):
+        self.chart.refresh()
+
+
+class DeviceStatusBar(tk.Frame):
+    """Barra com o estado de cada Cetus PCR conectado.
+
+    Clicar no nome de um dispositivo o seleciona para os próximos
+    experimentos.
+    """
+
+    def __init__(self, master, **kw):
+        super().__init__(master, bg=std.SIDE_BAR_COLOR, **kw)
+        self.master = master
+        self.labels = {}
+        self.queue_label = tk.Label(master=self,
+                                    font=(std.FONT_HOVER, 10, 'bold'),
+                                    bg=std.SIDE_BAR_COLOR,
+                                    fg=std.TEXTS_COLOR,
+                                    padx=10)
+        self.queue_label.pack(side='right')
+
+    def refresh_devices(self):
+        for label in self.labels.values():
+            label.destroy()
+        self.labels.clear()
+        for device in devices:
+            label = tk.Label(master=self,
+                             font=(std.FONT_HOVER, 10, 'bold'),
+                             bg=std.SIDE_BAR_COLOR,
+                             padx=10)
+            label.bind('<Button-1>',
+                       lambda event, d=device: self.master.select_device(d))
+            label.pack(side='left')
+            self.labels[device] = label
+            self.update_device(device)
+
+    def update_device(self, device):
+        label = self.labels.get(device)
+        if label is None:
+            return
+        if not device.is_connected:
+            status = 'desconectado'
+        elif device.is_running:
+            status = f'executando ({device.current_sample_temperature} °C)'
+        else:
+            status = f'livre ({device.current_sample_temperature} °C)'
+        color = std.BD if device is arduino else std.TEXTS_COLOR
+        label.configure(text=f'{device.port_connected}: {status}', fg=color)
+
+    def on_device_event(self, device, name, value):
+        if name in ('is_connected', 'is_running',
+                    'current_sample_temperature'):
+            self.update_device(device)
+        elif name == 'queue':
+            text = f'Fila: {len(value)}' if len(value) else ''
+            self.queue_label.configure(text=text)
+
+
+STAGE_NAMES = {INITIAL: 'Inicial', CYCLE: 'Ciclo', FINAL: 'Final'}
+
+
 class StepWidget(tk.Frame):
     """Um frame padrão para adicionar informações aos experimentos. """
 
@@ -166,6 +370,15 @@ class StepWidget(tk.Frame):
                                            rely=0,
                                            x=10)
 
+        # Estágio do passo: antes, dentro ou depois do bloco de ciclos
+        self.stage_combo = ttk.Combobox(master=self,
+                                        values=list(STAGE_NAMES.values()),
+                                        state='readonly',
+                                        width=7,
+                                        font=(std.FONT_ENTRY_TITLE, 12))
+        self.stage_combo.set(STAGE_NAMES[CYCLE])
+        self.stage_combo.pack(side='left')
+
         self.remove_image = tk.PhotoImage(file='assets/remove_icon.png')
         self.remove_button = tk.Button(master=self,
                                        image=self.remove_image,
@@ -183,11 +396,14 @@ class StepWidget(tk.Frame):
         new_widget = cls(master=master, step_name=step.name)
         new_widget.entry_temp.insert(0, step.temperature)
         new_widget.entry_time.insert(0, step.duration)
+        new_widget.stage_combo.set(STAGE_NAMES[step.stage])
         return new_widget
 
     def get_step(self):
+        stage = {name: stage for stage, name in STAGE_NAMES.items()}[
+            self.stage_combo.get()]
         return fc.StepPCR(self.step_name, self.entry_temp.get(),
-                          self.entry_time.get())
+                          self.entry_time.get(), stage)
 
     def remove_widget_step(self):
         self.master.master.master.master.step_widgets_data.remove(self)
@@ -224,6 +440,11 @@ class BaseWindow(tk.Tk):
         self.hover_box.pack(side='bottom',
                             fill='x')
 
+        # Barra com o estado de cada dispositivo conectado.
+        self.status_bar = DeviceStatusBar(master=self)
+        self.status_bar.pack(side='bottom',
+                             fill='x')
+
         # Barra para os botões laterais.
         self.side_bar_frame = tk.Frame(master=self,
                                        bg=std.SIDE_BAR_COLOR)
@@ -288,44 +509,62 @@ class BaseWindow(tk.Tk):
         self.side_buttons['settings_icon']. \
             configure(command=self.handle_settings_button)
 
+        self.events = DeviceEvents(self, devices)
         self.switch_frame(HomeWindow)
         self.connected_icon = tk.PhotoImage(file='assets/connected_icon.png')
-        self.check_if_is_connected()
+        self.reconnect_icons = (
+            self.side_buttons['reconnect_icon'].icon1,
+            self.side_buttons['reconnect_icon'].icon2)
+        self.events.subscribe(self.on_device_event)
+        self.events.subscribe(self.status_bar.on_device_event)
+        self.status_bar.refresh_devices()
+        self.update_connection_icon()
         self.experiment_thread = None
 
-    def check_if_is_connected(self):
-        """Função para verificar alterações na porta serial.
-
-        Essa função roda em looping infinito no background da janela
-        base.
+    def on_device_event(self, device, name, value):
+        if name == 'is_connected':
+            self.update_connection_icon()
+        elif name == DEVICE_ADDED:
+            if not arduino.is_connected:
+                self.select_device(device)
+            self.status_bar.refresh_devices()
+            self.update_connection_icon()
+        elif name == 'discovered':
+            self.on_discovered(*value)
+        elif name == fc.NOTICE:
+            show = messagebox.showerror if value.level == fc.ERROR \
+                else messagebox.showinfo
+            show(value.title, value.message, parent=self)
+
+    def update_connection_icon(self):
+        """Exibe o ícone de conectado se algum dispositivo estiver
+        conectado.
         """
         bt_connected = self.side_buttons['reconnect_icon']
-        if self._frame is not None and arduino.is_connected:
+        if devices.connected():
             bt_connected.icon1 = self.connected_icon
             bt_connected.icon2 = self.connected_icon
-            bt_connected.configure(image=self.connected_icon)
-        elif arduino.waiting_update:
-            bt_connected.icon1 = tk.PhotoImage(
-                file=std.side_buttons_path['reconnect_icon'])
-            bt_connected.icon2 = tk.PhotoImage(
-                file=std.side_buttons_path['reconnect_highlight'])
-            bt_connected.configure(image=bt_connected.icon1)
-            arduino.waiting_update = False
+        else:
+            bt_connected.icon1, bt_connected.icon2 = self.reconnect_icons
+        bt_connected.configure(image=bt_connected.icon1)
 
-        self.after(1000, self.check_if_is_connected)
+    def select_device(self, device: fc.ArduinoPCR):
+        """Define o dispositivo usado pelos próximos experimentos."""
+        global arduino
+        arduino = device
+        for other in devices:
+            self.status_bar.update_device(other)
 
     def close_window(self):
         """Função para sobrescrever o protocolo padrão ao fechar a janela.
 
-        O programa salva todos os experimentos em arquivo externo e depois
-        destrói a janela principal encerrando o programa.
+        Encerra a fila, as portas seriais e o banco de experimentos e
+        depois destrói a janela principal encerrando o programa.
         """
-        fc.save_pickle_file(std.EXP_PATH, fc.experiments)
-        if arduino.is_connected:
-            arduino.is_running = False
-            arduino.is_connected = False
-            arduino.serial_device.close()
-            print('Closing serial port.')
+        run_queue.stop()
+        devices.close()
+        experiment_store.close()
+        print('Closing serial ports.')
         self.destroy()
 
     def switch_frame(self, new_frame, *args, **kwargs):
@@ -345,22 +584,29 @@ class BaseWindow(tk.Tk):
     # ---------------------------------- Métodos para funções de botão
     def handle_cooling_button(self):
         if not arduino.is_cooling:
+            if devices.is_busy(arduino.port_connected):
+                messagebox.showerror('Cetus PCR',
+                                     f'O dispositivo {arduino.port_connected}'
+                                     f' está ocupado.')
+                return
             print('cooling')
-            arduino.serial_device.write(b'<peltier 0 0>')
+            arduino.write_command(arduino.encode_command(0))
             sleep(1)
             if arduino.current_sample_temperature >= std.COOLING_TEMP_C:
-                arduino.experiment = arduino.cooling_experiment
-                arduino.is_cooling = True
-                arduino.is_running = True
-                self.experiment_thread = Thread(
-                    target=arduino.run_experiment)
-                self.experiment_thread.start()
+                try:
+                    # Registrado como ocupado: a fila não inicia outro
+                    # experimento no dispositivo durante o resfriamento.
+                    self.experiment_thread = devices.cool(
+                        arduino.port_connected)
+                except RuntimeError as error:
+                    messagebox.showerror('Cetus PCR', str(error))
+                    return
                 messagebox.showinfo('Cetus PCR', 'Processo de resfriamento '
                                                  'iniciado.')
             else:
                 messagebox.showinfo('Cetus PCR', 'O Dispositivo já está resfriado.')
         else:
-            arduino.serial_device.write(b'<printTemps>')
+            # A temperatura é atualizada pelo próprio laço de resfriamento
             messagebox.showinfo('Cetus PCR',
                                 'Dispositivo resfriando.\n'
                                 f'Temperatura atual: {arduino.current_sample_temperature}')
@@ -374,25 +620,67 @@ class BaseWindow(tk.Tk):
         if not InfoWindow.is_open:
             InfoWindow(tk.Tk())
 
-    @staticmethod
-    def handle_reconnect_button():
-        if not arduino.is_connected:
-            arduino.initialize_connection()
-            port = arduino.port_connected
-            if arduino.is_connected:
-                messagebox.showinfo('Cetus PCR',
-                                    'Dispositivo conectado com sucesso na '
-                                    f'porta "{port}"')
-            else:
-                messagebox.showerror('Cetus PCR',
-                                     'Conexão mal-sucedida.')
-        else:
+    def handle_reconnect_button(self):
+        self.discover_devices()
+
+    def discover_devices(self, notify=True):
+        """Procura os dispositivos em segundo plano. A janela continua
+        respondendo e cada dispositivo aparece na barra de estado assim
+        que responde (evento DEVICE_ADDED).
+
+        :param notify: Informa o resultado da busca ao final.
+        """
+        previous = devices.connected()
+        devices.discover_async(
+            on_finish=lambda ports: self.events.publish(
+                None, 'discovered', (previous, ports, notify)))
+
+    def on_discovered(self, previous, ports, notify):
+        if not notify:
+            return
+        new_ports = [port for port in ports if port not in previous]
+        if new_ports:
+            messagebox.showinfo('Cetus PCR',
+                                'Dispositivo conectado com sucesso na(s) '
+                                f'porta(s) {", ".join(new_ports)}')
+        elif ports:
             messagebox.showinfo('Cetus PCR',
-                                'O Dispositivo já está conectado '
-                                f'({arduino.port_connected}).')
+                                'Nenhum dispositivo novo encontrado. '
+                                f'Conectados: {", ".join(ports)}.')
+        else:
+            messagebox.showerror('Cetus PCR',
+                                 'Conexão mal-sucedida.')
 
     def handle_settings_button(self):
-        pass
+        """Sintonia automática do PID do dispositivo selecionado."""
+        if not arduino.is_connected:
+            messagebox.showerror('Sintonia do PID',
+                                 'Dispositivo Cetus PCR não conectado!')
+            return
+        if devices.is_busy(arduino.port_connected):
+            messagebox.showerror('Sintonia do PID',
+                                 f'O dispositivo {arduino.port_connected} '
+                                 f'está ocupado.')
+            return
+        answer = ask_string('Sintonia do PID',
+                            'A saída do Peltier será alternada em torno '
+                            'da temperatura abaixo até obter uma '
+                            'oscilação estável.\n'
+                            'Temperatura da sintonia (°C):',
+                            initialvalue=str(std.AUTOTUNE['SET_POINT_C']),
+                            parent=self)
+        if answer is None:
+            return
+        try:
+            set_point = float(answer)
+        except ValueError:
+            messagebox.showerror('Sintonia do PID',
+                                 f'Temperatura inválida: "{answer}".')
+            return
+        try:
+            devices.autotune(arduino.port_connected, set_point=set_point)
+        except RuntimeError as error:
+            messagebox.showerror('Sintonia do PID', str(error))
 
 
 class HomeWindow(tk.Frame):
@@ -488,13 +776,29 @@ class HomeWindow(tk.Frame):
                                           anchor='sw',
                                           bordermode='outside')
 
+        self.history_button = tk.Button(master=self,
+                                        text='Histórico de execuções',
+                                        font=(std.FONT_TITLE, 13),
+                                        fg=std.TEXTS_COLOR,
+                                        bg=std.BG,
+                                        activebackground=std.BG,
+                                        bd=0,
+                                        cursor='hand2',
+                                        command=self.handle_history_button)
+        self.history_button.place(in_=self.buttons_frame,
+                                  relx=1,
+                                  rely=1,
+                                  y=5,
+                                  anchor='ne',
+                                  bordermode='outside')
+
         self.show_experiments()
 
     def show_experiments(self):
-        """Abre o arquivo com os experimentos salvos e os exibe na
+        """Lê os experimentos salvos (sem os passos) e os exibe na
         self.experiment_combo(ttk.Combobox).
         """
-        fc.experiments = fc.open_pickle_file(std.EXP_PATH)
+        fc.experiments = experiment_store.list()
         values = []
         for exp in fc.experiments:
             values.append(exp.name)
@@ -508,34 +812,38 @@ class HomeWindow(tk.Frame):
             self.master.switch_frame(ExperimentWindow, index)
 
     def handle_new_button(self):
-        name = fc.ask_string('Novo Experimento', 'Digite o nome do'
-                                                 ' experimento:',
-                             parent=self.master)
+        name = ask_string('Novo Experimento', 'Digite o nome do'
+                                              ' experimento:',
+                          parent=self.master)
 
         if name != '' and name is not None:
-            new_experiment = fc.ExperimentPCR(name)
-            fc.experiments.append(new_experiment)
-            fc.save_pickle_file(std.EXP_PATH, fc.experiments)
-            index_exp = fc.experiments.index(new_experiment)
+            new_experiment = experiment_store.add(fc.ExperimentPCR(name))
             self.show_experiments()
+            index_exp = [experiment.id for experiment in fc.experiments]. \
+                index(new_experiment.id)
             self.master.switch_frame(ExperimentWindow, index_exp)
 
         elif name is '':
             messagebox.showerror('Novo Experimento', 'O nome não pode estar'
                                                      ' vazio')
 
+    def handle_history_button(self):
+        index = self.experiment_combo.current()
+        name = fc.experiments[index].name if index >= 0 else None
+        if not HistoryWindow.is_open:
+            HistoryWindow(tk.Toplevel(self.master), name)
+
     def handle_delete_button(self):
         index = self.experiment_combo.current()
-        experiment = fc.experiments[index]
         if index >= 0:
+            experiment = fc.experiments[index]
             delete = messagebox. \
                 askyesnocancel('Deletar experimento',
                                'Você tem certeza que deseja '
                                f'excluir "{experiment.name}"?\n'
                                'Essa ação não pode ser desfeita.')
             if delete:
-                fc.experiments.remove(experiment)
-                fc.save_pickle_file(std.EXP_PATH, fc.experiments)
+                experiment_store.delete(experiment)
                 self.show_experiments()
                 self.experiment_combo.delete(0, 'end')
 
@@ -679,19 +987,28 @@ class ExperimentWindow(HomeWindow):
         self.frame_steps.update_scroll_bar()
 
     def save_experiment(self):
-        self.experiment.n_cycles = self.entry_of_options['Nº de ciclos'].get()
-        self.experiment.final_hold = \
-            self.entry_of_options['Temperatura Final'].get()
-        self.experiment.steps.clear()
-        for widget in self.step_widgets_data:
-            self.experiment.steps.append(widget.get_step())
-        fc.save_pickle_file(std.EXP_PATH, fc.experiments)
+        self.experiment.n_cycles = fc.as_int(
+            self.entry_of_options['Nº de ciclos'].get(), 'Nº de ciclos')
+        self.experiment.final_hold = fc.as_int(
+            self.entry_of_options['Temperatura Final'].get(),
+            'Temperatura final')
+        self.experiment.steps = [widget.get_step()
+                                 for widget in self.step_widgets_data]
+        try:
+            experiment_store.save(self.experiment)
+        except StaleExperimentError as error:
+            overwrite = messagebox.askyesno(
+                'Salvar Experimento',
+                f'{error}\nSubstituir pelas alterações desta janela?',
+                parent=self)
+            if overwrite:
+                experiment_store.save(self.experiment, force=True)
         print(self.experiment)
 
     # ---------------------------------- Métodos para funções de botão
     def handle_add_button(self):
-        step_name = fc.ask_string('Nova Etapa', 'Digite o nome do novo '
-                                                'passo:')
+        step_name = ask_string('Nova Etapa', 'Digite o nome do novo '
+                                             'passo:')
         if step_name == '':
             messagebox.showerror('Nova Etapa', 'O nome da etapa não pode '
                                                'estar vazio')
@@ -712,12 +1029,33 @@ class ExperimentWindow(HomeWindow):
         self.master.switch_frame(HomeWindow)
 
     def handle_run_button(self):
+        self.save_experiment()
+        try:
+            ExecutionPlan.compile(self.experiment)
+        except PlanError as error:
+            messagebox.showerror('Executar Experimento', str(error),
+                                 parent=self)
+            return
         if arduino.is_connected:
-            self.save_experiment()
-            arduino.is_running = True
-            self.master.experiment_thread = Thread(
-                target=arduino.run_experiment)
-            self.master.experiment_thread.start()
+            if devices.is_busy(arduino.port_connected):
+                enqueue = messagebox.askyesno(
+                    'Executar Experimento',
+                    f'O dispositivo {arduino.port_connected} já está '
+                    'executando um experimento.\n'
+                    'Adicionar à fila? O experimento será iniciado no '
+                    'primeiro dispositivo livre.',
+                    parent=self)
+                if enqueue:
+                    run_queue.submit(self.experiment)
+                return
+            try:
+                self.master.experiment_thread = devices.run(
+                    arduino.port_connected, self.experiment)
+            except RuntimeError as error:
+                # Ocupado pela fila entre a verificação e o início
+                messagebox.showerror('Executar Experimento', str(error),
+                                     parent=self)
+                return
             self.master.switch_frame(MonitorWindow, self.exp_index)
 
         else:
@@ -726,14 +1064,25 @@ class ExperimentWindow(HomeWindow):
                                  parent=self)
 
 
+PHASE_NAMES = {RAMP: 'Rampa', HOLD: 'Patamar'}
+
+
+def phase_to_string(phase, elapsed, eta) -> str:
+    """Texto da fase do passo, ex.: "Patamar 12s (restam 18s)"."""
+    text = f'{PHASE_NAMES[phase]} {fc.seconds_to_string(elapsed)}'
+    if eta is not None:
+        text += f' (restam {fc.seconds_to_string(eta)})'
+    return text
+
+
 class MonitorWindow(ExperimentWindow):
 
     def __init__(self, master: BaseWindow, exp_index):
-        fc.experiments = fc.open_pickle_file(std.EXP_PATH)
+        self.device = arduino
         super().__init__(master, exp_index)
         self.master = master
         self.current_estimated_time = 0
-        arduino.elapsed_time = 0
+        self.device.elapsed_time = 0
 
     def _widgets(self):
         self.data = {}
@@ -812,29 +1161,79 @@ class MonitorWindow(ExperimentWindow):
                                  x=45,
                                  y=-10,
                                  anchor='center')
+
+        self.chart = TemperatureChart(master=self)
+        self.chart.place(x=20,
+                         rely=1,
+                         y=-15,
+                         anchor='sw')
+        self.chart_started = self.device.clock.time()
+        self.data['passo atual'].configure(font=(std.FONT_TITLE, 21, 'bold'))
+        # Fase do passo (rampa/patamar), tempo decorrido e restante
+        self.data['fase'] = tk.Label(master=self.master,
+                                     font=(std.FONT_TITLE, 14),
+                                     bg=std.BG,
+                                     fg=std.TEXTS_COLOR)
+        self.data['fase'].place(in_=self.data['passo atual'],
+                                anchor='n',
+                                rely=1,
+                                relx=0.5)
+        self.label_texts = {}
         self.update_labels()
+        self.master.events.subscribe(self.on_device_event)
+
+    def destroy(self):
+        self.master.events.unsubscribe(self.on_device_event)
+        super().destroy()
+
+    def set_label(self, key, text):
+        """Altera o texto de um valor apenas se ele mudou."""
+        if self.label_texts.get(key) != text:
+            self.label_texts[key] = text
+            self.data[key].configure(text=text)
 
     def update_labels(self):
-        cur_cycle = f'{arduino.current_cycle}/{self.experiment.n_cycles}'
-        self.data['temperatura amostra']. \
-            configure(text=f'{arduino.current_sample_temperature} °C')
-        # self.data['temperatura tampa']. \
-        #     configure(text=f'{arduino.current_lid_temperature} °C')
-        self.data['temperatura alvo']. \
-            configure(text=f'{arduino.current_step_temp} °C')
-        self.data['tempo decorrido']. \
-            configure(text=fc.seconds_to_string(arduino.elapsed_time))
-        self.data['passo atual']. \
-            configure(text=arduino.current_step,
-                      font=(std.FONT_TITLE, 21, 'bold'))
-        self.data['ciclo atual']. \
-            configure(text=cur_cycle)
-        self.after(50, self.update_labels)
+        plan = self.device.plan
+        if plan is None or plan.is_cycled(self.device.current_cycle):
+            n_cycles = self.experiment.n_cycles if plan is None \
+                else plan.n_cycles
+            cur_cycle = f'{self.device.current_cycle}/{n_cycles}'
+        else:
+            # Estágio inicial ou final, fora do bloco de ciclos
+            cur_cycle = STAGE_NAMES[plan.stage(self.device.current_segment)]
+        self.set_label('temperatura amostra',
+                       f'{self.device.current_sample_temperature} °C')
+        self.set_label('temperatura alvo',
+                       f'{self.device.current_step_temp} °C')
+        elapsed = fc.seconds_to_string(self.device.elapsed_time)
+        if self.device.remaining_time:
+            elapsed += f' (restam ' \
+                       f'{fc.seconds_to_string(self.device.remaining_time)})'
+        self.set_label('tempo decorrido', elapsed)
+        self.set_label('passo atual', self.device.current_step)
+        self.set_label('ciclo atual', cur_cycle)
+        self.set_label('fase', phase_to_string(self.device.current_phase,
+                                               self.device.phase_elapsed,
+                                               self.device.phase_eta))
+
+    def on_device_event(self, device, name, value):
+        if device is not self.device:
+            return
+        self.update_labels()
+        if name in ('current_sample_temperature', 'current_step_temp'):
+            self.update_chart()
+
+    def update_chart(self):
+        self.chart.add(self.device.clock.time() - self.chart_started,
+                       self.device.current_sample_temperature,
+                       self.device.current_lid_temperature,
+                       float(self.device.current_step_temp))
+        self.chart.refresh()
 
     # ---------------------------------- Métodos para funções de botão
     def handle_cancel_button(self):
-        arduino.is_running = False
-        arduino.elapsed_time = 0
+        self.device.is_running = False
+        self.device.elapsed_time = 0
         self.current_estimated_time = 0
         self.master.switch_frame(ExperimentWindow, self.exp_index)
 
@@ -869,7 +1268,134 @@ class InfoWindow(tk.Frame):
         self.master.destroy()
 
 
-arduino = fc.ArduinoPCR(baudrate=9600, timeout=1)
-fc.experiments = fc.open_pickle_file(std.EXP_PATH)
-cetus = BaseWindow()
-cetus.mainloop()
+STATUS_NAMES = {COMPLETED: 'Concluído', CANCELLED: 'Cancelado',
+                INCOMPLETE: 'Incompleto'}
+ALL_EXPERIMENTS = 'Todos os experimentos'
+
+
+class HistoryWindow(tk.Frame):
+    """Execuções registradas (ver history.py), das mais recentes para as
+    mais antigas, filtradas pelo experimento.
+    """
+    is_open = False
+    columns = {'experiment': ('Experimento', 150),
+               'device': ('Dispositivo', 110),
+               'started': ('Início', 130),
+               'duration': ('Duração', 80),
+               'temperature': ('Temperatura', 110),
+               'hold_error': ('Erro nos patamares', 150),
+               'status': ('Situação', 90)}
+
+    def __init__(self, master: tk.Toplevel, experiment=None):
+        super().__init__(master, bg=std.BG)
+        self.master = master
+        self.master.title('Histórico de execuções')
+        self.master.iconbitmap(std.WINDOW_ICON)
+        self.master.protocol('WM_DELETE_WINDOW', self.close_window)
+        self.master.geometry('860x420+220+120')
+        self.master.resizable(False, False)
+        HistoryWindow.is_open = True
+        self.pack(expand=1, fill='both')
+
+        self.experiment_combo = ttk.Combobox(master=self,
+                                             width=30,
+                                             state='readonly',
+                                             font=(std.FONT_TITLE, 12))
+        self.experiment_combo.pack(side='top', anchor='w', padx=10, pady=10)
+        self.experiment_combo.bind('<<ComboboxSelected>>',
+                                   lambda event: self.show_runs())
+
+        self.tree = ttk.Treeview(master=self,
+                                 columns=list(self.columns),
+                                 show='headings')
+        for column, (heading, width) in self.columns.items():
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor='center')
+        self.scroll_bar = ttk.Scrollbar(master=self,
+                                        orient='vertical',
+                                        command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.scroll_bar.set)
+        self.scroll_bar.pack(side='right', fill='y', padx=(0, 10),
+                             pady=(0, 10))
+        self.tree.pack(side='left', expand=1, fill='both', padx=(10, 0),
+                       pady=(0, 10))
+
+        names = default_history().experiments()
+        self.experiment_combo.configure(values=[ALL_EXPERIMENTS] + names)
+        self.experiment_combo.set(experiment if experiment in names
+                                  else ALL_EXPERIMENTS)
+        self.show_runs()
+
+    def show_runs(self):
+        self.tree.delete(*self.tree.get_children())
+        experiment = self.experiment_combo.get()
+        if experiment == ALL_EXPERIMENTS:
+            experiment = None
+        for run in default_history().query(experiment=experiment):
+            started = run.started.replace('T', ' ')[:16] if run.started \
+                else '-'
+            duration = fc.seconds_to_string(int(run.duration_s)) \
+                if run.duration_s is not None else '-'
+            temperature = f'{run.min_temp_c:.1f} a {run.max_temp_c:.1f}°C' \
+                if run.min_temp_c is not None else '-'
+            hold_error = f'{run.hold_error_mean_c:.2f}°C ' \
+                         f'(máx. {run.hold_error_max_c:.2f}°C)' \
+                if run.hold_error_mean_c is not None else '-'
+            self.tree.insert('', 'end', values=(
+                run.experiment or run.file, run.device or '-', started,
+                duration, temperature, hold_error,
+                STATUS_NAMES.get(run.status, '-')))
+
+    def close_window(self):
+        HistoryWindow.is_open = False
+        self.master.destroy()
+
+
+# Definidos em main()
+devices: DeviceManager = None
+run_queue: RunQueue = None
+arduino: fc.ArduinoPCR = None
+experiment_store: ExperimentRepository = None
+cetus: BaseWindow = None
+
+
+def main():
+    """Abre o banco de experimentos, exibe a janela principal e procura
+    os dispositivos em segundo plano.
+
+    Nada disso é feito ao importar o módulo: a execução dos experimentos
+    fica em functions.py, que também é usado sem interface gráfica (ver
+    cli.py).
+    """
+    global devices, run_queue, arduino, experiment_store, cetus
+    devices = DeviceManager(baudrate=9600, timeout=1)
+    run_queue = RunQueue(devices)
+    # Substituído pelo primeiro dispositivo que responder
+    arduino = fc.ArduinoPCR(baudrate=9600, timeout=1, auto_connect=False)
+    experiment_store = ExperimentRepository(std.EXP_DB_PATH)
+    try:
+        experiment_store.migrate_pickle(std.EXP_PATH)
+        migration_denied = False
+    except PermissionError:
+        migration_denied = True
+    fc.experiments = experiment_store.list()
+    # Indexa os registros novos sem atrasar a abertura da janela
+    Thread(target=default_history, daemon=True).start()
+    cetus = BaseWindow()
+    if migration_denied:
+        messagebox.showerror('Acesso Negado',
+                             'Erro com permissões, '
+                             'execute o programa como administrador '
+                             'e tente novamente.',
+                             parent=cetus)
+    run_queue.listeners.append(
+        lambda queue: cetus.events.publish(None, 'queue',
+                                           list(queue.pending)))
+    run_queue.start()
+    # A janela é exibida sem esperar pelos dispositivos
+    cetus.discover_devices(notify=False)
+    cetus.mainloop()
+
+
+if __name__ == '__main__':
+    main()
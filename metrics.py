@@ -0,0 +1,224 @@
+"""Medições de desempenho do laço de controle.
+
+Cada ArduinoPCR possui um RunMetrics, reiniciado a cada execução. Ao
+final da execução o resumo é gravado em JSON ao lado do registro do
+experimento ("<registro>.metrics.json").
+
+As medições são acumuladas em histogramas de tamanho fixo (buckets
+logarítmicos, 4 por década), então o custo de cada medição é constante
+e a memória não cresce com a duração do experimento. Com "enabled"
+falso, record() e count() retornam imediatamente; o atributo pode ser
+alterado a qualquer momento, inclusive durante uma execução.
+
+Histogramas registrados pelo aplicativo (em segundos):
+    -loop_period: intervalo entre duas iterações do laço de controle;
+    -sleep_drift: atraso de cada iteração em relação ao instante
+    programado (ver control.FixedRateTicker);
+    -round_trip: do envio de um comando até a confirmação ("nextpls");
+    -parse_time: interpretação de cada mensagem recebida;
+    -gui_lag: da alteração de um atributo até a atualização da janela.
+"""
+
+import json
+import os
+from bisect import bisect_left
+
+from history import COMPLETED
+
+# Limites superiores dos buckets: 1 µs a 100 s
+BUCKET_BOUNDS = tuple(10 ** (k / 4) for k in range(-24, 9))
+
+
+class Histogram:
+    """Histograma com buckets fixos."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """Limite superior do bucket que contém o percentil "p" (0-100)."""
+        if not self.count:
+            return None
+        target = p / 100 * self.count
+        accumulated = 0
+        for index, bucket_count in enumerate(self.counts):
+            accumulated += bucket_count
+            if accumulated >= target and bucket_count:
+                if index == len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean': self.total / self.count,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': [[self.bounds[index]
+                             if index < len(self.bounds) else None, count]
+                            for index, count in enumerate(self.counts)
+                            if count]}
+
+
+class RunMetrics:
+    """Histogramas, contadores e tempos de rampa/patamar de uma execução.
+
+    :param enabled: Estado inicial das medições.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.phases = {}
+        self.cycles = []
+        self.info = {}
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+        self.phases = {}
+        self.cycles = []
+        self.info = {}
+
+    def record(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def count(self, name: str, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_phase(self, step_index: int, is_holding: bool, seconds: float):
+        """Soma o tempo gasto em rampa ou patamar (dentro da tolerância)
+        no passo dado, em todos os ciclos.
+        """
+        if not self.enabled:
+            return
+        times = self.phases.get(step_index)
+        if times is None:
+            times = self.phases[step_index] = [0.0, 0.0]
+        times[is_holding] += seconds
+
+    def add_cycle(self, seconds: float):
+        if self.enabled:
+            self.cycles.append(seconds)
+
+    def summary(self, experiment=None, baseline: dict = None) -> dict:
+        """Resumo serializável em JSON.
+
+        :param experiment: Se fornecido, os nomes dos passos são
+        incluídos nos tempos de rampa e patamar.
+        :param baseline: Resumo de uma execução anterior do mesmo
+        experimento, usado para calcular a redução do tempo de ciclo.
+        """
+        steps = []
+        for index in sorted(self.phases):
+            ramp, hold = self.phases[index]
+            step = {'step': index, 'ramp_s': ramp, 'hold_s': hold}
+            if experiment is not None and index < len(experiment.steps):
+                step['name'] = experiment.steps[index].name
+            steps.append(step)
+        summary = {'experiment': getattr(experiment, 'name', None),
+                   'info': self.info,
+                   'histograms': {name: histogram.summary() for
+                                  name, histogram in
+                                  sorted(self.histograms.items())},
+                   'counters': dict(sorted(self.counters.items())),
+                   'steps': steps,
+                   'cycles_s': self.cycles}
+        if baseline is not None:
+            summary['cycle_time_reduction'] = cycle_time_reduction(
+                self.cycles, baseline['cycles_s'])
+        return summary
+
+    def save(self, path: str, experiment=None, baseline: dict = None) \
+            -> dict:
+        """Grava o resumo (ver summary()) em JSON e o retorna."""
+        summary = self.summary(experiment, baseline)
+        with open(path, 'w') as file:
+            json.dump(summary, file, indent=2)
+        return summary
+
+
+def metrics_path(log_path: str) -> str:
+    """Caminho do resumo JSON de um registro de experimento."""
+    return log_path.rsplit('.', 1)[0] + '.metrics.json'
+
+
+def mean_cycle(cycles: list) -> float:
+    """Tempo médio de ciclo, sem o primeiro quando houver outros (o
+    primeiro inclui a rampa a partir da temperatura ambiente).
+    """
+    if len(cycles) > 1:
+        cycles = cycles[1:]
+    return sum(cycles) / len(cycles)
+
+
+def cycle_time_reduction(cycles: list, baseline_cycles: list) -> dict:
+    """Compara o tempo médio de ciclo com o de uma execução de referência.
+
+    :return: Dicionário com os tempos médios, a redução em segundos e em
+    porcentagem, ou None se alguma das execuções não tiver ciclos.
+    """
+    if not cycles or not baseline_cycles:
+        return None
+    cycle = mean_cycle(cycles)
+    baseline = mean_cycle(baseline_cycles)
+    return {'baseline_s': baseline,
+            'cycle_s': cycle,
+            'reduction_s': baseline - cycle,
+            'reduction_pct': 100 * (baseline - cycle) / baseline}
+
+
+def find_baseline(directory: str, experiment_name: str, **info) -> dict:
+    """Resumo mais recente de uma execução concluída de
+    "experiment_name" em "directory" cujos valores em "info" sejam iguais
+    aos dados (ex.: fast_ramp=False). Execuções canceladas, e resumos
+    sem a situação da execução, não servem de referência.
+
+    :return: O resumo, ou None se nenhum for encontrado.
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return None
+    paths = [os.path.join(directory, name) for name in names
+             if name.endswith('.metrics.json')]
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            with open(path) as file:
+                summary = json.load(file)
+        except (OSError, ValueError):
+            continue
+        summary_info = summary.get('info', {})
+        if summary.get('experiment') == experiment_name and \
+                summary_info.get('status') == COMPLETED and \
+                summary.get('cycles_s') and \
+                all(summary_info.get(key) == value
+                    for key, value in info.items()):
+            return summary
+    return None
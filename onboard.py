@@ -0,0 +1,156 @@
+"""Controle PID executado no próprio Cetus PCR.
+
+No modo "device" (CONTROL_MODE em settings.json) o aplicativo envia uma
+única vez os ganhos e o perfil do experimento (passos e número de
+ciclos) e o microcontrolador executa o laço de controle em intervalos
+fixos, sem depender do tempo de resposta do computador. O aplicativo
+apenas acompanha as leituras e o andamento (Progress) enviados pelo
+firmware.
+
+OnboardController é a implementação de referência do laço em
+"arduino/cetuspcr/serialtools.h" (updateControl()). O simulador a usa
+para emular o firmware, o que permite testar o modo sem o hardware.
+Qualquer mudança em um dos dois deve ser repetida no outro.
+"""
+
+from codec import encode_gains, encode_profile, encode_step
+
+IDLE, RUNNING, FINISHED, STOPPED = range(4)
+
+MAX_STEPS = 8  # Tamanho dos vetores do perfil no firmware
+CONTROL_PERIOD = 0.1  # s
+OUTPUT_LIMIT = 255
+
+
+def profile_frames(n_cycles, steps, gains, tolerance) -> list:
+    """Quadros que enviam o perfil ao dispositivo (sem iniciar).
+
+    :param n_cycles: Repetições dos passos.
+    :param steps: Passos (temperatura, duração), ver
+    execution.ExecutionPlan.device_profile().
+    :param gains: Tupla (kp, ki, kd).
+    :param tolerance: Faixa (°C) em torno do setpoint em que o tempo do
+    passo é contado.
+    """
+    if not 0 < len(steps) <= MAX_STEPS:
+        raise ValueError(f'O perfil no dispositivo aceita de 1 a '
+                         f'{MAX_STEPS} passos.')
+    frames = [encode_gains(*gains, tolerance),
+              encode_profile(n_cycles, len(steps))]
+    for index, (temperature, duration) in enumerate(steps):
+        frames.append(encode_step(index, float(temperature), duration))
+    return frames
+
+
+def clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+class OnboardController:
+    """Laço de controle do firmware.
+
+    Mesmo PID do simple_pid (com sample_time=0): integral acumulada com
+    limite na saída e derivada calculada sobre a temperatura medida. O
+    tempo de cada passo só é contado enquanto a temperatura estiver
+    dentro da tolerância, como em ArduinoPCR.execute_cycles.
+
+    :param period: Intervalo (s) entre duas iterações do laço.
+    """
+
+    def __init__(self, period=CONTROL_PERIOD):
+        self.period = period
+        self.kp = self.ki = self.kd = 0.0
+        self.tolerance = 0.0
+        self.n_cycles = 0
+        self.steps = []
+
+        self.state = IDLE
+        self.cycle = 0
+        self.step = 0
+        self.step_elapsed = 0.0
+        self.output = 0
+
+        self._integral = 0.0
+        self._last_input = None
+        self._last_update = 0.0
+
+    @property
+    def setpoint(self) -> float:
+        return self.steps[self.step][0]
+
+    def set_gains(self, kp, ki, kd, tolerance):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.tolerance = tolerance
+
+    def load(self, n_cycles: int, n_steps: int) -> bool:
+        """Inicia um novo perfil com "n_steps" passos ainda indefinidos."""
+        if self.state == RUNNING or not 0 < n_steps <= MAX_STEPS:
+            return False
+        self.n_cycles = n_cycles
+        self.steps = [None] * n_steps
+        self.state = IDLE
+        return True
+
+    def set_step(self, index: int, temperature: float,
+                 duration: int) -> bool:
+        if self.state == RUNNING or not 0 <= index < len(self.steps):
+            return False
+        self.steps[index] = (temperature, duration)
+        return True
+
+    def start(self, now: float) -> bool:
+        if self.state == RUNNING or not self.n_cycles or \
+                not self.steps or None in self.steps:
+            return False
+        self.state = RUNNING
+        self.cycle = 1
+        self.step = 0
+        self._start_step()
+        self._last_update = now
+        return True
+
+    def stop(self):
+        if self.state == RUNNING:
+            self.state = STOPPED
+        self.output = 0
+
+    def _start_step(self):
+        self.step_elapsed = 0.0
+        self._integral = 0.0
+        self._last_input = None
+
+    def update(self, now: float, temperature: float) -> int:
+        """Uma iteração do laço.
+
+        :return: Nova saída (-255 a 255, negativa para resfriar).
+        """
+        if self.state != RUNNING:
+            return self.output
+        dt = now - self._last_update
+        self._last_update = now
+
+        error = self.setpoint - temperature
+        self._integral = clamp(self._integral + self.ki * error * dt,
+                               OUTPUT_LIMIT)
+        derivative = 0.0
+        if self._last_input is not None and dt > 0:
+            derivative = (temperature - self._last_input) / dt
+        self._last_input = temperature
+        self.output = int(clamp(self.kp * error + self._integral -
+                                self.kd * derivative, OUTPUT_LIMIT))
+
+        if abs(error) < self.tolerance:
+            self.step_elapsed += dt
+        if self.step_elapsed > self.steps[self.step][1]:
+            self.step += 1
+            if self.step == len(self.steps):
+                self.step = 0
+                self.cycle += 1
+            if self.cycle > self.n_cycles:
+                self.cycle = self.n_cycles
+                self.step = len(self.steps) - 1
+                self.state = FINISHED
+                self.output = 0
+            else:
+                self._start_step()
+        return self.output
@@ -0,0 +1,258 @@
+"""Leitura e interpretação das mensagens enviadas pelo Cetus PCR.
+
+O firmware ("arduino/cetuspcr/serialtools.h") envia linhas de texto
+terminadas em "\\r\\n". O LineReader lê de uma só vez todos os bytes
+disponíveis na porta, separa as linhas completas e cada linha é
+convertida em uma mensagem tipada por parse_line(), que escolhe a
+função de conversão pela primeira palavra da linha (tabela HANDLERS).
+Assim o monitor serial não precisa testar cada linha contra todas as
+mensagens conhecidas.
+
+Para medir o desempenho (linhas por segundo) do leitor atual e da
+leitura antiga, linha a linha, basta executar 'python protocol.py'.
+"""
+
+import io
+from time import perf_counter
+from typing import NamedTuple
+
+
+class Ready(NamedTuple):
+    """"Cetus is ready.", enviada quando o dispositivo é iniciado."""
+
+
+class SampleTemperature(NamedTuple):
+    value: float
+
+
+class LidTemperature(NamedTuple):
+    value: float
+
+
+class Heating(NamedTuple):
+    pwm: int
+
+
+class Cooling(NamedTuple):
+    pwm: int
+
+
+class CoolingFinished(NamedTuple):
+    pass
+
+
+class Reading(NamedTuple):
+    """Leitura enviada periodicamente pelo firmware (ver <stream ms>)."""
+    timestamp: int  # ms desde o início do firmware
+    sample: float
+    lid: float
+
+
+class Progress(NamedTuple):
+    """Andamento do perfil executado no próprio dispositivo (onboard.py)."""
+    timestamp: int  # ms desde o início do firmware
+    state: int
+    cycle: int
+    step: int
+    step_elapsed: int  # s
+    output: int
+
+
+class Rejected(NamedTuple):
+    """O dispositivo recusou o último comando (NAK)."""
+
+
+class NextCommand(NamedTuple):
+    """"nextpls", o dispositivo está pronto para o próximo comando."""
+
+
+class Unknown(NamedTuple):
+    line: bytes
+
+
+READY = Ready()
+COOLING_FINISHED = CoolingFinished()
+NEXT_COMMAND = NextCommand()
+REJECTED = Rejected()
+
+
+def _parse_ready(fields, line):
+    return READY if fields == [b'Cetus', b'is', b'ready.'] else Unknown(line)
+
+
+def _parse_cooling(fields, line):
+    if fields[1:] == [b'finished']:
+        return COOLING_FINISHED
+    return Unknown(line)
+
+
+# Primeira palavra da linha -> função(palavras, linha) que cria a mensagem
+HANDLERS = {
+    b'tempSample': lambda fields, line: SampleTemperature(float(fields[1])),
+    b'tempLid': lambda fields, line: LidTemperature(float(fields[1])),
+    b'temp': lambda fields, line: Reading(int(fields[1]), float(fields[2]),
+                                          float(fields[3])),
+    b'nextpls': lambda fields, line: NEXT_COMMAND,
+    b'Heat:': lambda fields, line: Heating(int(fields[1])),
+    b'Cooling:': lambda fields, line: Cooling(int(fields[1])),
+    b'Cooling': _parse_cooling,
+    b'Cetus': _parse_ready,
+}
+
+
+def parse_line(line: bytes):
+    """Converte uma linha recebida (sem o "\\r\\n") em uma mensagem.
+
+    Linhas vazias, desconhecidas ou com argumentos inválidos resultam em
+    uma mensagem Unknown.
+    """
+    fields = line.split()
+    if not fields:
+        return Unknown(line)
+    handler = HANDLERS.get(fields[0])
+    if handler is None:
+        return Unknown(line)
+    try:
+        return handler(fields, line)
+    except (IndexError, ValueError):
+        return Unknown(line)
+
+
+class LineReader:
+    """Lê blocos da porta serial e separa as linhas completas.
+
+    Cada leitura aguarda (até o timeout da porta) o primeiro byte e
+    depois retira todos os bytes já disponíveis. Bytes de uma linha
+    incompleta permanecem no buffer até a próxima leitura.
+
+    :param serial_device: Porta com read() e in_waiting (serial.Serial ou
+    simulator.SimulatedSerial).
+    :param max_read: Número máximo de bytes lidos de uma vez.
+    :param max_line: Tamanho máximo de uma linha. Se o buffer crescer
+    além disso sem encontrar um "\\n" os bytes são descartados.
+    """
+
+    def __init__(self, serial_device, max_read=4096, max_line=256):
+        self.serial_device = serial_device
+        self.max_read = max_read
+        self.max_line = max_line
+        self._buffer = bytearray()
+
+    def read(self) -> bytes:
+        """Aguarda (até o timeout) e retorna os bytes disponíveis."""
+        size = min(max(self.serial_device.in_waiting, 1), self.max_read)
+        return self.serial_device.read(size)
+
+    def split_lines(self, data: bytes) -> list:
+        """Retorna as linhas completas recebidas, sem o "\\r\\n"."""
+        if not data:
+            return []
+        self._buffer += data
+        end = self._buffer.rfind(b'\n')
+        if end < 0:
+            if len(self._buffer) > self.max_line:
+                self._buffer.clear()
+            return []
+        lines = bytes(self._buffer[:end]).split(b'\n')
+        del self._buffer[:end + 1]
+        return [line.rstrip(b'\r') for line in lines]
+
+    def read_lines(self) -> list:
+        return self.split_lines(self.read())
+
+    def decode(self, data: bytes) -> list:
+        """Converte os bytes recebidos nas mensagens completas."""
+        return [parse_line(line) for line in self.split_lines(data)]
+
+    def read_messages(self) -> list:
+        return self.decode(self.read())
+
+
+class _ReplaySerial(io.RawIOBase):
+    """Porta falsa que entrega um bloco de bytes fixo (benchmark).
+
+    Assim como serial.Serial, herda o readline() de io.RawIOBase, que
+    chama read(1) para cada byte da linha.
+    """
+
+    def __init__(self, data: bytes, chunk_size: int):
+        super().__init__()
+        self.data = data
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk_size, len(self.data) - self.position)
+
+    def readable(self):
+        return True
+
+    def read(self, size=1):
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _legacy_monitor(serial_device, n_lines):
+    """Leitura usada anteriormente pelo monitor serial (referência)."""
+    sample = lid = 0
+    for _ in range(n_lines):
+        reading = serial_device.readline().decode()
+        reading = reading.strip('\r\n')
+        if 'tempSample' in reading:
+            sample = float(reading.split()[1])
+        if 'tempLid' in reading:
+            lid = float(reading.split()[1])
+        if 'Cooling finished' in reading:
+            pass
+        elif reading == 'nextpls':
+            pass
+    return sample, lid
+
+
+def _reader_monitor(serial_device, n_lines):
+    sample = lid = 0
+    reader = LineReader(serial_device)
+    received = 0
+    while received < n_lines:
+        messages = reader.read_messages()
+        received += len(messages)
+        for message in messages:
+            if type(message) is SampleTemperature:
+                sample = message.value
+            elif type(message) is LidTemperature:
+                lid = message.value
+    return sample, lid
+
+
+def benchmark(n_responses=50000, chunk_size=512):
+    """Mede as linhas por segundo processadas pelos dois leitores.
+
+    :param n_responses: Número de respostas ao comando de aquecimento
+    (4 linhas cada).
+    :param chunk_size: Bytes disponíveis na porta a cada leitura.
+    :return: Dicionário {leitor: linhas por segundo}.
+    """
+    response = b'Heat: 255\r\ntempSample 94.75\r\ntempLid 104.25\r\n' \
+               b'nextpls\r\n'
+    data = response * n_responses
+    n_lines = 4 * n_responses
+    results = {}
+    for name, monitor in (('readline', _legacy_monitor),
+                          ('LineReader', _reader_monitor)):
+        serial_device = _ReplaySerial(data, chunk_size)
+        started = perf_counter()
+        assert monitor(serial_device, n_lines) == (94.75, 104.25)
+        results[name] = n_lines / (perf_counter() - started)
+    return results
+
+
+if __name__ == '__main__':
+    for reader_name, rate in benchmark().items():
+        print(f'{reader_name:>10}: {rate:12,.0f} linhas/s')
@@ -0,0 +1,292 @@
+"""Armazenamento dos experimentos em um banco SQLite.
+
+Antes a lista inteira de experimentos era gravada com pickle em
+"experiments.pcr" a cada alteração: lento com muitos experimentos, o
+último a gravar sobrescrevia as alterações dos outros e uma falha no
+meio da gravação corrompia o arquivo. Agora cada experimento é uma
+linha da tabela "experiments" (com índices no nome e na data de
+modificação) e seus passos ficam na tabela "steps". Cada gravação é uma
+transação que altera apenas o experimento salvo.
+
+list() não carrega os passos: eles são lidos do banco no primeiro acesso
+a StoredExperiment.steps.
+
+Na primeira abertura os experimentos de "experiments.pcr", se existir,
+são copiados para o banco (migrate_pickle()). O arquivo antigo não é
+alterado.
+"""
+
+import sqlite3
+from threading import RLock
+from time import time
+
+from functions import ExperimentPCR, StepPCR, open_pickle_file
+
+SCHEMA_VERSION = 2
+
+# n_cycles, final_hold e os campos dos passos não têm tipo declarado: na
+# versão 1 eram gravados como digitados (texto) e são convertidos ao
+# criar os objetos.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    n_cycles,
+    final_hold,
+    created REAL NOT NULL,
+    modified REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_name
+    ON experiments (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS experiments_modified ON experiments (modified);
+CREATE TABLE IF NOT EXISTS steps (
+    experiment_id INTEGER NOT NULL
+        REFERENCES experiments (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name,
+    temperature,
+    duration,
+    stage TEXT NOT NULL DEFAULT 'cycle',
+    PRIMARY KEY (experiment_id, position)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+'''
+
+ORDERS = {'id': 'id', 'name': 'name COLLATE NOCASE',
+          'modified': 'modified DESC'}
+
+
+class StaleExperimentError(Exception):
+    """O experimento foi alterado no banco depois de ser carregado."""
+
+
+class StoredExperiment(ExperimentPCR):
+    """ExperimentPCR associado a uma linha do banco.
+
+    Os passos são carregados no primeiro acesso a "steps".
+    """
+
+    __slots__ = ('repository', 'id', 'modified', '_steps')
+
+    def __init__(self, repository, experiment_id, name, n_cycles=0,
+                 final_hold=0, modified=None, steps=None):
+        self.repository = repository
+        self.id = experiment_id
+        self.modified = modified
+        self._steps = None if steps is None else list(steps)
+        super().__init__(name, n_cycles, final_hold)
+
+    @property
+    def steps(self) -> list:
+        if self._steps is None:
+            self._steps = self.repository.load_steps(self.id)
+        return self._steps
+
+    @steps.setter
+    def steps(self, value):
+        # ExperimentPCR.__init__ define uma lista vazia, que não deve
+        # substituir os passos ainda não carregados.
+        if value or self._steps is not None or self.id is None:
+            self._steps = list(value)
+
+    def __reduce__(self):
+        # Cópias (ex.: pickle) são ExperimentPCR, sem a conexão.
+        return ExperimentPCR, (self.name, self.n_cycles, self.final_hold,
+                               *self.steps)
+
+
+class ExperimentRepository:
+    """Experimentos gravados em SQLite.
+
+    A conexão é compartilhada entre as threads (a janela e as execuções
+    dos dispositivos) e protegida por uma trava.
+
+    :param path: Arquivo do banco (":memory:" para um banco temporário).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = RLock()
+        self._connection = sqlite3.connect(path, timeout=10,
+                                           check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.executescript(SCHEMA)
+        with self._transaction() as cursor:
+            columns = [row[1] for row in
+                       cursor.execute('PRAGMA table_info(steps)')]
+            if 'stage' not in columns:  # Banco da versão 1
+                cursor.execute("ALTER TABLE steps ADD COLUMN stage TEXT "
+                               "NOT NULL DEFAULT 'cycle'")
+            cursor.execute("INSERT OR REPLACE INTO meta VALUES "
+                           "('schema_version', ?)", (SCHEMA_VERSION,))
+
+    def _transaction(self):
+        return _Transaction(self._connection, self._lock)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # ------------------------------------------------------------ Leitura
+    def list(self, order='id') -> list:
+        """Todos os experimentos, sem os passos.
+
+        :param order: "id" (ordem de criação), "name" ou "modified" (mais
+        recentes primeiro).
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, name, n_cycles, final_hold, modified '
+                f'FROM experiments ORDER BY {ORDERS[order]}').fetchall()
+        return [StoredExperiment(self, *row) for row in rows]
+
+    def get(self, experiment_id) -> StoredExperiment:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT id, name, n_cycles, final_hold, modified '
+                'FROM experiments WHERE id = ?', (experiment_id,)).fetchone()
+        if row is None:
+            raise KeyError(experiment_id)
+        return StoredExperiment(self, *row)
+
+    def find(self, name: str) -> list:
+        """Experimentos com o nome dado (sem diferenciar maiúsculas)."""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, name, n_cycles, final_hold, modified '
+                'FROM experiments WHERE name = ? COLLATE NOCASE ORDER BY id',
+                (name,)).fetchall()
+        return [StoredExperiment(self, *row) for row in rows]
+
+    def load_steps(self, experiment_id) -> list:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT name, temperature, duration, stage FROM steps '
+                'WHERE experiment_id = ? ORDER BY position',
+                (experiment_id,)).fetchall()
+        return [StepPCR(*row) for row in rows]
+
+    # ----------------------------------------------------------- Gravação
+    def add(self, experiment: ExperimentPCR) -> StoredExperiment:
+        """Grava um novo experimento.
+
+        :return: O StoredExperiment correspondente.
+        """
+        now = time()
+        with self._transaction() as cursor:
+            cursor.execute('INSERT INTO experiments (name, n_cycles, '
+                           'final_hold, created, modified) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           (experiment.name, experiment.n_cycles,
+                            experiment.final_hold, now, now))
+            experiment_id = cursor.lastrowid
+            self._insert_steps(cursor, experiment_id, experiment.steps)
+        return StoredExperiment(self, experiment_id, experiment.name,
+                                experiment.n_cycles, experiment.final_hold,
+                                now, experiment.steps)
+
+    def save(self, experiment: StoredExperiment, force=False):
+        """Grava as alterações de um experimento.
+
+        :param force: Grava mesmo que o experimento tenha sido alterado
+        por outra instância do aplicativo depois de carregado.
+        :raise StaleExperimentError: Se o experimento foi alterado ou
+        excluído por outra instância (e "force" é falso).
+        """
+        now = time()
+        steps = list(experiment.steps)
+        with self._transaction() as cursor:
+            condition = '' if force else ' AND modified = ?'
+            arguments = [experiment.name, experiment.n_cycles,
+                         experiment.final_hold, now, experiment.id]
+            if not force:
+                arguments.append(experiment.modified)
+            cursor.execute('UPDATE experiments SET name = ?, n_cycles = ?, '
+                           'final_hold = ?, modified = ? '
+                           f'WHERE id = ?{condition}', arguments)
+            if cursor.rowcount == 0:
+                raise StaleExperimentError(
+                    f'"{experiment.name}" foi alterado ou excluído por '
+                    f'outra instância do aplicativo.')
+            cursor.execute('DELETE FROM steps WHERE experiment_id = ?',
+                           (experiment.id,))
+            self._insert_steps(cursor, experiment.id, steps)
+        experiment.modified = now
+
+    def delete(self, experiment: StoredExperiment):
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM experiments WHERE id = ?',
+                           (experiment.id,))
+
+    @staticmethod
+    def _insert_steps(cursor, experiment_id, steps):
+        cursor.executemany('INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?)',
+                           [(experiment_id, position, step.name,
+                             step.temperature, step.duration, step.stage)
+                            for position, step in enumerate(steps)])
+
+    # ------------------------------------------------------------ Migração
+    def migrate_pickle(self, path: str) -> int:
+        """Copia os experimentos do antigo arquivo pickle, uma única vez.
+
+        :return: Número de experimentos copiados.
+        :raise PermissionError: Sem permissão de leitura do arquivo; a
+        cópia é tentada novamente na próxima chamada.
+        """
+        with self._lock:
+            done = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'pickle_migrated'"
+            ).fetchone()
+        if done is not None:
+            return 0
+        experiments = open_pickle_file(path)
+        with self._transaction() as cursor:
+            for experiment in experiments:
+                now = time()
+                cursor.execute('INSERT INTO experiments (name, n_cycles, '
+                               'final_hold, created, modified) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (experiment.name, experiment.n_cycles,
+                                experiment.final_hold, now, now))
+                self._insert_steps(cursor, cursor.lastrowid,
+                                   experiment.steps)
+            cursor.execute("INSERT INTO meta VALUES ('pickle_migrated', ?)",
+                           (path,))
+        return len(experiments)
+
+
+class _Transaction:
+    """Bloco "with" que executa os comandos em uma transação (BEGIN
+    IMMEDIATE), desfeita se ocorrer uma exceção.
+    """
+
+    def __init__(self, connection, lock):
+        self.connection = connection
+        self.lock = lock
+        self.cursor = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.cursor = self.connection.cursor()
+            self.cursor.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.cursor
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.connection.execute('COMMIT')
+            else:
+                self.connection.execute('ROLLBACK')
+        finally:
+            self.cursor.close()
+            self.lock.release()
@@ -0,0 +1,240 @@
+"""Formatos de arquivo dos registros de experimentos.
+
+O formato binário (extensão ".cetus") é organizado em colunas de
+largura fixa:
+
+    -Cabeçalho: b'CETUSLOG', versão (uint16), tamanho do JSON (uint32) e
+    um JSON com as informações da execução e a descrição das colunas.
+    O cabeçalho é completado com zeros até um múltiplo de 8 bytes.
+    -Blocos: número de linhas (uint32 + 4 bytes livres), seguido de cada
+    coluna armazenada de forma contígua (array), também alinhada em 8
+    bytes.
+
+Como cada bloco é escrito de uma só vez, um arquivo interrompido no meio
+da execução continua legível até o último bloco completo.
+
+O RunLog abre o arquivo com mmap e devolve as colunas como memoryview,
+sem copiar os dados. export_csv() mantém a compatibilidade com as
+ferramentas que leem o antigo formato CSV ("X,Y,Set Point").
+
+Uso pela linha de comando: 'python runlog.py arquivo.cetus' gera o
+arquivo CSV correspondente.
+"""
+
+from array import array
+from collections.abc import Sequence
+from itertools import islice
+import json
+import mmap
+import struct
+import sys
+
+MAGIC = b'CETUSLOG'
+VERSION = 1
+_PREFIX = struct.Struct('<8sHI')
+_CHUNK_HEADER = struct.Struct('<I4x')
+
+# Colunas gravadas por ArduinoPCR.run_experiment: (nome, typecode).
+RUN_COLUMNS = (('time', 'd'),
+               ('sample', 'f'),
+               ('setpoint', 'f'),
+               ('lid', 'f'),
+               ('output', 'h'),
+               ('cycle', 'H'),
+               ('step', 'H'))
+
+# Nomes usados no CSV para manter as colunas do formato antigo.
+CSV_HEADERS = {'time': 'X', 'sample': 'Y', 'setpoint': 'Set Point'}
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+class CsvLogWriter:
+    """Escreve os blocos de amostras como linhas de um arquivo CSV."""
+
+    extension = '.csv'
+
+    def __init__(self, path: str, columns=RUN_COLUMNS, metadata=None):
+        self.path = path
+        self.columns = columns
+        self.metadata = metadata or {}
+        self._outfile = None
+
+    def open(self):
+        self._outfile = open(self.path, 'w')
+        names = [CSV_HEADERS.get(name, name) for name, _ in self.columns]
+        self._outfile.write(','.join(names) + '\n')
+        self._outfile.flush()
+
+    def write_chunk(self, rows):
+        lines = ''.join(','.join(str(value) for value in row) + '\n'
+                        for row in rows)
+        self._outfile.write(lines)
+        self._outfile.flush()
+
+    def close(self):
+        self._outfile.close()
+
+
+class BinaryLogWriter(CsvLogWriter):
+    """Escreve os blocos de amostras no formato colunar binário."""
+
+    extension = '.cetus'
+
+    def open(self):
+        self._outfile = open(self.path, 'wb')
+        header = dict(self.metadata)
+        header['columns'] = [list(column) for column in self.columns]
+        header['byteorder'] = sys.byteorder
+        encoded = json.dumps(header).encode()
+        self._outfile.write(_PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        self._outfile.write(encoded)
+        self._outfile.write(bytes(_padding(_PREFIX.size + len(encoded))))
+        self._outfile.flush()
+
+    def write_chunk(self, rows):
+        data = bytearray(_CHUNK_HEADER.pack(len(rows)))
+        for index, (_, typecode) in enumerate(self.columns):
+            values = array(typecode, (row[index] for row in rows))
+            data += values.tobytes()
+            data += bytes(_padding(len(data)))
+        self._outfile.write(data)
+        self._outfile.flush()
+
+
+class ColumnView(Sequence):
+    """Coluna de um RunLog formada pelas memoryviews de cada bloco."""
+
+    def __init__(self, segments):
+        self.segments = segments
+        self._length = sum(len(segment) for segment in segments)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('ColumnView index out of range')
+        for segment in self.segments:
+            if index < len(segment):
+                return segment[index]
+            index -= len(segment)
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from segment
+
+    def tolist(self) -> list:
+        values = []
+        for segment in self.segments:
+            values.extend(segment.tolist())
+        return values
+
+
+class RunLog:
+    """Leitor de arquivos ".cetus".
+
+    :param path: Caminho do arquivo.
+
+    Deve ser fechado com close() (ou usado com "with") depois que as
+    colunas não forem mais necessárias.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        self._segments = {}
+        if len(self._view) < _PREFIX.size:
+            self.close()
+            raise ValueError(f'"{path}" não é um registro Cetus válido.')
+        magic, version, header_size = _PREFIX.unpack_from(self._view)
+        start = _PREFIX.size
+        self.metadata = {}
+        if magic == MAGIC and version <= VERSION and \
+                start + header_size <= len(self._view):
+            self.metadata = json.loads(bytes(self._view[start:
+                                                        start + header_size]))
+        if self.metadata.get('byteorder') != sys.byteorder:
+            self.close()
+            raise ValueError(f'"{path}" não é um registro Cetus válido.')
+        self.columns = [tuple(column) for column in
+                        self.metadata.pop('columns')]
+        self._segments = {name: [] for name, _ in self.columns}
+        self._scan(start + header_size +
+                   _padding(start + header_size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.column(self.columns[0][0]))
+
+    def _scan(self, offset):
+        size = len(self._view)
+        while offset + _CHUNK_HEADER.size <= size:
+            n_rows, = _CHUNK_HEADER.unpack_from(self._view, offset)
+            position = offset + _CHUNK_HEADER.size
+            segments = []
+            for name, typecode in self.columns:
+                length = n_rows * array(typecode).itemsize
+                if position + length > size:  # Último bloco incompleto
+                    for _, segment in segments:
+                        segment.release()
+                    return
+                segments.append((name, self._view[position:
+                                                   position + length]
+                                 .cast(typecode)))
+                position += length + _padding(length)
+            for name, segment in segments:
+                self._segments[name].append(segment)
+            offset = position
+
+    def column(self, name: str) -> ColumnView:
+        return ColumnView(self._segments[name])
+
+    def rows(self):
+        return zip(*(self.column(name) for name, _ in self.columns))
+
+    def close(self):
+        for segments in self._segments.values():
+            for segment in segments:
+                segment.release()
+        self._view.release()
+        self._mmap.close()
+
+
+def export_csv(path: str, csv_path: str = None) -> str:
+    """Converte um arquivo ".cetus" para CSV.
+
+    :return: O caminho do arquivo CSV gerado.
+    """
+    if csv_path is None:
+        csv_path = path.rsplit('.', 1)[0] + CsvLogWriter.extension
+    with RunLog(path) as log:
+        writer = CsvLogWriter(csv_path, log.columns)
+        writer.open()
+        rows = log.rows()
+        chunk = list(islice(rows, 4096))
+        while chunk:
+            writer.write_chunk(chunk)
+            chunk = list(islice(rows, 4096))
+        writer.close()
+    return csv_path
+
+
+if __name__ == '__main__':
+    for file in sys.argv[1:]:
+        print(export_csv(file))
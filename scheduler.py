@@ -0,0 +1,176 @@
+"""Fila de execução de experimentos.
+
+Os experimentos adicionados à RunQueue são enviados automaticamente para
+o primeiro Cetus PCR livre, sem que o usuário precise iniciar cada
+execução manualmente.
+
+Ordem de despacho: maior prioridade primeiro; entre experimentos de
+mesma prioridade, o de maior duração estimada sai primeiro (regra LPT),
+o que reduz o tempo total da fila quando há vários dispositivos. A
+rotina de resfriamento só é executada antes de um experimento quando o
+bloco está mais quente que o primeiro passo do protocolo.
+"""
+
+from itertools import count
+from threading import Condition, Thread
+
+import constants as std
+from devices import DeviceManager
+from execution import ExecutionPlan, PlanError
+from functions import ArduinoPCR, ExperimentPCR
+
+
+class QueuedRun:
+    """Um experimento aguardando execução.
+
+    :param port: Se fornecido, o experimento só é executado nesse
+    dispositivo.
+    """
+
+    _order = count()
+
+    def __init__(self, experiment: ExperimentPCR, priority=0, port=None):
+        self.experiment = experiment
+        self.priority = priority
+        self.port = port
+        self.order = next(self._order)
+        self.started_port = None
+        self.finished = None
+
+    def __repr__(self):
+        return f'QueuedRun({self.experiment.name!r}, ' \
+               f'priority={self.priority}, port={self.port!r})'
+
+    @property
+    def estimated_time(self):
+        return self.experiment.estimated_time
+
+    def sort_key(self):
+        return -self.priority, -self.estimated_time, self.order
+
+
+def needs_cooling(device: ArduinoPCR, experiment: ExperimentPCR) -> bool:
+    """Verifica se o bloco precisa ser resfriado antes do experimento."""
+    try:
+        first_temperature = ExecutionPlan.compile(experiment).set_points[0]
+    except PlanError:
+        return False
+    return device.current_sample_temperature > \
+        max(first_temperature, std.COOLING_TEMP_C) + std.TOLERANCE
+
+
+class RunQueue:
+    """Despacha experimentos para os dispositivos livres.
+
+    Uma thread em segundo plano aguarda novos experimentos ou o fim de
+    uma execução e então distribui os experimentos pendentes.
+
+    :param manager: Gerenciador com os dispositivos disponíveis.
+    """
+
+    def __init__(self, manager: DeviceManager):
+        self.manager = manager
+        self.pending = []
+        self.running = {}
+        self.completed = []
+        self.listeners = []
+
+        self._condition = Condition()
+        self._is_active = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, experiment: ExperimentPCR, priority=0,
+               port=None) -> QueuedRun:
+        run = QueuedRun(experiment, priority, port)
+        with self._condition:
+            self.pending.append(run)
+            self.pending.sort(key=QueuedRun.sort_key)
+            self._condition.notify()
+        self._publish()
+        return run
+
+    def remove(self, run: QueuedRun):
+        with self._condition:
+            if run in self.pending:
+                self.pending.remove(run)
+        self._publish()
+
+    def start(self):
+        self._is_active = True
+        self._thread = Thread(target=self._dispatcher, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._is_active = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dispatch(self) -> list:
+        """Envia os experimentos pendentes para os dispositivos livres.
+
+        :return: Lista com as execuções iniciadas.
+        """
+        started = []
+        with self._condition:
+            for port in self.manager.connected():
+                if self.manager.is_busy(port) or port in self.running:
+                    continue
+                for run in self.pending:
+                    if run.port in (None, port):
+                        break
+                else:
+                    continue
+                self.pending.remove(run)
+                device = self.manager.get(port)
+                run.started_port = port
+                self.running[port] = run
+                try:
+                    self.manager.run(port, run.experiment, notify=False,
+                                     cooling=needs_cooling(device,
+                                                           run.experiment),
+                                     on_finish=self._on_finish)
+                except RuntimeError:
+                    # Ocupado por uma execução iniciada pela interface: o
+                    # experimento volta para a fila.
+                    del self.running[port]
+                    run.started_port = None
+                    self.pending.append(run)
+                    self.pending.sort(key=QueuedRun.sort_key)
+                    continue
+                started.append(run)
+        if started:
+            self._publish()
+        return started
+
+    def _on_finish(self, port, finished):
+        with self._condition:
+            run = self.running.pop(port, None)
+            if run is not None:
+                run.finished = finished
+                self.completed.append(run)
+            self._condition.notify()
+        self._publish()
+
+    def _dispatcher(self):
+        while True:
+            try:
+                self.dispatch()
+            except Exception as error:
+                # A thread continua: a próxima tentativa acontece no fim
+                # de uma execução, em um novo experimento ou no timeout.
+                print(f'Falha ao despachar a fila: {error!r}')
+            with self._condition:
+                if not self._is_active:
+                    return
+                self._condition.wait(timeout=5)
+                if not self._is_active:
+                    return
+
+    def _publish(self):
+        for listener in self.listeners:
+            listener(self)
@@ -0,0 +1,301 @@
+"""Comunicação assíncrona (asyncio) com o Cetus PCR.
+
+Ao contrário do ArduinoPCR, que usa uma thread bloqueada em readline()
+para o monitor serial e outra para o experimento, aqui a leitura é feita
+em blocos diretamente do descritor de arquivo da porta, as linhas são
+separadas pelo CetusProtocol e o laço de controle é uma corrotina que
+aguarda a resposta de cada comando. Um único event loop pode controlar
+vários dispositivos sem nenhuma thread adicional.
+
+A leitura pelo descritor de arquivo (loop.add_reader) só está disponível
+em sistemas POSIX.
+"""
+
+import asyncio
+import os
+
+import serial  # Listado como pyserial em requirements.txt
+
+import constants as std
+from autotune import load_gains
+from clock import SystemClock
+from control import CONTROL_PERIOD, FixedRateTicker, StepTimer
+from execution import ExecutionPlan
+from functions import ExperimentPCR, Observable, create_pid, \
+    create_run_logger, device_identity, peltier_command
+from protocol import LidTemperature, NextCommand, Ready, Reading, \
+    SampleTemperature, parse_line
+
+
+class SerialTransport(asyncio.Transport):
+    """Transporte asyncio sobre o descritor de arquivo de uma porta
+    serial aberta pela pyserial.
+    """
+
+    def __init__(self, loop, serial_device: serial.Serial, protocol):
+        super().__init__()
+        self._loop = loop
+        self._serial = serial_device
+        self._fd = serial_device.fileno()
+        self._protocol = protocol
+        self._write_buffer = bytearray()
+        self._is_closing = False
+        os.set_blocking(self._fd, False)
+        loop.call_soon(protocol.connection_made, self)
+        loop.call_soon(loop.add_reader, self._fd, self._read_ready)
+
+    def _read_ready(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._close(exc)
+            return
+        if data:
+            self._protocol.data_received(data)
+
+    def write(self, data):
+        if self._is_closing:
+            return
+        if not self._write_buffer:
+            try:
+                written = os.write(self._fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError as exc:
+                self._close(exc)
+                return
+            data = data[written:]
+            if not data:
+                return
+            self._loop.add_writer(self._fd, self._write_ready)
+        self._write_buffer += data
+
+    def _write_ready(self):
+        try:
+            written = os.write(self._fd, self._write_buffer)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._close(exc)
+            return
+        del self._write_buffer[:written]
+        if not self._write_buffer:
+            self._loop.remove_writer(self._fd)
+
+    def is_closing(self):
+        return self._is_closing
+
+    def close(self):
+        self._close(None)
+
+    def _close(self, exc):
+        if self._is_closing:
+            return
+        self._is_closing = True
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self._serial.close()
+        self._loop.call_soon(self._protocol.connection_lost, exc)
+
+
+async def open_serial_connection(port, baudrate, protocol_factory):
+    """Abre a porta serial e conecta o protocolo ao SerialTransport.
+
+    :return: Tupla (transport, protocol), como loop.create_connection().
+    """
+    loop = asyncio.get_running_loop()
+    serial_device = await loop.run_in_executor(
+        None, lambda: serial.serial_for_url(port, baudrate, timeout=0))
+    protocol = protocol_factory()
+    transport = SerialTransport(loop, serial_device, protocol)
+    return transport, protocol
+
+
+class CetusProtocol(asyncio.Protocol):
+    """Separa os bytes recebidos em linhas e entrega as mensagens (ver
+    protocol.parse_line) para a sessão.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._buffer = bytearray()
+
+    def data_received(self, data):
+        self._buffer += data
+        end = self._buffer.rfind(b'\n')
+        if end < 0:
+            return
+        lines = bytes(self._buffer[:end]).split(b'\n')
+        del self._buffer[:end + 1]
+        for line in lines:
+            self.session.message_received(parse_line(line.rstrip(b'\r')))
+
+    def connection_lost(self, exc):
+        self.session.connection_lost(exc)
+
+
+class DeviceSession(Observable):
+    """Sessão assíncrona com um Cetus PCR.
+
+    Publica as mesmas alterações de estado que o ArduinoPCR (ver
+    functions.Observable), permitindo que a interface consuma qualquer
+    um dos dois.
+
+    :param port: Porta serial do dispositivo.
+    :param connection_factory: Corrotina com a assinatura de
+    open_serial_connection (permite usar o simulador).
+    :param clock: Relógio usado na contagem do tempo e nos registros.
+    """
+
+    published_fields = frozenset({'is_connected', 'is_running',
+                                  'current_sample_temperature',
+                                  'current_lid_temperature', 'current_step',
+                                  'current_step_temp', 'current_cycle',
+                                  'elapsed_time'})
+
+    def __init__(self, port, baudrate=9600,
+                 connection_factory=open_serial_connection, clock=None):
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.connection_factory = connection_factory
+        self.clock = clock or SystemClock()
+        self.device_id = device_identity(port)
+        self.pid = create_pid(load_gains(self.device_id), self.clock)
+        self.transport = None
+
+        self.is_connected = False
+        self.is_running = False
+        self.current_sample_temperature = 0
+        self.current_lid_temperature = 0
+        self.current_step = ''
+        self.current_step_temp = 0
+        self.current_cycle = 0
+        self.elapsed_time = 0
+        self.output = 0
+
+        self._ready = None
+        self._reply = None
+        self._reply_messages = []
+        self._lock = None
+
+    async def connect(self, timeout=3.0) -> bool:
+        """Abre a porta e aguarda a mensagem "Cetus is ready."."""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._lock = asyncio.Lock()
+        try:
+            self.transport, _ = await self.connection_factory(
+                self.port, self.baudrate, lambda: CetusProtocol(self))
+            await asyncio.wait_for(self._ready, timeout)
+        except (serial.SerialException, OSError, asyncio.TimeoutError):
+            await self.close()
+            return False
+        self.is_connected = True
+        return True
+
+    async def close(self):
+        self.is_running = False
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        self.is_connected = False
+
+    def message_received(self, message):
+        message_type = type(message)
+        if message_type is SampleTemperature:
+            self.current_sample_temperature = message.value
+        elif message_type is LidTemperature:
+            self.current_lid_temperature = message.value
+        elif message_type is Reading:
+            self.current_sample_temperature = message.sample
+            self.current_lid_temperature = message.lid
+            return
+        elif message_type is NextCommand:
+            if self._reply is not None and not self._reply.done():
+                self._reply.set_result(self._reply_messages)
+            return
+        elif message_type is Ready:
+            if self._ready is not None and not self._ready.done():
+                self._ready.set_result(True)
+        self._reply_messages.append(message)
+
+    def connection_lost(self, exc):
+        self.is_connected = False
+        self.is_running = False
+        self.transport = None
+        for future in (self._ready, self._reply):
+            if future is not None and not future.done():
+                future.set_exception(
+                    serial.SerialException('Dispositivo desconectado.'))
+
+    async def command(self, command: str, timeout=2.0) -> list:
+        """Envia um comando e aguarda o "nextpls" do firmware.
+
+        :param command: Comando completo, por exemplo "<peltier 0 255>".
+        :return: Mensagens recebidas antes do "nextpls".
+        """
+        async with self._lock:
+            if self.transport is None:
+                raise serial.SerialException('Dispositivo desconectado.')
+            self._reply = asyncio.get_running_loop().create_future()
+            self._reply_messages = []
+            self.transport.write(command.encode() + b'\r\n')
+            return await asyncio.wait_for(self._reply, timeout)
+
+    def cancel(self):
+        self.is_running = False
+
+    async def run_experiment(self, experiment: ExperimentPCR,
+                             period=CONTROL_PERIOD) -> bool:
+        """Executa o experimento no dispositivo.
+
+        O laço é o mesmo do ArduinoPCR: FixedRateTicker para o período e
+        StepTimer para a rampa e o patamar de cada passo.
+
+        :param period: Período (s) do laço de controle.
+        :return: False caso o experimento tenha sido cancelado.
+        :raise execution.PlanError: Se o experimento é inválido.
+        """
+        plan = ExecutionPlan.compile(experiment)
+        self.is_running = True
+        started_time = self.clock.time()
+        self.elapsed_time = 0
+        ticker = FixedRateTicker(self.clock, period)
+        with create_run_logger(experiment, self.port, self.clock,
+                               self.device_id, plan) as logger:
+            for set_point, duration, cycle, step_index in plan:
+                self.current_cycle = cycle
+                self.pid.reset()
+                self.current_step = plan.step_names[step_index]
+                self.current_step_temp = set_point
+                self.pid.setpoint = set_point
+                timer = StepTimer(set_point, duration,
+                                  std.TOLERANCE, std.HOLD_HYSTERESIS,
+                                  self.clock.time(),
+                                  self.current_sample_temperature)
+
+                while not timer.is_done:
+                    current_time = await ticker.wait_async()
+                    if not self.is_running:
+                        await self.command(peltier_command(0))
+                        return False
+
+                    output = self.pid(self.current_sample_temperature)
+                    self.output = int(output)
+                    await self.command(peltier_command(output))
+                    self.elapsed_time = int(self.clock.time() -
+                                            started_time)
+                    timer.update(current_time,
+                                 self.current_sample_temperature)
+
+                    logger.log(current_time - started_time,
+                               self.current_sample_temperature,
+                               set_point,
+                               self.current_lid_temperature,
+                               self.output,
+                               self.current_cycle,
+                               step_index)
+        self.is_running = False
+        return True
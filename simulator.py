@@ -0,0 +1,561 @@
+"""Termociclador Cetus PCR virtual.
+
+Simula o firmware em "arduino/cetuspcr/serialtools.h" respondendo ao
+mesmo protocolo de linhas ("Cetus is ready.", <peltier estado pwm>,
+tempSample/tempLid e "nextpls") e ao protocolo binário de codec.py. O
+sensor converte a temperatura continuamente em segundo plano e, com
+<stream ms>, as leituras são enviadas periodicamente (ver poll()). A
+temperatura do bloco é calculada por um modelo térmico de primeira
+ordem acionado pelo valor de PWM.
+
+Três transportes estão disponíveis:
+    -SimulatedSerial: objeto em memória com a mesma interface usada da
+    pyserial (estilo "loop://"), criado por CetusSimulator.serial_for_url;
+    -SimulatedTransport: transporte asyncio em memória para a
+    session.DeviceSession, criado por CetusSimulator.create_connection;
+    -PtySimulator: cria um pseudo-terminal (Linux/macOS) que pode ser
+    aberto por qualquer programa como se fosse uma porta serial real.
+
+Para rodar a interface contra o dispositivo virtual basta executar:
+'python simulator.py' e usar a porta exibida no terminal.
+"""
+
+import asyncio
+import os
+import select
+from threading import Condition, Thread
+from time import monotonic, sleep
+
+import serial  # Listado como pyserial em requirements.txt
+
+from clock import SystemClock, VirtualClock
+from codec import BAUD_RATES, CMD_GAINS, CMD_PELTIER, CMD_PROFILE, \
+    CMD_RUN, CMD_STEP, CMD_STREAM, FrameDecoder, RESPONSE_ACK, \
+    RESPONSE_NAK, decode_command, encode_frame, encode_progress, \
+    encode_reading, encode_status
+from onboard import IDLE, OnboardController, RUNNING
+
+# Mesmo tamanho do buffer "receivedChars" do firmware.
+CMD_SIZE = 20
+READY_MESSAGE = b'Cetus is ready.\r\n'
+
+
+class ThermalModel:
+    """Modelo térmico de primeira ordem do bloco e da tampa.
+
+    A amostra troca calor com o ambiente (constante de tempo "tau") e
+    recebe/perde calor proporcionalmente ao PWM aplicado na pastilha
+    peltier. A tampa segue a temperatura do bloco com um atraso próprio.
+    """
+
+    def __init__(self, ambient=25.0, tau=60.0, heat_rate=2.5,
+                 cool_rate=1.5, lid_tau=120.0, resolution=0.25):
+        self.ambient = ambient
+        self.tau = tau
+        self.heat_rate = heat_rate  # °C/s com PWM máximo
+        self.cool_rate = cool_rate  # °C/s com PWM máximo
+        self.lid_tau = lid_tau
+        self.resolution = resolution  # Sensor em 10 bits = 0.25 °C
+
+        self.sample_temperature = ambient
+        self.lid_temperature = ambient
+        self.direction = 0
+        self.pwm = 0
+
+    def set_output(self, direction, pwm):
+        self.direction = direction
+        self.pwm = max(0, min(255, pwm))
+
+    def advance(self, dt, max_step=0.05):
+        """Integra o modelo por "dt" segundos (Euler com passo fixo)."""
+        while dt > 0:
+            h = min(dt, max_step)
+            drive = self.pwm / 255
+            if self.direction == 0:
+                drive *= self.heat_rate
+            else:
+                drive *= -self.cool_rate
+            loss = (self.ambient - self.sample_temperature) / self.tau
+            self.sample_temperature += (loss + drive) * h
+            self.lid_temperature += \
+                (self.sample_temperature - self.lid_temperature) / \
+                self.lid_tau * h
+            dt -= h
+
+    def read(self, value):
+        """Valor quantizado como o retornado pelo DS18B20."""
+        return round(value / self.resolution) * self.resolution
+
+
+class CetusSimulator:
+    """Interpretador do protocolo serial do firmware Cetus.
+
+    Os bytes recebidos são passados para feed(), que devolve a resposta
+    exatamente como o Arduino a enviaria. As leituras periódicas e o
+    laço de controle no dispositivo (onboard.OnboardController) avançam
+    com poll().
+
+    :param model: Modelo térmico da planta.
+    :param clock: Relógio usado para integrar o modelo térmico. Com um
+    VirtualClock a simulação avança junto com o laço de controle.
+    :param conversion_time: Duração de cada conversão do sensor. As
+    respostas usam a última conversão concluída.
+    """
+
+    def __init__(self, model: ThermalModel = None, clock=None,
+                 conversion_time=0.19):
+        self.model = model or ThermalModel()
+        self.clock = clock or SystemClock()
+        self.conversion_time = conversion_time
+        self.is_to_print_temperature = False
+        self.commands_received = 0
+        self.is_binary = False
+        self.stream_interval = 0  # ms, 0 = desativado
+        self.sample_reading = self.model.read(self.model.sample_temperature)
+        self.lid_reading = self.model.read(self.model.lid_temperature)
+        self.controller = OnboardController()
+
+        self._last_update = self._boot_time = self.clock.time()
+        self._next_conversion = self._next_push = self._last_update
+        self._next_control = self._last_update
+        self._received = bytearray()
+        self._is_receiving = False
+        self._decoder = FrameDecoder()
+
+    def reset(self):
+        """Emula o reset do Arduino ao abrir a porta serial."""
+        self._received.clear()
+        self._is_receiving = False
+        self.is_binary = False
+        self.stream_interval = 0
+        self.controller = OnboardController()
+        self._decoder = FrameDecoder()
+        self.model.set_output(0, 0)
+        self.update()
+        self._boot_time = self._next_conversion = self._last_update
+        return READY_MESSAGE
+
+    def update(self):
+        self._run_until(self.clock.time())
+
+    def _advance_to(self, instant):
+        if instant > self._last_update:
+            self.model.advance(instant - self._last_update)
+            self._last_update = instant
+
+    def _convert(self, until):
+        """Conclui as conversões do sensor iniciadas até "until"."""
+        if self.conversion_time <= 0:
+            self._next_conversion = until
+        while self._next_conversion <= until:
+            self._advance_to(self._next_conversion)
+            self.sample_reading = \
+                self.model.read(self.model.sample_temperature)
+            self.lid_reading = self.model.read(self.model.lid_temperature)
+            if self.conversion_time <= 0:
+                break
+            self._next_conversion += self.conversion_time
+        self._advance_to(until)
+
+    def _next_event(self):
+        """Instante do próximo envio periódico ou iteração do controle."""
+        events = []
+        if self.stream_interval:
+            events.append(self._next_push)
+        if self.controller.state == RUNNING:
+            events.append(self._next_control)
+        return min(events, default=None)
+
+    def next_event_in(self, default=0.05):
+        """Tempo (s) até o próximo evento periódico."""
+        event = self._next_event()
+        if event is None:
+            return default
+        return max(0.0, event - self.clock.time())
+
+    def poll(self) -> bytes:
+        """Mensagens espontâneas enviadas até o instante atual."""
+        return self._run_until(self.clock.time())
+
+    def _run_until(self, until) -> bytes:
+        data = bytearray()
+        while True:
+            event = self._next_event()
+            if event is None or event > until:
+                break
+            self._convert(event)
+            if self.controller.state == RUNNING and \
+                    self._next_control <= event:
+                output = self.controller.update(event, self.sample_reading)
+                self.peltier(0 if output >= 0 else 1, abs(output))
+                self._next_control += self.controller.period
+                if self.controller.state != RUNNING:
+                    data += self._progress(event)
+            if self.stream_interval and self._next_push <= event:
+                data += self._reading(event)
+                self._next_push += self.stream_interval / 1000
+        self._convert(until)
+        return bytes(data)
+
+    def _timestamp(self, instant):
+        return int((instant - self._boot_time) * 1000)
+
+    def _reading(self, instant) -> bytes:
+        timestamp = self._timestamp(instant)
+        if not self.is_binary:
+            return f'temp {timestamp} {self.sample_reading:.2f} ' \
+                   f'{self.lid_reading:.2f}\r\n'.encode()
+        data = encode_reading(timestamp, self.sample_reading,
+                              self.lid_reading)
+        if self.controller.state != IDLE:
+            data += self._progress(instant)
+        return data
+
+    def _progress(self, instant) -> bytes:
+        controller = self.controller
+        return encode_progress(self._timestamp(instant), controller.state,
+                               controller.cycle, controller.step,
+                               int(controller.step_elapsed),
+                               controller.output)
+
+    def _set_stream(self, interval):
+        self.stream_interval = max(0, interval)
+        self._next_push = self.clock.time()
+
+    def feed(self, data: bytes) -> bytes:
+        """Processa os bytes recebidos e retorna a resposta do firmware
+        (precedida das mensagens espontâneas ainda não enviadas).
+        """
+        response = bytearray(self.poll())
+        if self.is_binary:
+            return bytes(response + self.feed_frames(data))
+        for index, char in enumerate(data):
+            if self._is_receiving:
+                if char != ord('>'):
+                    if len(self._received) < CMD_SIZE - 1:
+                        self._received.append(char)
+                else:
+                    self._is_receiving = False
+                    response += self.execute(self._received.decode())
+                    self._received.clear()
+                    if self.is_binary:
+                        response += self.feed_frames(data[index + 1:])
+                        break
+            elif char == ord('<'):
+                self._is_receiving = True
+        return bytes(response)
+
+    def feed_frames(self, data: bytes) -> bytes:
+        """Processa os bytes recebidos no modo binário."""
+        response = bytearray()
+        crc_errors = self._decoder.crc_errors
+        for command, payload in self._decoder.feed(data):
+            self.commands_received += 1
+            arguments = decode_command(command, payload)
+            if arguments is None:
+                response += encode_frame(RESPONSE_NAK)
+            elif command == CMD_PELTIER:
+                state, pwm = arguments
+                if self.controller.state == RUNNING:
+                    # O laço do dispositivo controla a pastilha
+                    state, pwm = 0 if self.controller.output >= 0 else 1, \
+                                 abs(self.controller.output)
+                self.peltier(state, pwm)
+                response += encode_status(state, pwm, self.sample_reading,
+                                          self.lid_reading)
+            elif self.execute_frame(command, arguments):
+                response += encode_frame(RESPONSE_ACK, bytes((command,)))
+            else:
+                response += encode_frame(RESPONSE_NAK)
+        for _ in range(self._decoder.crc_errors - crc_errors):
+            response += encode_frame(RESPONSE_NAK)
+        return bytes(response)
+
+    def execute_frame(self, command, arguments) -> bool:
+        """Executa um comando binário sem resposta própria.
+
+        :return: False se o comando foi recusado (NAK).
+        """
+        controller = self.controller
+        if command == CMD_STREAM:
+            self._set_stream(arguments[0])
+        elif command == CMD_GAINS:
+            controller.set_gains(*arguments)
+        elif command == CMD_PROFILE:
+            return controller.load(*arguments)
+        elif command == CMD_STEP:
+            index, temperature, duration = arguments
+            return controller.set_step(index, temperature / 100, duration)
+        elif command == CMD_RUN:
+            if not arguments[0]:
+                controller.stop()
+                self.peltier(0, 0)
+                return True
+            # Como no firmware, a primeira iteração ocorre um período
+            # após o início.
+            now = self.clock.time()
+            self._next_control = now + controller.period
+            return controller.start(now)
+        else:
+            return False
+        return True
+
+    def peltier(self, state, pwm):
+        """Aciona a pastilha peltier (0 aquece, 1 resfria)."""
+        if state in (0, 1):
+            self.model.set_output(state, pwm)
+
+    def execute(self, command: str) -> bytes:
+        self.update()
+        self.commands_received += 1
+        tokens = command.split()
+        title = tokens[0] if tokens else ''
+        arguments = [int(arg) if arg.lstrip('-').isdigit() else 0
+                     for arg in tokens[1:]] + [0, 0]
+
+        lines = []
+        if title == 'peltier':
+            # <peltier estado pwm>
+            state, pwm = arguments[0], arguments[1]
+            if state in (0, 1):
+                lines.append(f'Heat: {pwm}' if state == 0 else
+                             f'Cooling: {pwm}')
+                self.peltier(state, pwm)
+                lines.append(f'tempSample {self.sample_reading:.2f}')
+                lines.append(f'tempLid {self.lid_reading:.2f}')
+        elif title == 'stream':
+            # <stream intervalo_ms>
+            self._set_stream(arguments[0])
+        elif title == 'printTemps':
+            self.is_to_print_temperature = bool(arguments[0])
+        elif title == 'binary' and 0 <= arguments[0] < len(BAUD_RATES):
+            # A troca acontece depois do envio do "nextpls"
+            lines.append(f'binary {arguments[0]}')
+            self.is_binary = True
+        lines.append('nextpls')
+        return ''.join(f'{line}\r\n' for line in lines).encode()
+
+    def serial_for_url(self, url='', baudrate=9600, timeout=1, **kwargs):
+        """Substituto de serial.serial_for_url para ArduinoPCR."""
+        return SimulatedSerial(self, port=url, baudrate=baudrate,
+                               timeout=timeout)
+
+    async def create_connection(self, port, baudrate, protocol_factory):
+        """Substituto de session.open_serial_connection."""
+        protocol = protocol_factory()
+        loop = asyncio.get_running_loop()
+        return SimulatedTransport(loop, self, protocol), protocol
+
+
+class SimulatedTransport(asyncio.Transport):
+    """Transporte asyncio em memória ligado a um CetusSimulator.
+
+    As leituras periódicas do simulador são entregues no instante em que
+    o firmware as enviaria.
+    """
+
+    def __init__(self, loop, simulator: CetusSimulator, protocol,
+                 boot_time=0.0):
+        super().__init__()
+        self._loop = loop
+        self.simulator = simulator
+        self._protocol = protocol
+        self._is_closing = False
+        loop.call_soon(protocol.connection_made, self)
+        loop.call_later(boot_time, self._deliver, simulator.reset())
+        loop.call_later(boot_time, self._poll)
+
+    def _deliver(self, data):
+        if not self._is_closing:
+            self._protocol.data_received(data)
+
+    def _poll(self):
+        if self._is_closing:
+            return
+        data = self.simulator.poll()
+        if data:
+            self._deliver(data)
+        self._loop.call_later(self.simulator.next_event_in(), self._poll)
+
+    def write(self, data):
+        response = self.simulator.feed(data)
+        if response:
+            self._loop.call_soon(self._deliver, response)
+
+    def is_closing(self):
+        return self._is_closing
+
+    def close(self):
+        if not self._is_closing:
+            self._is_closing = True
+            self._loop.call_soon(self._protocol.connection_lost, None)
+
+
+class SimulatedSerial:
+    """Porta serial em memória ligada a um CetusSimulator.
+
+    Implementa apenas a parte da interface de serial.Serial usada pelo
+    aplicativo.
+
+    Quando o simulador usa um VirtualClock, cada sleep() do relógio só
+    retorna depois que o monitor serial consumiu todas as respostas e
+    leituras periódicas pendentes, tornando a execução determinística.
+    """
+
+    def __init__(self, simulator: CetusSimulator, port='', baudrate=9600,
+                 timeout=1):
+        self.simulator = simulator
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self._buffer = bytearray(simulator.reset())
+        self._condition = Condition()
+        self._readers = 0
+        self._is_monitored = False
+        if isinstance(simulator.clock, VirtualClock):
+            simulator.clock.add_sleep_hook(self.wait_drained)
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise serial.SerialException('Porta fechada.')
+        with self._condition:
+            self._buffer += self.simulator.feed(data)
+            self._condition.notify_all()
+        return len(data)
+
+    def _wait(self, predicate):
+        """Aguarda predicate() recebendo as leituras periódicas do
+        simulador. Deve ser chamada com o lock adquirido.
+        """
+        self._is_monitored = True
+        self._readers += 1
+        self._condition.notify_all()
+        deadline = monotonic() + \
+            (self.timeout if self.timeout is not None else float('inf'))
+        while True:
+            self._buffer += self.simulator.poll()
+            remaining = deadline - monotonic()
+            if predicate() or not self.is_open or remaining <= 0:
+                break
+            self._condition.wait(min(remaining,
+                                     self.simulator.next_event_in()))
+        self._readers -= 1
+
+    def read(self, size=1):
+        with self._condition:
+            self._wait(lambda: len(self._buffer) >= size)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def readline(self):
+        with self._condition:
+            self._wait(lambda: b'\n' in self._buffer)
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            return data
+
+    def wait_drained(self, timeout=1):
+        """Aguarda o leitor processar todas as linhas recebidas."""
+        with self._condition:
+            self._buffer += self.simulator.poll()
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: not self.is_open or
+                                     not self._is_monitored or
+                                     (not self._buffer and self._readers),
+                                     timeout)
+
+    def reset_input_buffer(self):
+        with self._condition:
+            self._buffer.clear()
+
+    def close(self):
+        if isinstance(self.simulator.clock, VirtualClock):
+            self.simulator.clock.remove_sleep_hook(self.wait_drained)
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+
+class PtySimulator:
+    """Expõe um CetusSimulator através de um pseudo-terminal.
+
+    A cada abertura da porta o simulador aguarda "boot_time" segundos e
+    envia "Cetus is ready.", assim como o Arduino após o reset.
+    """
+
+    def __init__(self, simulator: CetusSimulator = None, boot_time=0.5):
+        self.simulator = simulator or CetusSimulator()
+        self.boot_time = boot_time
+        self.port = None
+        self.is_running = False
+        self._master = None
+        self._thread = None
+
+    def start(self):
+        self._master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        os.close(slave)
+        self.is_running = True
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self.is_running = False
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._master)
+
+    def _is_open(self, poller):
+        # Sem nenhum processo com o lado escravo aberto o mestre
+        # sinaliza POLLHUP.
+        events = poller.poll(0)
+        return not events or not events[0][1] & select.POLLHUP
+
+    def _serve(self):
+        poller = select.poll()
+        poller.register(self._master, select.POLLIN)
+        connected = False
+        while self.is_running:
+            if not connected:
+                if self._is_open(poller):
+                    sleep(self.boot_time)
+                    os.write(self._master, self.simulator.reset())
+                    connected = True
+                else:
+                    sleep(0.01)
+                continue
+
+            ready, _, _ = select.select(
+                [self._master], [], [],
+                min(0.05, self.simulator.next_event_in()))
+            pushed = self.simulator.poll()
+            if pushed:
+                os.write(self._master, pushed)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:  # Porta fechada pelo cliente
+                connected = False
+                continue
+            response = self.simulator.feed(data)
+            if response:
+                os.write(self._master, response)
+
+
+if __name__ == '__main__':
+    pty = PtySimulator()
+    print(f'Cetus PCR virtual disponível em "{pty.start()}".')
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        pty.stop()
@@ -0,0 +1,263 @@
+"""Identificação do comportamento térmico a partir dos registros.
+
+Para cada registro (".cetus" ou ".csv" com a coluna "output") é ajustado
+um modelo de primeira ordem com tempo morto (FOPDT), separadamente para
+o aquecimento e para o resfriamento, já que a pastilha Peltier tem
+capacidades bem diferentes nos dois sentidos:
+
+    tau · dT/dt = -(T - T0) + K · u(t - theta)
+
+onde T é a temperatura da amostra, u a saída do PID (-255 a 255), tau a
+constante de tempo, K o ganho (°C por unidade de PWM em regime), theta o
+tempo morto e T0 a temperatura de equilíbrio com a saída desligada.
+
+O ajuste é linear em (-1/tau, T0/tau, K/tau) para um theta fixo, então
+cada tempo morto candidato é resolvido por mínimos quadrados (equações
+normais 3x3, NumPy) e o de menor resíduo é escolhido. Também são calculadas as taxas máximas de rampa observadas
+com a saída próxima da saturação.
+
+Os registros de um diretório inteiro são processados em paralelo
+(ProcessPoolExecutor) e os parâmetros são agrupados por dispositivo
+(mediana das execuções).
+
+Uso pela linha de comando:
+    python sysid.py ["experiment logs" | arquivos...] [--workers N] [--json]
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+
+import numpy as np
+
+import constants as std
+from runlog import CSV_HEADERS, RunLog
+
+DIRECTIONS = {'heating': 1, 'cooling': -1}
+OUTPUT_LIMIT = 255
+LOG_EXTENSIONS = ('.cetus', '.csv')
+
+
+def load_run(path: str) -> tuple:
+    """Colunas de um registro como arrays NumPy.
+
+    :return: Tupla (colunas, metadados), colunas no formato
+    {nome: array}. Registros CSV não possuem metadados.
+    """
+    if path.endswith('.cetus'):
+        with RunLog(path) as log:
+            columns = {name: np.concatenate(
+                [np.asarray(segment, dtype=float)
+                 for segment in log.column(name).segments] or
+                [np.empty(0)]) for name, _ in log.columns}
+            return columns, dict(log.metadata)
+    names = {header: name for name, header in CSV_HEADERS.items()}
+    names['Tempo (s)'] = 'time'  # Registros do formato mais antigo
+    data = np.genfromtxt(path, delimiter=',', names=True,
+                         deletechars='', ndmin=1)
+    columns = {names.get(name, name): np.asarray(data[name], dtype=float)
+               for name in data.dtype.names}
+    return columns, {}
+
+
+def _uniform(time, temperature, output, period):
+    """Reamostra temperatura (interpolada) e saída (mantida até a
+    próxima amostra) em uma grade de período fixo.
+    """
+    keep = np.concatenate(([True], np.diff(time) > 0))
+    time, temperature, output = time[keep], temperature[keep], output[keep]
+    grid = np.arange(time[0], time[-1], period)
+    index = np.searchsorted(time, grid, side='right') - 1
+    return np.interp(grid, time, temperature), output[index]
+
+
+def fit_fopdt(time, temperature, output, period=None, max_dead_time=5.0,
+              smoothing=1.0, min_samples=50) -> dict:
+    """Ajusta o modelo FOPDT de aquecimento e de resfriamento.
+
+    :param time: Instantes (s) das amostras, em ordem crescente.
+    :param temperature: Temperatura da amostra (°C).
+    :param output: Saída do PID aplicada em cada instante.
+    :param period: Período (s) da reamostragem. Por padrão, a mediana
+    dos intervalos do registro.
+    :param max_dead_time: Maior tempo morto (s) testado.
+    :param smoothing: Janela (s) da média móvel aplicada à temperatura
+    antes da derivada (o sensor tem resolução de 0,25 °C).
+    :param min_samples: Amostras mínimas em cada sentido para o ajuste.
+    :return: {sentido: parâmetros}. Os parâmetros de um sentido sem
+    amostras suficientes são None.
+    """
+    time = np.asarray(time, dtype=float)
+    if period is None:
+        period = float(np.median(np.diff(time))) if len(time) > 1 else 0
+    if period <= 0 or len(time) < min_samples:
+        return {direction: None for direction in DIRECTIONS}
+    temperature, output = _uniform(time, np.asarray(temperature, float),
+                                   np.asarray(output, float), period)
+
+    window = max(1, int(round(smoothing / period)))
+    smooth = np.convolve(temperature, np.ones(window) / window, 'valid')
+    derivative = np.gradient(smooth, period)
+    # Alinha temperatura e saída com o centro de cada janela
+    offset = (window - 1) // 2
+    temperature = temperature[offset:offset + len(smooth)]
+    output = output[offset:offset + len(smooth)]
+
+    lags = np.arange(int(max_dead_time / period) + 1)
+    rows = np.arange(lags[-1], len(smooth))
+    if len(rows) < min_samples:
+        return {direction: None for direction in DIRECTIONS}
+    target = derivative[rows]
+    design = np.column_stack((smooth[rows], np.ones(len(rows)),
+                              np.empty(len(rows))))
+    # Um tempo morto por vez: só as equações normais (3x3) de cada um são
+    # guardadas, com memória proporcional ao número de amostras.
+    best = {direction: (np.inf, None, None) for direction in DIRECTIONS}
+    for lag in lags:
+        delayed = output[rows - lag]
+        design[:, 2] = delayed
+        for direction, sign in DIRECTIONS.items():
+            weights = (delayed * sign > 0).astype(float)
+            count = weights.sum()
+            if count < min_samples:
+                continue
+            weighted = design * weights[:, None]
+            coefficients = np.linalg.pinv(weighted.T @ design) @ \
+                (weighted.T @ target)
+            residual = np.dot((target - design @ coefficients) ** 2,
+                              weights) / count
+            if residual < best[direction][0]:
+                best[direction] = residual, lag, coefficients
+
+    results = {}
+    for direction, sign in DIRECTIONS.items():
+        residual, lag, coefficients = best[direction]
+        if coefficients is None or not np.isfinite(residual) or \
+                coefficients[0] >= 0:
+            results[direction] = None
+            continue
+        slope, intercept, input_gain = coefficients
+
+        selected = output[rows - lag] * sign > 0
+        variance = np.var(target[selected])
+        saturated = output * sign >= 0.9 * OUTPUT_LIMIT
+        if not saturated.any():
+            saturated = output * sign > 0
+        time_constant = -1 / slope
+        results[direction] = {
+            'time_constant_s': float(time_constant),
+            'gain_c_per_pwm': float(input_gain * time_constant),
+            'equilibrium_c': float(intercept * time_constant),
+            'dead_time_s': float(lag * period),
+            'max_ramp_rate_c_s': float(np.percentile(
+                derivative[saturated] * sign, 99)),
+            'r2': float(1 - residual / variance) if variance else 0.,
+            'samples': int(selected.sum())}
+    return results
+
+
+def identify_run(path: str) -> dict:
+    """Identifica o modelo de um registro.
+
+    :return: Dicionário com o caminho, o dispositivo, os parâmetros de
+    cada sentido (ver fit_fopdt) ou o erro que impediu o ajuste.
+    """
+    result = {'path': path, 'device': None}
+    # Qualquer falha (arquivo truncado, struct.error, IndexError, erro
+    # numérico no ajuste...) fica no resultado deste registro, para não
+    # interromper a análise dos demais em identify_archive().
+    try:
+        columns, metadata = load_run(path)
+        result['device'] = metadata.get('device') or metadata.get('port')
+        if 'output' not in columns:
+            result['error'] = 'Registro sem a coluna "output".'
+            return result
+        result.update(fit_fopdt(columns['time'], columns['sample'],
+                                columns['output']))
+    except Exception as exception:
+        result['error'] = f'{type(exception).__name__}: {exception}'
+    return result
+
+
+def log_paths(directory: str) -> list:
+    return sorted(os.path.join(directory, name)
+                  for name in os.listdir(directory)
+                  if name.endswith(LOG_EXTENSIONS))
+
+
+def summarize_devices(runs: list) -> dict:
+    """Mediana dos parâmetros das execuções de cada dispositivo.
+
+    :return: {dispositivo: {sentido: {parâmetro: valor}}}.
+    """
+    grouped = {}
+    for run in runs:
+        for direction in DIRECTIONS:
+            parameters = run.get(direction)
+            if parameters:
+                grouped.setdefault(run['device'], {}) \
+                    .setdefault(direction, []).append(parameters)
+    devices = {}
+    for device, directions in grouped.items():
+        devices[device] = {}
+        for direction, fits in directions.items():
+            summary = {name: float(np.median([fit[name] for fit in fits]))
+                       for name in fits[0] if name != 'samples'}
+            summary['runs'] = len(fits)
+            devices[device][direction] = summary
+    return devices
+
+
+def identify_archive(paths=None, workers=None) -> dict:
+    """Identifica todos os registros em paralelo.
+
+    :param paths: Arquivos de registro. Por padrão, todos os arquivos em
+    LOGS_PATH.
+    :param workers: Número de processos (padrão: número de CPUs).
+    :return: {'runs': [resultado de identify_run], 'devices':
+    summarize_devices(runs)}.
+    """
+    if paths is None:
+        paths = log_paths(std.LOGS_PATH)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        runs = list(executor.map(identify_run, paths, chunksize=4))
+    return {'runs': runs, 'devices': summarize_devices(runs)}
+
+
+def _print_summary(result: dict):
+    for run in result['runs']:
+        if 'error' in run:
+            print(f'{run["path"]}: {run["error"]}')
+    for device, directions in result['devices'].items():
+        print(f'\n{device or "(dispositivo desconhecido)"}')
+        for direction, parameters in directions.items():
+            print(f'  {direction:>8}: tau={parameters["time_constant_s"]:.1f}s'
+                  f' theta={parameters["dead_time_s"]:.1f}s'
+                  f' K={parameters["gain_c_per_pwm"]:.3f}°C/PWM'
+                  f' T0={parameters["equilibrium_c"]:.1f}°C'
+                  f' rampa máx.={parameters["max_ramp_rate_c_s"]:.2f}°C/s'
+                  f' ({parameters["runs"]} execuções)')
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    n_workers = None
+    if '--workers' in arguments:
+        position = arguments.index('--workers')
+        n_workers = int(arguments[position + 1])
+        del arguments[position:position + 2]
+    if '--json' in arguments:
+        arguments.remove('--json')
+        output_json = True
+    else:
+        output_json = False
+    files = []
+    for argument in arguments or [std.LOGS_PATH]:
+        files += log_paths(argument) if os.path.isdir(argument) \
+            else [argument]
+    archive = identify_archive(files, n_workers)
+    if output_json:
+        print(json.dumps(archive, indent=2))
+    else:
+        _print_summary(archive)
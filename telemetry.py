@@ -0,0 +1,146 @@
+"""Registro contínuo dos dados de um experimento.
+
+Cada execução possui o seu próprio TelemetryLogger. As amostras são
+agrupadas em blocos de tamanho fixo no laço de controle e entregues a
+uma thread de escrita, que grava os blocos no arquivo usando um dos
+escritores de runlog.py (CSV ou binário). Assim o uso de memória
+permanece constante durante toda a execução e o arquivo parcial continua
+válido caso o experimento seja cancelado ou o programa seja encerrado.
+
+Se a escrita falhar (ex.: disco cheio) a thread guarda o erro, o informa
+pela função "on_error" e passa a descartar os blocos. Daí em diante
+log() ignora as amostras: uma falha no registro não pode interromper o
+laço de controle. O erro é lançado novamente por flush() e close().
+"""
+
+from queue import Queue
+from threading import Thread
+
+from clock import SystemClock
+from runlog import BinaryLogWriter, CsvLogWriter, RUN_COLUMNS
+
+LOG_WRITERS = {'csv': CsvLogWriter, 'binary': BinaryLogWriter}
+
+
+class TelemetryLogger:
+    """Escreve as amostras de um experimento em um arquivo de registro.
+
+    :param writer: Escritor do formato desejado (CsvLogWriter ou
+    BinaryLogWriter).
+    :param clock: Relógio usado para decidir quando enviar um bloco
+    incompleto para a escrita.
+    :param chunk_size: Número de amostras em cada bloco.
+    :param flush_interval: Tempo máximo (s) que uma amostra aguarda antes
+    de ser gravada.
+    :param max_chunks: Blocos pendentes permitidos antes que o laço de
+    controle aguarde a escrita (limita o uso de memória).
+    :param on_error: Função chamada uma vez, na thread de escrita, com o
+    erro que interrompeu o registro.
+    """
+
+    def __init__(self, writer: CsvLogWriter, clock=None, chunk_size=256,
+                 flush_interval=5.0, max_chunks=64, on_error=None):
+        self.writer = writer
+        self.clock = clock or SystemClock()
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.rows_written = 0
+        self.error = None  # Erro da thread de escrita
+
+        self._chunk = []
+        self._last_flush = 0
+        self._queue = Queue(maxsize=max_chunks)
+        self._thread = None
+
+    @classmethod
+    def create(cls, base_path: str, log_format='binary', metadata=None,
+               columns=RUN_COLUMNS, **kwargs):
+        """Cria um logger no formato dado ("csv" ou "binary").
+
+        :param base_path: Caminho do arquivo sem a extensão.
+        """
+        writer_class = LOG_WRITERS[log_format]
+        writer = writer_class(base_path + writer_class.extension, columns,
+                              metadata)
+        return cls(writer, **kwargs)
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        self.writer.open()
+        self._last_flush = self.clock.time()
+        self._thread = Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def log(self, *row):
+        """Adiciona uma amostra (na mesma ordem das colunas do escritor).
+        Depois de uma falha na escrita as amostras são descartadas.
+        """
+        if self.error is not None:
+            return
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_size or \
+                self.clock.time() - self._last_flush >= self.flush_interval:
+            self._submit()
+
+    def flush(self):
+        """Entrega o bloco atual para a thread de escrita.
+
+        :raise Exception: O erro da thread de escrita, se houver (o bloco
+        atual é descartado).
+        """
+        if self.error is not None:
+            self._chunk = []
+            raise self.error
+        self._submit()
+
+    def _submit(self):
+        # A thread de escrita sempre esvazia a fila, mesmo depois de um
+        # erro, então put() nunca fica bloqueado.
+        if self._chunk:
+            self._queue.put(self._chunk)
+            self._chunk = []
+        self._last_flush = self.clock.time()
+
+    def close(self):
+        """Grava as amostras pendentes e fecha o arquivo.
+
+        :raise Exception: O erro da thread de escrita, se houver.
+        """
+        if self._thread is None:
+            return
+        if self._chunk and self.error is None:
+            self._queue.put(self._chunk)
+        self._chunk = []
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def _writer(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                continue  # Descarta os blocos até o close()
+            try:
+                self.writer.write_chunk(chunk)
+            except Exception as exception:
+                self.error = exception
+                if self.on_error is not None:
+                    self.on_error(exception)
+                continue
+            self.rows_written += len(chunk)
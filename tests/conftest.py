@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do Cetus PCR ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import constants as std  # noqa: E402
+import estimator  # noqa: E402
+import history  # noqa: E402
+
+
+@pytest.fixture
+def logs_dir(tmp_path, monkeypatch):
+    """Registros e índices das execuções em um diretório temporário."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / std.LOGS_PATH).mkdir()
+    monkeypatch.setattr(estimator, '_default', None)
+    monkeypatch.setattr(history, '_default', None)
+    monkeypatch.setattr(std, 'CONTROL_MODE', 'host')
+    monkeypatch.setattr(std, 'LOG_FORMAT', 'binary')
+    yield tmp_path
+    if history._default is not None:
+        history._default.close()
@@ -0,0 +1,54 @@
+from collections import deque
+from math import exp, log, pi
+
+import pytest
+
+from autotune import RelayAutotuner
+
+SET_POINT = 60.0
+DT = 0.01
+
+
+def relay_oscillation(tuner, gain, tau, dead_time):
+    """Executa o relé em uma planta de primeira ordem (tau = None:
+    integradora) com tempo morto, partindo do setpoint.
+    """
+    temperature = SET_POINT
+    delayed = deque([0] * round(dead_time / DT))
+    now = 0.0
+    while not tuner.is_done:
+        delayed.append(tuner.update(now, temperature))
+        output = delayed.popleft()
+        if tau is None:
+            temperature += gain * output * DT
+        else:
+            temperature += (gain * output - (temperature - SET_POINT)) / \
+                tau * DT
+        now += DT
+        assert now < 3600
+    return tuner.result()
+
+
+def test_integrating_plant_with_dead_time():
+    tuner = RelayAutotuner(SET_POINT, amplitude=255, hysteresis=0.5)
+    slope = 0.5  # °C/s com a saída máxima
+    ultimate_gain, period = relay_oscillation(tuner, slope / 255, None, 2.0)
+    # A temperatura continua subindo por 2 s depois de cada troca
+    amplitude = 0.5 + slope * 2.0
+    assert ultimate_gain == pytest.approx(4 * 255 / (pi * amplitude),
+                                          rel=0.02)
+    assert period == pytest.approx(4 * amplitude / slope, rel=0.02)
+
+
+def test_first_order_plant_with_dead_time():
+    gain, tau, dead_time, hysteresis = 0.2, 60.0, 2.0, 0.5
+    tuner = RelayAutotuner(SET_POINT, amplitude=255, hysteresis=hysteresis)
+    ultimate_gain, period = relay_oscillation(tuner, gain, tau, dead_time)
+    steady = gain * 255
+    decay = exp(-dead_time / tau)
+    amplitude = steady * (1 - decay) + hysteresis * decay
+    assert ultimate_gain == pytest.approx(4 * 255 / (pi * amplitude),
+                                          rel=0.02)
+    assert period == pytest.approx(
+        2 * (dead_time + tau * log((steady + amplitude) /
+                                   (steady - hysteresis))), rel=0.02)
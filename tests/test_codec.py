@@ -0,0 +1,112 @@
+import pytest
+
+from codec import BAUD_RATES, CMD_PELTIER, CMD_STEP, FrameDecoder, \
+    FrameReader, RESPONSE_STATUS, SYNC, decode_command, decode_messages, \
+    encode_frame, encode_peltier, encode_progress, encode_reading, \
+    encode_status, encode_step, negotiate
+from protocol import Cooling, Heating, LidTemperature, LineReader, \
+    NEXT_COMMAND, Progress, REJECTED, Reading, SampleTemperature
+from simulator import CetusSimulator
+
+
+def decode(data: bytes) -> list:
+    return FrameDecoder().feed(data)
+
+
+@pytest.mark.parametrize('output, arguments', [(200, (0, 200)),
+                                               (-80, (1, 80)),
+                                               (-1000, (1, 255))])
+def test_peltier_round_trip(output, arguments):
+    (command, payload), = decode(encode_peltier(output))
+    assert command == CMD_PELTIER
+    assert decode_command(command, payload) == arguments
+
+
+def test_step_round_trip():
+    (command, payload), = decode(encode_step(3, 72.5, 30))
+    assert decode_command(command, payload) == (3, 7250, 30)
+
+
+def test_response_round_trip():
+    frames = decode(encode_status(1, 120, 94.96, 105.5) +
+                    encode_status(0, 0) +
+                    encode_reading(1234, 60.25, 104.0) +
+                    encode_progress(5678, 1, 2, 3, 40, -75))
+    messages = [message for command, payload in frames
+                for message in decode_messages(command, payload)]
+    assert messages == [Cooling(120), SampleTemperature(94.96),
+                        LidTemperature(105.5), NEXT_COMMAND,
+                        Heating(0), NEXT_COMMAND,
+                        Reading(1234, 60.25, 104.0),
+                        Progress(5678, 1, 2, 3, 40, -75)]
+
+
+def test_payload_too_long():
+    with pytest.raises(ValueError):
+        encode_frame(CMD_STEP, bytes(17))
+
+
+def test_resync_after_garbage():
+    frame = encode_peltier(100)
+    decoder = FrameDecoder()
+    # SYNC solto, tamanho inválido e um quadro com o CRC corrompido
+    corrupted = frame[:-1] + bytes((frame[-1] ^ 0xFF,))
+    frames = decoder.feed(b'\x00\x13' + bytes((SYNC, 0xFF)) + corrupted +
+                          frame)
+    assert frames == [(CMD_PELTIER, frame[3:-2])]
+    assert decoder.crc_errors == 1
+
+
+def test_frames_split_across_reads():
+    data = encode_status(0, 10, 25.0, 30.0) + encode_reading(1, 25.0, 30.0)
+    decoder = FrameDecoder()
+    frames = []
+    for index in range(len(data)):
+        frames += decoder.feed(data[index:index + 1])
+    assert len(frames) == 2 and frames[0][0] == RESPONSE_STATUS
+    assert frames == decode(data)
+
+
+def binary_device(simulator):
+    serial_device = simulator.serial_for_url(timeout=0.05)
+    LineReader(serial_device).read_lines()  # "Cetus is ready."
+    assert negotiate(serial_device, 115200)
+    return serial_device
+
+
+def test_crc_mismatch_is_rejected():
+    serial_device = binary_device(CetusSimulator(conversion_time=0))
+    frame = bytearray(encode_peltier(255))
+    frame[-1] ^= 0xFF
+    serial_device.write(bytes(frame))
+    assert FrameReader(serial_device).read_messages() == [REJECTED,
+                                                          NEXT_COMMAND]
+    serial_device.close()
+
+
+def test_negotiation_switches_baudrate():
+    simulator = CetusSimulator(conversion_time=0)
+    serial_device = binary_device(simulator)
+    assert serial_device.baudrate == 115200
+    assert simulator.is_binary
+    serial_device.close()
+
+
+class TextOnlySimulator(CetusSimulator):
+    """Firmware sem suporte ao protocolo binário."""
+
+    def execute(self, command: str) -> bytes:
+        if command.startswith('binary'):
+            return b'nextpls\r\n'
+        return super().execute(command)
+
+
+def test_negotiation_falls_back_to_text():
+    simulator = TextOnlySimulator(conversion_time=0)
+    serial_device = simulator.serial_for_url(timeout=0.05)
+    assert not negotiate(serial_device, BAUD_RATES[-1])
+    assert serial_device.baudrate == 9600
+    serial_device.write(b'<peltier 0 10>\r\n')
+    lines = LineReader(serial_device).read_lines()
+    assert b'Heat: 10' in lines
+    serial_device.close()
@@ -0,0 +1,153 @@
+import asyncio
+import glob
+
+import pytest
+
+import constants as std
+import functions as fc
+import simulator as sim
+from clock import VirtualClock
+from control import ClockedPID, FixedRateTicker, switch_gains
+from runlog import RunLog
+
+
+def run_trace(gains):
+    clock = VirtualClock(1e9)
+    simulator = sim.CetusSimulator(clock=clock)
+    device = fc.ArduinoPCR(9600, port='sim',
+                           serial_factory=simulator.serial_for_url,
+                           clock=clock)
+    device.experiment = fc.ExperimentPCR('Trace', 1, 0,
+                                         fc.StepPCR('a', '60', '5'),
+                                         fc.StepPCR('b', '45', '5'))
+    device.is_running = True
+    device.pid = fc.create_pid(gains, clock)
+    try:
+        assert device.run_experiment(notify=False)
+    finally:
+        device.is_connected = False
+        device.serial_device.close()
+        device.monitor_thread.join()
+    path, = glob.glob(f'{std.LOGS_PATH}/Trace*.cetus')
+    with RunLog(path) as log:
+        trace = [list(log.column(name)) for name in ('time', 'sample', 'output')]
+    return clock.time(), trace
+
+
+def test_clocked_pid_uses_clock():
+    clock = VirtualClock(0)
+    pid = ClockedPID(clock, Kp=0, Ki=1, Kd=0, setpoint=10)
+    pid(0)  # Primeira chamada: intervalo desde o reset(), zero
+    clock.sleep(2)
+    assert pid(0) == pytest.approx(20)
+
+
+def test_virtual_clock_run_is_deterministic(logs_dir):
+    first = run_trace((20, 2, 30))
+    for path in glob.glob(f'{std.LOGS_PATH}/*'):
+        if not path.endswith('.db'):
+            (logs_dir / path).unlink()
+    assert run_trace((20, 2, 30)) == first
+
+
+def test_switch_gains_keeps_output():
+    clock = VirtualClock(0)
+    pid = ClockedPID(clock, Kp=10, Ki=1, Kd=0, setpoint=60)
+    switch_gains(pid, (20, 2, 0), 150, 55)
+    assert pid(55) == pytest.approx(150)
+
+
+def test_switch_gains_without_integral_term():
+    clock = VirtualClock(0)
+    pid = ClockedPID(clock, Kp=10, Ki=1, Kd=0, setpoint=60)
+    switch_gains(pid, (20, 0, 0), 150, 55)
+    assert pid(55) == pytest.approx(100)
+
+
+def test_async_ticker_keeps_grid():
+    clock = VirtualClock(0)
+    ticker = FixedRateTicker(clock, 0.1)
+
+    async def loop():
+        ticks = []
+        for _ in range(4):
+            ticks.append(await ticker.wait_async())
+            clock.sleep(0.03)  # Trabalho da iteração
+        return ticks
+
+    assert asyncio.run(loop()) == pytest.approx([0, 0.1, 0.2, 0.3])
+
+
+def test_fast_ramp_overshoot_is_bounded(logs_dir, monkeypatch):
+    monkeypatch.setattr(std, 'FAST_RAMP', {'ENABLED': True})
+    clock = VirtualClock(1e9)
+    simulator = sim.CetusSimulator(clock=clock)
+    device = fc.ArduinoPCR(9600, port='sim',
+                           serial_factory=simulator.serial_for_url,
+                           clock=clock)
+    device.pid = fc.create_pid((20, 2, 30), clock)
+    device.experiment = fc.ExperimentPCR('Rampa', 1, 0,
+                                         fc.StepPCR('d', '94', '10'),
+                                         fc.StepPCR('a', '55', '10'),
+                                         fc.StepPCR('e', '72', '10'))
+    device.is_running = True
+    try:
+        assert device.run_experiment(notify=False)
+    finally:
+        device.is_connected = False
+        device.serial_device.close()
+        device.monitor_thread.join()
+    path, = glob.glob(f'{std.LOGS_PATH}/Rampa*.cetus')
+    with RunLog(path) as log:
+        rows = list(zip(log.column('sample'), log.column('setpoint'),
+                        log.column('step')))
+    previous = rows[0][0]
+    for step in range(3):
+        temperatures = [sample for sample, _, index in rows
+                        if index == step]
+        set_point = next(value for _, value, index in rows if index == step)
+        direction = 1 if set_point >= previous else -1
+        overshoot = max(direction * (sample - set_point)
+                        for sample in temperatures)
+        # Limite do setpoint além do alvo (FastRampSettings.overshoot)
+        assert overshoot <= 2.0
+        previous = set_point
+
+
+def test_gain_schedule_override_follows_device_id(monkeypatch):
+    # O nome da porta muda entre conexões; o número de série, não
+    monkeypatch.setattr(fc, 'device_identity', lambda port: 'SN1')
+    monkeypatch.setattr(std, 'GAIN_SCHEDULE', {
+        'ENABLED': False, 'HEATING': [[60, 100, 0, 0]],
+        'DEVICES': {'SN1': {'ENABLED': True}}})
+    simulator = sim.CetusSimulator()
+    device = fc.ArduinoPCR(9600, port='sim',
+                           serial_factory=simulator.serial_for_url)
+    try:
+        assert device.device_id == 'SN1'
+        assert device.gain_schedule is not None
+    finally:
+        device.is_connected = False
+        device.serial_device.close()
+        device.monitor_thread.join()
+
+
+def test_fast_ramp_override_follows_device_id(logs_dir, monkeypatch):
+    monkeypatch.setattr(fc, 'device_identity', lambda port: 'SN1')
+    monkeypatch.setattr(std, 'FAST_RAMP', {
+        'ENABLED': False, 'DEVICES': {'SN1': {'ENABLED': True}}})
+    clock = VirtualClock(1e9)
+    simulator = sim.CetusSimulator(clock=clock)
+    device = fc.ArduinoPCR(9600, port='sim',
+                           serial_factory=simulator.serial_for_url,
+                           clock=clock)
+    device.experiment = fc.ExperimentPCR('Rampa', 1, 0,
+                                         fc.StepPCR('a', '45', '2'))
+    device.is_running = True
+    try:
+        assert device.run_experiment(notify=False)
+    finally:
+        device.is_connected = False
+        device.serial_device.close()
+        device.monitor_thread.join()
+    assert device.metrics.info['fast_ramp']
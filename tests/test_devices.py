@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import scheduler
+from devices import DeviceManager
+
+
+class FailingDevice:
+    cooling_experiment = None
+    is_connected = True
+    is_running = False
+
+    def run_experiment(self, notify=True):
+        raise OSError('porta desconectada')
+
+    def autotune(self, **kwargs):
+        raise OSError('porta desconectada')
+
+
+def test_failed_run_releases_port(monkeypatch):
+    errors = []
+    monkeypatch.setattr(threading, 'excepthook',
+                        lambda args: errors.append(args.exc_type))
+    manager = DeviceManager()
+    manager.devices['sim'] = FailingDevice()
+    results = []
+
+    manager.run('sim', None, on_finish=lambda *args: results.append(args))
+    manager.threads['sim'].join()
+    manager.autotune('sim', on_finish=lambda *args: results.append(args))
+    manager.threads['sim'].join()
+
+    assert results == [('sim', False), ('sim', None)]
+    assert errors == [OSError, OSError]
+    assert not manager.is_busy('sim')
+
+
+def test_busy_port_cannot_be_reserved_twice():
+    manager = DeviceManager()
+    manager.devices['sim'] = FailingDevice()
+    manager._reserve('sim')
+
+    with pytest.raises(RuntimeError):
+        manager.run('sim', None)
+    with pytest.raises(RuntimeError):
+        manager.cool('sim')
+    assert manager.is_busy('sim')
+
+
+def test_dispatch_requeues_run_when_port_is_taken(monkeypatch):
+    class Experiment:
+        name = 'exp'
+        estimated_time = 60
+
+    monkeypatch.setattr(scheduler, 'needs_cooling', lambda *args: False)
+    manager = DeviceManager()
+    manager.devices['sim'] = FailingDevice()
+    queue = scheduler.RunQueue(manager)
+    run = queue.submit(Experiment())
+    # A interface reserva a porta entre a verificação e o início na fila
+    monkeypatch.setattr(manager, 'is_busy', lambda port: False)
+    manager._reserve('sim')
+
+    assert queue.dispatch() == []
+    assert queue.pending == [run]
+    assert queue.running == {}
+    assert run.started_port is None
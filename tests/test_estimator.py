@@ -0,0 +1,20 @@
+import json
+import sys
+
+from estimator import RuntimeEstimator
+from runlog import MAGIC, VERSION, _PREFIX
+
+
+def test_refresh_skips_unreadable_files(tmp_path):
+    # Cabeçalho válido sem a lista de colunas (KeyError na leitura)
+    header = json.dumps({'byteorder': sys.byteorder}).encode()
+    (tmp_path / 'broken.cetus').write_bytes(
+        _PREFIX.pack(MAGIC, VERSION, len(header)) + header)
+    (tmp_path / 'truncated.cetus').write_bytes(b'CETUS')
+    (tmp_path / 'run.csv').write_text('X,Y,Set Point\n0,25,60\n1,30,60\n')
+    estimator = RuntimeEstimator(str(tmp_path),
+                                 str(tmp_path / 'index.json'))
+
+    assert estimator.refresh() == 3
+    assert estimator.runs['broken.cetus']['device'] is None
+    assert estimator.refresh() == 0
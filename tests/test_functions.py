@@ -0,0 +1,44 @@
+from serial.tools.list_ports_common import ListPortInfo
+
+import functions as fc
+import simulator as sim
+from clock import VirtualClock
+from functions import device_identity
+from history import COMPLETED
+from runlog import BinaryLogWriter
+
+
+def test_device_identity_prefers_serial_number():
+    port = ListPortInfo('/dev/ttyACM0')
+    port.serial_number = '5573531393735'
+    assert device_identity(port) == '5573531393735'
+
+
+def test_device_identity_of_unlisted_port():
+    assert device_identity('/dev/pts/99') == '/dev/pts/99'
+
+
+def test_log_failure_does_not_stop_the_run(logs_dir, monkeypatch):
+    def write_chunk(self, rows):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(BinaryLogWriter, 'write_chunk', write_chunk)
+    clock = VirtualClock(1e9)
+    simulator = sim.CetusSimulator(clock=clock)
+    device = fc.ArduinoPCR(9600, port='sim',
+                           serial_factory=simulator.serial_for_url,
+                           clock=clock)
+    events = []
+    device.listeners.append(lambda name, value: events.append((name, value)))
+    device.experiment = fc.ExperimentPCR('Disco cheio', 1, 0,
+                                         fc.StepPCR('a', '45', '5'))
+    device.is_running = True
+    try:
+        assert device.run_experiment(notify=False)
+    finally:
+        device.is_connected = False
+        device.serial_device.close()
+        device.monitor_thread.join()
+    notices = [value for name, value in events if name == fc.NOTICE]
+    assert [notice.level for notice in notices] == [fc.ERROR]
+    assert (fc.RUN_FINISHED, COMPLETED) in events
@@ -0,0 +1,48 @@
+import json
+import sys
+
+import pytest
+
+import history
+from history import UNKNOWN, RunHistory
+from runlog import MAGIC, VERSION, _PREFIX
+
+
+def test_refresh_skips_unreadable_files(tmp_path):
+    # Cabeçalho válido sem a lista de colunas (KeyError na leitura)
+    header = json.dumps({'byteorder': sys.byteorder}).encode()
+    (tmp_path / 'broken.cetus').write_bytes(
+        _PREFIX.pack(MAGIC, VERSION, len(header)) + header)
+    (tmp_path / 'truncated.cetus').write_bytes(b'CETUS')
+    (tmp_path / 'exp - 010124120000.csv').write_text(
+        'X,Y,Set Point\n0,25,60\n1,30,60\n')
+    runs = RunHistory(str(tmp_path / 'history.db'), str(tmp_path))
+    try:
+        assert runs.refresh() == 3
+        assert runs.refresh() == 0
+        statuses = {run.file: (run.samples, run.status)
+                    for run in runs.query()}
+    finally:
+        runs.close()
+
+    assert statuses == {'broken.cetus': (0, UNKNOWN),
+                        'truncated.cetus': (0, UNKNOWN),
+                        'exp - 010124120000.csv': (2, UNKNOWN)}
+
+
+def test_failed_first_refresh_is_not_cached(logs_dir, monkeypatch):
+    refresh = RunHistory.refresh
+    calls = []
+
+    def fail_once(self):
+        calls.append(self)
+        if len(calls) == 1:
+            raise OSError('disco indisponível')
+        return refresh(self)
+
+    monkeypatch.setattr(RunHistory, 'refresh', fail_once)
+    with pytest.raises(OSError):
+        history.default_history()
+    assert history._default is None
+
+    assert history.default_history() is calls[1]
@@ -0,0 +1,25 @@
+import json
+import os
+
+from history import CANCELLED, COMPLETED
+from metrics import find_baseline
+
+
+def write_summary(directory, name, status, cycles, age):
+    path = directory / f'{name}.metrics.json'
+    info = {'fast_ramp': False}
+    if status is not None:
+        info['status'] = status
+    path.write_text(json.dumps({'experiment': 'PCR', 'info': info,
+                                'cycles_s': cycles}))
+    os.utime(path, (1e9 - age, 1e9 - age))
+
+
+def test_baseline_ignores_cancelled_runs(tmp_path):
+    write_summary(tmp_path, 'completed', COMPLETED, [60.0, 61.0], age=30)
+    write_summary(tmp_path, 'cancelled', CANCELLED, [30.0], age=20)
+    write_summary(tmp_path, 'legacy', None, [20.0], age=10)
+
+    baseline = find_baseline(str(tmp_path), 'PCR', fast_ramp=False)
+
+    assert baseline['cycles_s'] == [60.0, 61.0]
@@ -0,0 +1,13 @@
+import pytest
+
+from runlog import MAGIC, VERSION, _PREFIX, RunLog
+
+
+@pytest.mark.parametrize('data', [b'CETUSLOG', bytes(_PREFIX.size - 1),
+                                  _PREFIX.pack(MAGIC, VERSION, 500) +
+                                  b'{"byteorder"'])
+def test_truncated_file_is_rejected(tmp_path, data):
+    path = tmp_path / 'truncated.cetus'
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        RunLog(str(path))
@@ -0,0 +1,47 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from runlog import MAGIC, VERSION, _PREFIX, BinaryLogWriter
+from sysid import fit_fopdt, identify_archive
+
+
+def test_bad_files_do_not_abort_archive(tmp_path):
+    # Cabeçalho sem "columns" (KeyError) e registro sem a coluna "time"
+    no_columns = tmp_path / 'no_columns.cetus'
+    header = json.dumps({'byteorder': sys.byteorder}).encode()
+    no_columns.write_bytes(_PREFIX.pack(MAGIC, VERSION, len(header)) +
+                           header)
+    no_time = str(tmp_path / 'no_time.cetus')
+    writer = BinaryLogWriter(no_time, [('sample', 'f'), ('output', 'h')], {})
+    writer.open()
+    writer.write_chunk([(25.0, 255), (26.0, 255)])
+    writer.close()
+    paths = [str(no_columns), no_time]
+
+    result = identify_archive(paths, workers=2)
+
+    assert [run['path'] for run in result['runs']] == paths
+    assert all(run['error'] for run in result['runs'])
+    assert result['devices'] == {}
+
+
+def test_fit_fopdt_recovers_dead_time():
+    period, dead_time, time_constant, gain = 0.25, 2.0, 20.0, 0.3
+    time = np.arange(4000) * period
+    output = np.where(time // 40 % 2 == 0, 255.0, -200.0)
+    delayed = np.concatenate((np.zeros(int(dead_time / period)), output))
+    temperature = np.full(len(time), 25.0)
+    for i in range(1, len(time)):
+        temperature[i] = temperature[i - 1] + period / time_constant * (
+            25 - temperature[i - 1] + gain * delayed[i - 1])
+
+    result = fit_fopdt(time, temperature, output)
+
+    for direction in ('heating', 'cooling'):
+        fit = result[direction]
+        assert fit['dead_time_s'] == pytest.approx(dead_time, abs=period)
+        assert fit['time_constant_s'] == pytest.approx(time_constant,
+                                                       rel=0.1)
@@ -0,0 +1,34 @@
+import pytest
+
+from runlog import CsvLogWriter
+from telemetry import TelemetryLogger
+
+
+class FullDiskWriter(CsvLogWriter):
+
+    def write_chunk(self, rows):
+        raise OSError(28, 'No space left on device')
+
+
+def test_write_error_stops_logging_without_blocking(tmp_path):
+    writer = FullDiskWriter(str(tmp_path / 'run.csv'), [('time', 'd')], {})
+    errors = []
+    logger = TelemetryLogger(writer, chunk_size=1, max_chunks=1,
+                             on_error=errors.append)
+    logger.open()
+    # Sem o tratamento do erro a fila enche e log() bloqueia
+    for time in range(1000):
+        logger.log(float(time))
+    with pytest.raises(OSError):
+        logger.close()
+    assert len(errors) == 1 and errors[0] is logger.error
+    assert logger.rows_written == 0
+
+
+def test_rows_are_written(tmp_path):
+    writer = CsvLogWriter(str(tmp_path / 'run.csv'), [('time', 'd')], {})
+    with TelemetryLogger(writer, chunk_size=4) as logger:
+        for time in range(10):
+            logger.log(float(time))
+    assert logger.rows_written == 10
+    assert logger.error is None